@@ -19,6 +19,8 @@ import copy
 import re
 from pathlib import Path
 
+import numpy as np
+
 
 class Node:
     def __init__(self, info=[]):
@@ -28,14 +30,13 @@ class Node:
         self.info = info
 
     def to_list(self):
+        # explicit stack rather than recursion so deep call chains cannot hit the recursion limit
         res = []
-
-        def to_list_int(node, lst):
-            lst.append(node)
-            for nd in node.children:
-                to_list_int(nd, lst)
-
-        to_list_int(self, res)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            res.append(node)
+            stack.extend(reversed(node.children))
         return res
 
     def append(self, tree):
@@ -44,61 +45,38 @@ class Node:
         self.children.append(tree)
 
     def find_all(self, cond):
-        def find_all_int(node, cond, res):
-            if cond(node.info):
-                res.append(node)
-            for nd in node.children:
-                find_all_int(nd, cond, res)
-
-        result = []
-        find_all_int(self, cond, result)
-        return result
+        return [node for node in self.to_list() if cond(node.info)]
 
     def find_in_depth(self, cond):
-        def find_in_depth_int(node, cond, res):
+        result = None
+        stack = [self]
+        while stack:
+            node = stack.pop()
             if cond(node.info):
-                res[0] = node
-                for nd in node.children:
-                    find_in_depth_int(nd, cond, res)
-
-        result = [None]
-        find_in_depth_int(self, cond, result)
-        return result[0]
+                result = node
+                stack.extend(reversed(node.children))
+        return result
 
     def find_first(self, cond):
-        def find_first_int(node, cond, res):
-            if res:
-                return
-            else:
-                if cond(node.info):
-                    res.append(node)
-                    return
-                for nd in node.children:
-                    find_first_int(nd, cond, res)
-
-        result = []
-        find_first_int(self, cond, result)
-        return result[0]
+        for node in self.to_list():
+            if cond(node.info):
+                return node
+        raise IndexError("no node satisfies the condition")
 
     def clone(self):
-        def clone_int(nd_new, nd_old):
+        root = Node(copy.deepcopy(self.info))
+        stack = [(root, self)]
+        while stack:
+            nd_new, nd_old = stack.pop()
             for ch in nd_old.children:
                 nd_new.append(Node(copy.deepcopy(ch.info)))
-            for i in range(len(nd_old.children)):
-                clone_int(nd_new.children[i], nd_old.children[i])
-
-        root = Node(copy.deepcopy(self.info))
-        clone_int(root, self)
+            stack.extend(zip(nd_new.children, nd_old.children))
         return root
 
     def apply(self, func):
-        def apply_int(nd, func):
-            nd.info = func(nd.info)
-            for ch in nd.children:
-                apply_int(ch, func)
-
         root = self.clone()
-        apply_int(root, func)
+        for nd in root.to_list():
+            nd.info = func(nd.info)
         return root
 
     def apply_pairwise(self, other, check, func):
@@ -112,16 +90,313 @@ class Node:
         return root
 
     def apply_from_head_childs(self, func):
-        def apply_from_head_childs_int(nd, func):
-            nd.info = func(nd.info, [ch.info for ch in nd.children])
-            for ch in nd.children:
-                apply_from_head_childs_int(ch, func)
-
         root = self.clone()
-        apply_from_head_childs_int(root, func)
+        # parents are visited before their children, so each one sees the original child info
+        for nd in root.to_list():
+            nd.info = func(nd.info, [ch.info for ch in nd.children])
         return root
 
 
+class NodeView:
+    """Read-only stand-in for a ``Node`` that points at one call of a ``Forest``.
+
+    Supports the read and traversal API of ``Node``. The ``clone``/``apply`` family
+    returns a regular ``Node`` tree built from the subtree of this call.
+    """
+
+    __slots__ = ("forest", "index")
+
+    def __init__(self, forest, index):
+        self.forest = forest
+        self.index = int(index)
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and other.forest is self.forest and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.forest), self.index))
+
+    @property
+    def info(self):
+        return self.forest.info(self.index)
+
+    @property
+    def level(self):
+        return int(self.forest.depth[self.index])
+
+    @property
+    def resources(self):
+        return {name: values[self.index].item() for name, values in self.forest.resources.items()}
+
+    @property
+    def parent(self):
+        parent = self.forest.parent[self.index]
+        return None if parent < 0 else NodeView(self.forest, parent)
+
+    @property
+    def children(self):
+        return [NodeView(self.forest, i) for i in self.forest.children(self.index)]
+
+    def to_list(self):
+        return [NodeView(self.forest, i) for i in range(*self.forest.subtree(self.index))]
+
+    def find_all(self, cond):
+        return [node for node in self.to_list() if cond(node.info)]
+
+    def find_in_depth(self, cond):
+        # subtrees are contiguous, so a failing call skips all of its descendants at once
+        result = None
+        i, end = self.forest.subtree(self.index)
+        while i < end:
+            if cond(self.forest.info(i)):
+                result = NodeView(self.forest, i)
+                i += 1
+            else:
+                i += int(self.forest.size[i])
+        return result
+
+    def find_first(self, cond):
+        for node in self.to_list():
+            if cond(node.info):
+                return node
+        raise IndexError("no node satisfies the condition")
+
+    def to_node(self):
+        first, end = self.forest.subtree(self.index)
+        nodes = [Node(self.forest.info(i)) for i in range(first, end)]
+        for i in range(first + 1, end):
+            nodes[self.forest.parent[i] - first].append(nodes[i - first])
+        return nodes[0]
+
+    def clone(self):
+        return self.to_node()
+
+    def apply(self, func):
+        return self.to_node().apply(func)
+
+    def apply_pairwise(self, other, check, func):
+        return self.to_node().apply_pairwise(other, check, func)
+
+    def apply_from_head_childs(self, func):
+        return self.to_node().apply_from_head_childs(func)
+
+
+class Forest:
+    """All algorithm calls of a run stored as flat NumPy arrays.
+
+    Calls are kept in depth-first order with the heads sorted by start time, so the
+    subtree of call ``i`` is the contiguous range ``[i, i + size[i])``. Columns are
+
+    - ``parent``: index of the calling algorithm, -1 for heads
+    - ``depth``: nesting level, 0 for heads
+    - ``start``/``finish``: times in nanoseconds
+    - ``name_id``: index into ``names``
+    - ``counter``: how many calls of the same name started up to and including this one
+    - ``thread_id``: thread that ran the call
+
+    ``resources`` holds further per-call columns, such as the statistics of ``attribution``.
+    """
+
+    COLUMNS = ("parent", "depth", "start", "finish", "name_id", "counter", "thread_id")
+
+    def __init__(self, names, parent, depth, start, finish, name_id, counter, thread_id):
+        self.names = list(names)
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.depth = np.asarray(depth, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.finish = np.asarray(finish, dtype=np.int64)
+        self.name_id = np.asarray(name_id, dtype=np.int32)
+        self.counter = np.asarray(counter, dtype=np.int32)
+        self.thread_id = np.asarray(thread_id, dtype=np.uint64)
+        self.resources = {}
+        self._size = None
+        self._child_offsets = None
+        self._child_index = None
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from the list of dicts returned by ``fromFile``"""
+        names, name_id = np.unique([rec["name"] for rec in records], return_inverse=True)
+        return cls.from_arrays(
+            names=[str(name) for name in names],
+            name_id=name_id,
+            start=[rec["start"] for rec in records],
+            finish=[rec["finish"] for rec in records],
+            thread_id=[int(rec["thread_id"] or 0) for rec in records],
+        )
+
+    @classmethod
+    def from_record_array(cls, records, names):
+        """Build from the structured array and name table returned by ``parseFile``"""
+        return cls.from_arrays(
+            names=names,
+            name_id=records["name_id"],
+            start=records["start"],
+            finish=records["finish"],
+            thread_id=records["thread_id"],
+        )
+
+    @classmethod
+    def from_arrays(cls, names, name_id, start, finish, thread_id):
+        """Nest the calls by interval containment, one stack of open calls per thread"""
+        name_id = np.asarray(name_id, dtype=np.int32).ravel()
+        start = np.asarray(start, dtype=np.int64).ravel()
+        finish = np.asarray(finish, dtype=np.int64).ravel()
+        thread_id = np.asarray(thread_id, dtype=np.uint64).ravel()
+        num = len(start)
+
+        # number the calls of each name in order of start time, longest first on ties
+        counter = _number_by_name(name_id, np.lexsort((-finish, start)))
+
+        # within a thread, sorting by start time (longest first) is a depth-first order
+        order = np.lexsort((-finish, start, thread_id))
+        ends = finish[order].tolist()
+        threads = thread_id[order].tolist()
+        parent = np.full(num, -1, dtype=np.int64)
+        depth = np.zeros(num, dtype=np.int32)
+        stack = []
+        for pos in range(num):
+            if pos and threads[pos] != threads[pos - 1]:
+                stack.clear()
+            # drop the calls that finished before this one
+            while stack and ends[pos] > ends[stack[-1]]:
+                stack.pop()
+            if stack:
+                parent[pos] = stack[-1]
+                depth[pos] = len(stack)
+            stack.append(pos)
+
+        # interleave the trees of all threads by the start time of their head
+        position = np.arange(num)
+        head_of = np.maximum.accumulate(np.where(parent < 0, position, 0)) if num else position
+        perm = np.lexsort((position, head_of, -finish[order][head_of], start[order][head_of]))
+        inverse = np.empty(num, dtype=np.int64)
+        inverse[perm] = position
+        parent = parent[perm]
+        parent[parent >= 0] = inverse[parent[parent >= 0]]
+        order = order[perm]
+
+        return cls(
+            names, parent, depth[perm], start[order], finish[order], name_id[order], counter[order], thread_id[order]
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def duration(self):
+        return self.finish - self.start
+
+    @property
+    def max_depth(self):
+        return int(self.depth.max()) if len(self) else 0
+
+    @property
+    def heads(self):
+        return np.flatnonzero(self.parent < 0)
+
+    @property
+    def size(self):
+        """Number of calls in the subtree of each call, itself included"""
+        if self._size is None:
+            # in depth-first order a subtree ends at the next call at the same or a shallower depth
+            size = np.empty(len(self), dtype=np.int64)
+            for level in range(self.max_depth + 1):
+                calls = np.flatnonzero(self.depth == level)
+                ends = np.flatnonzero(self.depth <= level)
+                following = np.searchsorted(ends, calls, side="right")
+                size[calls] = np.append(ends, len(self))[following] - calls
+            self._size = size
+        return self._size
+
+    def subtree(self, index):
+        """Range ``(first, end)`` covering the call and all of its descendants"""
+        return int(index), int(index + self.size[index])
+
+    def children(self, index):
+        if self._child_offsets is None:
+            # children grouped by parent, each group in depth-first order
+            self._child_index = np.argsort(self.parent, kind="stable")
+            self._child_offsets = np.searchsorted(self.parent[self._child_index], np.arange(len(self) + 1))
+        return self._child_index[self._child_offsets[index] : self._child_offsets[index + 1]]
+
+    def label(self, index):
+        return self.names[self.name_id[index]] + " " + str(self.counter[index])
+
+    def info(self, index):
+        """The ``[label, start, finish, counter]`` list a ``Node`` carries"""
+        return [self.label(index), int(self.start[index]), int(self.finish[index]), int(self.counter[index])]
+
+    def child_sum(self, values):
+        """Sum of ``values`` over the direct children of every call"""
+        values = np.asarray(values)
+        result = np.zeros(len(self), dtype=values.dtype)
+        has_parent = self.parent >= 0
+        np.add.at(result, self.parent[has_parent], values[has_parent])
+        return result
+
+    def clone(self):
+        forest = Forest(self.names, *[getattr(self, column).copy() for column in self.COLUMNS])
+        forest.resources = {name: values.copy() for name, values in self.resources.items()}
+        return forest
+
+    def apply(self, **funcs):
+        """Copy with columns replaced, e.g. ``forest.apply(start=lambda start: start - t0)``"""
+        columns = {column: getattr(self, column).copy() for column in self.COLUMNS}
+        for column, func in funcs.items():
+            columns[column] = func(columns[column])
+        forest = Forest(self.names, **columns)
+        forest.resources = {name: values.copy() for name, values in self.resources.items()}
+        return forest
+
+    def select(self, keep):
+        """Copy with the calls where ``keep`` is true, which must include the parents of every call kept.
+
+        The calls of each name are numbered again among those kept, as if only they had been logged.
+        """
+        index = np.flatnonzero(keep)
+        new_index = np.full(len(self), -1, dtype=np.int64)
+        new_index[index] = np.arange(len(index))
+        parent = self.parent[index]
+        parent[parent >= 0] = new_index[parent[parent >= 0]]
+        name_id = self.name_id[index]
+        forest = Forest(
+            self.names,
+            parent,
+            self.depth[index],
+            self.start[index],
+            self.finish[index],
+            name_id,
+            _number_by_name(name_id, np.argsort(self.counter[index], kind="stable")),
+            self.thread_id[index],
+        )
+        forest.resources = {name: values[index] for name, values in self.resources.items()}
+        return forest
+
+    def node(self, index):
+        return NodeView(self, index)
+
+    def nodes(self):
+        """Views of every call in depth-first order"""
+        return [NodeView(self, i) for i in range(len(self))]
+
+    def trees(self):
+        """Views of the heads, the same list ``toTrees`` returns"""
+        return [NodeView(self, i) for i in self.heads]
+
+
+def _number_by_name(name_id, order):
+    # 1, 2, ... for the calls of every name, in the given order of all calls
+    num = len(name_id)
+    by_name = order[np.argsort(name_id[order], kind="stable")]
+    names_sorted = name_id[by_name]
+    first = np.flatnonzero(np.r_[True, names_sorted[1:] != names_sorted[:-1]]) if num else np.array([], int)
+    group_start = np.repeat(first, np.diff(np.r_[first, num]))
+    counter = np.empty(num, dtype=np.int32)
+    counter[by_name] = np.arange(num) - group_start + 1
+    return counter
+
+
 def apply_multiple_trees(trees, check, func):
     root = trees[0].clone()
     lst = root.to_list()
@@ -133,86 +408,110 @@ def apply_multiple_trees(trees, check, func):
     return root
 
 
+# dtype of the records returned by ``parseFile``, names are stored as indices into a separate table
+RECORD_DTYPE = np.dtype([("thread_id", np.uint64), ("name_id", np.int32), ("start", np.int64), ("finish", np.int64)])
+
+_RECORD_PATTERN = re.compile(rb"ThreadID=([0-9]+).*?AlgorithmName=(\w*).*?StartTime=([0-9]+).*?EndTime=([0-9]+)")
+_HEADER_PATTERN = re.compile(rb"^START_POINT:.*$", re.MULTILINE)
+_CHUNK_SIZE = 16 * 1024**2
+
+
 def parseLine(line):
+    match = _RECORD_PATTERN.search(line.encode())
     res = {
-        "thread_id": re.search("ThreadID=([0-9]*)", line)[1],
-        "name": re.search("AlgorithmName=([a-zA-Z]*)", line)[1],
-        "start": int(re.search("StartTime=([0-9]*)", line)[1]),
-        "finish": int(re.search("EndTime=([0-9]*)", line)[1]),
+        "thread_id": match[1].decode(),
+        "name": match[2].decode(),
+        "start": int(match[3]),
+        "finish": int(match[4]),
     }
 
     return res
 
 
-def fromFile(fileName: Path, cleanup: bool = True):
-    res = []
-    header = ""
-    with open(fileName) as inp:
-        for line in inp:
-            if "START_POINT:" in line:
-                header = line.strip("\n")
-                continue
-            res.append(parseLine(line))
+def _fieldChunks(fileName: Path):
+    # the (thread id, name, start, finish) fields of the records of every chunk, with the header found so far
+    header = b""
+    rest = b""
+    with open(fileName, "rb") as inp:
+        while True:
+            chunk = inp.read(_CHUNK_SIZE)
+            if not chunk:
+                chunk, rest = rest, b""
+            else:
+                # only parse whole lines, keep the partial last one for the next chunk
+                chunk = rest + chunk
+                cut = chunk.rfind(b"\n") + 1
+                chunk, rest = chunk[:cut], chunk[cut:]
+            if not chunk and not rest:
+                break
+            if not header:
+                match = _HEADER_PATTERN.search(chunk)
+                if match:
+                    header = match[0].rstrip(b"\r")
+            matches = _RECORD_PATTERN.findall(chunk)
+            yield header, np.array(matches, dtype=bytes).reshape(-1, 4)
+
+
+def _toRecords(fields):
+    names, name_id = np.unique(fields[:, 1], return_inverse=True)
+    records = np.empty(len(fields), dtype=RECORD_DTYPE)
+    records["thread_id"] = fields[:, 0].astype(np.uint64)
+    records["name_id"] = name_id.ravel()
+    records["start"] = fields[:, 2].astype(np.int64)
+    records["finish"] = fields[:, 3].astype(np.int64)
+    return records, [name.decode() for name in names]
+
+
+def iterFile(fileName: Path):
+    """Parse the algorithm timing file one chunk at a time.
+
+    Yields the same ``(header, records, names)`` as ``parseFile`` for every chunk, the
+    names being those of the records of the chunk only, so that files of any size
+    can be processed in constant memory.
+    """
+    for header, fields in _fieldChunks(fileName):
+        yield (header.decode(), *_toRecords(fields))
+
+
+def parseFile(fileName: Path, cleanup: bool = True):
+    """Parse the algorithm timing file in bulk.
+
+    The file is read in large chunks and every chunk is matched with a single
+    compiled pattern, so no per-line Python objects outlive their chunk.
+
+    Returns
+    -------
+    header : str
+        The ``START_POINT:`` line, empty if there is none.
+    records : numpy.ndarray
+        Structured array of ``RECORD_DTYPE``, one entry per algorithm call.
+    names : list[str]
+        Algorithm names, indexed by ``records["name_id"]``.
+    """
+    header = b""
+    fields = []
+    for header, chunk in _fieldChunks(fileName):
+        fields.append(chunk)
+    records, names = _toRecords(np.concatenate(fields) if fields else np.empty((0, 4), dtype=bytes))
 
     if cleanup and fileName.exists():
         fileName.unlink()
 
-    return header, res
-
-
-def cmp_to_key(mycmp):
-    "Convert a cmp= function into a key= function"
-
-    class K:
-        def __init__(self, obj, *args):  # noqa: ARG002
-            self.obj = obj
+    return header.decode(), records, names
 
-        def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
 
-        def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-
-        def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-
-        def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0
-
-        def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-
-        def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-
-    return K
+def fromFile(fileName: Path, cleanup: bool = True):
+    header, records, names = parseFile(fileName, cleanup=cleanup)
+    res = [
+        {"thread_id": str(thread_id), "name": names[name_id], "start": int(start), "finish": int(finish)}
+        for thread_id, name_id, start, finish in records.tolist()
+    ]
+    return header, res
 
 
 def toTrees(records):
-    recs = sorted(
-        records,
-        key=cmp_to_key(lambda x, y: x["start"] - y["start"] if x["start"] != y["start"] else y["finish"] - x["finish"]),
-    )
-
-    def rec_to_node(r, counter):
-        return Node([r["name"] + " " + str(counter), r["start"], r["finish"], counter])
-
-    heads = []
-    counter = dict()
-    for rec in recs:
-        head = None
-        for hd in heads:
-            if rec["start"] >= hd.info[1] and rec["finish"] <= hd.info[2]:
-                head = hd
-                break
-        if rec["name"] in counter.keys():
-            counter[rec["name"]] += 1
-        else:
-            counter[rec["name"]] = 1
-        if head is None:
-            heads.append(rec_to_node(rec, counter[rec["name"]]))
-        else:
-            parent = head.find_in_depth(cond=lambda x: x[1] <= rec["start"] and rec["finish"] <= x[2])
-            parent.append(rec_to_node(rec, counter[rec["name"]]))
-        # counter += 1
-    return heads
+    """Build the forest of algorithm calls and return views of its heads in order of start time.
+
+    A call only becomes the child of a call that contains it on the same thread.
+    """
+    return Forest.from_records(records).trees()
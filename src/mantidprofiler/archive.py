@@ -0,0 +1,354 @@
+# archive.py - SQLite archive of many profiled runs
+#
+# Every run keeps its metadata (START_POINT header, number of threads, command
+# line, ...) in one row of ``runs``. The algorithm calls are stored per run and
+# algorithm name, as compressed columns of their start and finish times in
+# nanoseconds from the START_POINT, exactly as in the timing file, so that
+# the calls of one algorithm can be loaded across all runs without reading any
+# other. The CPU/memory and disk series are stored in chunks of consecutive
+# samples that carry the time range they cover, so that a time window only
+# reads the chunks it overlaps.
+#
+######################################################################
+
+import argparse
+import json
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.diskrecord import COLUMNS as DISK_COLUMNS
+from mantidprofiler.memoryrecord import COLUMNS as MEMORY_COLUMNS
+from mantidprofiler.psrecord import COLUMNS as CPU_COLUMNS
+
+# increased when the layout of the tables changes
+ARCHIVE_VERSION = 1
+# number of samples stored together in one row of the series table
+CHUNK_SAMPLES = 4096
+# columns of the series that can be archived
+SERIES_COLUMNS = {"cpu": CPU_COLUMNS, "disk": DISK_COLUMNS, "memory": MEMORY_COLUMNS}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT,
+    created REAL,
+    start_point INTEGER,
+    sync_time REAL,
+    nthreads INTEGER,
+    command TEXT,
+    duration REAL,
+    num_calls INTEGER,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (created);
+CREATE TABLE IF NOT EXISTS calls (
+    run_id INTEGER,
+    algorithm TEXT,
+    count INTEGER,
+    first_start REAL,
+    last_finish REAL,
+    start BLOB,
+    finish BLOB,
+    thread_id BLOB,
+    PRIMARY KEY (algorithm, run_id)
+);
+CREATE TABLE IF NOT EXISTS series (
+    run_id INTEGER,
+    kind TEXT,
+    chunk INTEGER,
+    first_time REAL,
+    last_time REAL,
+    num_samples INTEGER,
+    data BLOB,
+    PRIMARY KEY (run_id, kind, chunk)
+);
+CREATE INDEX IF NOT EXISTS series_by_time ON series (run_id, kind, first_time);
+"""
+
+
+def _pack(values, dtype) -> bytes:
+    return zlib.compress(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def _unpack(blob: bytes, dtype) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(blob), dtype=dtype)
+
+
+def _run_filter(runs: Optional[Sequence[int]]) -> tuple:
+    # SQL condition on run_id and its parameters
+    if runs is None:
+        return "", []
+    runs = [int(run) for run in runs]
+    return " AND run_id IN ({})".format(",".join("?" * len(runs))), runs
+
+
+class ProfileArchive:
+    """
+    Runs stored in one SQLite file, created if it does not exist.
+
+    Times of the calls and samples are returned in seconds on the time axis of the report
+    of their run, from the start of the process monitor.
+    """
+
+    def __init__(self, filename: Path):
+        self.filename = Path(filename)
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.executescript(_SCHEMA)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            self.connection.execute("PRAGMA user_version = {}".format(ARCHIVE_VERSION))
+        elif version != ARCHIVE_VERSION:
+            raise RuntimeError("{} is an archive of version {}, not {}".format(filename, version, ARCHIVE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add_run(
+        self,
+        forest,
+        header: int,
+        sync_time: float,
+        nthreads: int,
+        series: dict,
+        command: Optional[Sequence[str]] = None,
+        name: Optional[str] = None,
+        metadata: Optional[dict] = None,
+    ) -> int:
+        """
+        Store a run and return its ``run_id``.
+
+        Parameters
+        ----------
+        forest : algorithm_tree.Forest
+            The algorithm calls, with times in nanoseconds from the ``START_POINT`` ``header``.
+        sync_time : float
+            Start of the process monitor, in seconds since the epoch.
+        series : dict
+            Arrays returned by the ``parse_log`` functions, keyed by the kinds of ``SERIES_COLUMNS``,
+            with the times in their first column since the epoch.
+        """
+        start = (forest.start + (header or 0)) / 1.0e9 - sync_time
+        finish = (forest.finish + (header or 0)) / 1.0e9 - sync_time
+        ends = [values[-1, 0] - sync_time for values in series.values() if len(values)]
+        duration = max(ends + [finish.max() if len(forest) else 0.0])
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (name, created, start_point, sync_time, nthreads, command, duration, num_calls, "
+                "metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    time.time(),
+                    int(header or 0),
+                    float(sync_time),
+                    int(nthreads),
+                    json.dumps(list(command)) if command is not None else None,
+                    float(duration),
+                    len(forest),
+                    json.dumps(metadata or {}),
+                ),
+            )
+            run_id = cursor.lastrowid
+
+            # one row per algorithm name
+            order = np.argsort(forest.name_id, kind="stable")
+            bounds = np.searchsorted(forest.name_id[order], np.arange(len(forest.names) + 1))
+            rows = []
+            for name_id, algorithm in enumerate(forest.names):
+                calls = order[bounds[name_id] : bounds[name_id + 1]]
+                if len(calls) == 0:
+                    continue
+                rows.append(
+                    (
+                        run_id,
+                        algorithm,
+                        len(calls),
+                        float(start[calls].min()),
+                        float(finish[calls].max()),
+                        _pack(forest.start[calls], "<i8"),
+                        _pack(forest.finish[calls], "<i8"),
+                        _pack(forest.thread_id[calls], "<u8"),
+                    )
+                )
+            self.connection.executemany("INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+            rows = []
+            for kind, values in series.items():
+                values = np.array(values, dtype=np.float64)
+                values[:, 0] -= sync_time
+                for chunk, first in enumerate(range(0, len(values), CHUNK_SAMPLES)):
+                    block = values[first : first + CHUNK_SAMPLES]
+                    rows.append(
+                        (run_id, kind, chunk, float(block[0, 0]), float(block[-1, 0]), len(block), _pack(block, "<f8"))
+                    )
+            self.connection.executemany("INSERT INTO series VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return run_id
+
+    def runs(self, name: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None) -> list:
+        """Metadata of the runs called ``name``, if given, archived between ``since`` and ``until`` (epoch seconds)"""
+        query = "SELECT * FROM runs WHERE 1"
+        parameters: list = []
+        for condition, value in (("name = ?", name), ("created >= ?", since), ("created <= ?", until)):
+            if value is not None:
+                query += " AND " + condition
+                parameters.append(value)
+        cursor = self.connection.execute(query + " ORDER BY run_id", parameters)
+        columns = [description[0] for description in cursor.description]
+        result = []
+        for row in cursor:
+            run = dict(zip(columns, row))
+            run["command"] = json.loads(run["command"]) if run["command"] else None
+            run["metadata"] = json.loads(run["metadata"])
+            result.append(run)
+        return result
+
+    def algorithms(self) -> list:
+        """Names of all archived algorithms"""
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT algorithm FROM calls ORDER BY algorithm")]
+
+    def calls(
+        self,
+        algorithm: str,
+        runs: Optional[Sequence[int]] = None,
+        start: Optional[float] = None,
+        finish: Optional[float] = None,
+    ) -> dict:
+        """
+        Calls of one algorithm.
+
+        Returns
+        -------
+        dict
+            ``{run_id: (start, finish, thread_id)}`` of the calls of every run in ``runs``, or all
+            runs, that overlap the window from ``start`` to ``finish``.
+        """
+        condition, parameters = _run_filter(runs)
+        if start is not None:
+            condition += " AND last_finish >= ?"
+            parameters.append(start)
+        if finish is not None:
+            condition += " AND first_start <= ?"
+            parameters.append(finish)
+        result = {}
+        for run_id, offset, starts, finishes, thread_id in self.connection.execute(
+            "SELECT run_id, start_point / 1.0e9 - sync_time, start, finish, thread_id FROM calls JOIN runs "
+            "USING (run_id) WHERE algorithm = ?" + condition.replace("run_id", "calls.run_id") + " ORDER BY run_id",
+            [algorithm] + parameters,
+        ):
+            starts = _unpack(starts, "<i8") / 1.0e9 + offset
+            finishes = _unpack(finishes, "<i8") / 1.0e9 + offset
+            thread_id = _unpack(thread_id, "<u8")
+            keep = np.ones(len(starts), dtype=bool)
+            if start is not None:
+                keep &= finishes >= start
+            if finish is not None:
+                keep &= starts <= finish
+            result[run_id] = (starts[keep], finishes[keep], thread_id[keep])
+        return result
+
+    def samples(
+        self,
+        kind: str = "cpu",
+        runs: Optional[Sequence[int]] = None,
+        start: Optional[float] = None,
+        finish: Optional[float] = None,
+    ) -> dict:
+        """``{run_id: samples}`` of the series ``kind`` between ``start`` and ``finish``, one column per entry
+        of ``SERIES_COLUMNS[kind]``"""
+        condition, parameters = _run_filter(runs)
+        if start is not None:
+            condition += " AND last_time >= ?"
+            parameters.append(start)
+        if finish is not None:
+            condition += " AND first_time <= ?"
+            parameters.append(finish)
+        width = len(SERIES_COLUMNS[kind])
+        blocks: dict = {}
+        for run_id, num_samples, data in self.connection.execute(
+            "SELECT run_id, num_samples, data FROM series WHERE kind = ?" + condition + " ORDER BY run_id, chunk",
+            [kind] + parameters,
+        ):
+            block = _unpack(data, "<f8").reshape(num_samples, -1)
+            # runs archived before columns were added to a series have zeros in them
+            if block.shape[1] < width:
+                block = np.hstack((block, np.zeros((num_samples, width - block.shape[1]))))
+            blocks.setdefault(run_id, []).append(block)
+        result = {}
+        for run_id, chunks in blocks.items():
+            values = np.concatenate(chunks)
+            keep = np.ones(len(values), dtype=bool)
+            if start is not None:
+                keep &= values[:, 0] >= start
+            if finish is not None:
+                keep &= values[:, 0] <= finish
+            result[run_id] = values[keep]
+        return result
+
+    def forest(self, run_id: int):
+        """All calls of a run as a ``Forest``, with times in nanoseconds from the ``START_POINT`` of the run"""
+        names, name_id, start, finish, thread_id = [], [], [], [], []
+        for algorithm, starts, finishes, threads in self.connection.execute(
+            "SELECT algorithm, start, finish, thread_id FROM calls WHERE run_id = ? ORDER BY algorithm", (run_id,)
+        ):
+            starts = _unpack(starts, "<i8")
+            name_id.append(np.full(len(starts), len(names)))
+            names.append(algorithm)
+            start.append(starts)
+            finish.append(_unpack(finishes, "<i8"))
+            thread_id.append(_unpack(threads, "<u8"))
+        if not names:
+            return at.Forest.from_records([])
+        return at.Forest.from_arrays(
+            names, np.concatenate(name_id), np.concatenate(start), np.concatenate(finish), np.concatenate(thread_id)
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="List the runs of a profile archive, or the calls of an algorithm across them",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("archive", type=Path, help="the archive written with mantidprofiler --archive")
+    parser.add_argument("--algorithm", help="show the number of calls and time spent in this algorithm in every run")
+    parser.add_argument("--name", help="only the runs archived under this name")
+    args = parser.parse_args(argv)
+    if not args.archive.exists():
+        parser.error("{} does not exist".format(args.archive))
+
+    with ProfileArchive(args.archive) as archive:
+        runs = archive.runs(name=args.name)
+        if args.algorithm is None:
+            titles = ("Run", "Name", "Archived", "Duration", "Calls", "Threads")
+            print("{:>6s} {:20s} {:19s} {:>10s} {:>8s} {:>8s}".format(*titles))
+            for run in runs:
+                print(
+                    "{:6d} {:20s} {:19s} {:10.2f} {:8d} {:8d}".format(
+                        run["run_id"],
+                        run["name"] or "",
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run["created"])),
+                        run["duration"],
+                        run["num_calls"],
+                        run["nthreads"],
+                    )
+                )
+            return
+        calls = archive.calls(args.algorithm, runs=[run["run_id"] for run in runs])
+        print("{:>6s} {:>8s} {:>12s} {:>12s}".format("Run", "Calls", "Total (s)", "Longest (s)"))
+        for run_id, (start, finish, _) in calls.items():
+            duration = finish - start
+            print("{:6d} {:8d} {:12.3f} {:12.3f}".format(run_id, len(start), duration.sum(), duration.max()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# attribution.py - resources used by every algorithm call
+#
+# Joins the algorithm calls with the CPU/memory and disk series over the window
+# of each call. The windows are located with ``searchsorted`` and the averages and
+# totals come from differences of cumulative integrals, so every statistic is one
+# vectorized pass over all calls rather than a loop over them.
+#
+######################################################################
+
+import numpy as np
+
+# statistics computed for every call, in the order of the report table
+RESOURCE_COLUMNS = (
+    "mean_cpu",  # %
+    "max_cpu",  # %
+    "peak_rss",  # MB
+    "delta_rss",  # MB
+    "read_bytes",
+    "write_bytes",
+    "read_ops",  # read calls
+    "write_ops",  # write calls
+    "mean_threads",  # active threads
+)
+# statistics added when the memory log of ``memoryrecord`` is available
+MEMORY_COLUMNS = (
+    "peak_pss",  # MB
+    "peak_uss",  # MB
+)
+
+
+def _windows(x, start, finish):
+    # samples around every call: the last sample up to its start to the first sample from its finish
+    lo = np.maximum(np.searchsorted(x, start, side="right") - 1, 0)
+    hi = np.minimum(np.searchsorted(x, finish, side="left") + 1, len(x))
+    return lo, np.maximum(hi, lo + 1)
+
+
+def range_max(values, lo, hi) -> np.ndarray:
+    """Maximum of ``values[lo:hi]`` for every pair of ``lo < hi``"""
+    values = np.asarray(values)
+    # one extra element so that hi can be len(values)
+    padded = np.append(values, values[-1])
+    return np.maximum.reduceat(padded, np.column_stack((lo, hi)).ravel())[::2]
+
+
+def _integral(x, y) -> np.ndarray:
+    # integral of the piecewise linear y(x) from the first sample to every sample
+    return np.concatenate(([0.0], np.cumsum(0.5 * (y[1:] + y[:-1]) * np.diff(x))))
+
+
+def _integral_at(x, y, cumulative, t) -> np.ndarray:
+    # integral from the first sample up to the times t, exact within the segment each t falls in
+    t = np.clip(t, x[0], x[-1])
+    j = np.clip(np.searchsorted(x, t, side="right") - 1, 0, len(x) - 1)
+    return cumulative[j] + 0.5 * (t - x[j]) * (y[j] + np.interp(t, x, y))
+
+
+def _window_mean(x, y, start, finish) -> np.ndarray:
+    cumulative = _integral(x, y)
+    duration = finish - start
+    total = _integral_at(x, y, cumulative, finish) - _integral_at(x, y, cumulative, start)
+    # calls too short to resolve get the value at their start
+    safe = np.where(duration > 0.0, duration, 1.0)
+    return np.where(duration > 0.0, total / safe, np.interp(start, x, y))
+
+
+def resource_statistics(
+    start, finish, cpu_x, cpu_data, disk_x, disk_data, disk_in_bytes: bool = False, memory_x=None, memory_data=None
+) -> dict:
+    """
+    Resources used by every call between its ``start`` and ``finish``.
+
+    Parameters
+    ----------
+    start, finish : numpy.ndarray
+        Window of every call, in seconds on the time axis of the series.
+    cpu_x, cpu_data : numpy.ndarray
+        Times and rows returned by ``psrecord.parse_log``.
+    disk_x, disk_data : numpy.ndarray
+        Times and rows returned by ``diskrecord.parse_log``, the rates being in Gbps or, with
+        ``disk_in_bytes``, GBps, and in calls per second, since the previous sample.
+    memory_x, memory_data : numpy.ndarray, optional
+        Times and rows returned by ``memoryrecord.parse_log``.
+
+    Returns
+    -------
+    dict
+        One array per entry of ``RESOURCE_COLUMNS``, and of ``MEMORY_COLUMNS`` with a memory log.
+    """
+    start = np.asarray(start, dtype=float)
+    finish = np.asarray(finish, dtype=float)
+    columns = RESOURCE_COLUMNS + (MEMORY_COLUMNS if memory_data is not None else ())
+    if len(start) == 0 or len(cpu_x) == 0:
+        return {column: np.zeros(len(start)) for column in columns}
+
+    cpu = cpu_data[:, 1]
+    rss = cpu_data[:, 2]
+    lo, hi = _windows(cpu_x, start, finish)
+    stats = {
+        "mean_cpu": _window_mean(cpu_x, cpu, start, finish),
+        "max_cpu": range_max(cpu, lo, hi),
+        "peak_rss": range_max(rss, lo, hi),
+        "delta_rss": np.interp(finish, cpu_x, rss) - np.interp(start, cpu_x, rss),
+    }
+
+    # every rate holds since the previous sample, so the bytes add up exactly at the samples
+    to_bytes = 1.0e9 if disk_in_bytes else 1.0e9 / 8.0
+    for column, name, scale in (
+        (1, "read_bytes", to_bytes),
+        (2, "write_bytes", to_bytes),
+        (5, "read_ops", 1.0),
+        (6, "write_ops", 1.0),
+    ):
+        if len(disk_x) == 0:
+            stats[name] = np.zeros(len(start))
+            continue
+        cumulative = np.concatenate(([0.0], np.cumsum(disk_data[1:, column] * np.diff(disk_x)))) * scale
+        stats[name] = np.interp(finish, disk_x, cumulative) - np.interp(start, disk_x, cumulative)
+
+    stats["mean_threads"] = _window_mean(cpu_x, cpu_data[:, 4], start, finish)
+
+    if memory_data is not None:
+        if len(memory_x):
+            lo, hi = _windows(memory_x, start, finish)
+            stats["peak_pss"] = range_max(memory_data[:, 1], lo, hi)
+            stats["peak_uss"] = range_max(memory_data[:, 2], lo, hi)
+        else:
+            stats["peak_pss"] = stats["peak_uss"] = np.zeros(len(start))
+    return {column: stats[column] for column in columns}
@@ -0,0 +1,300 @@
+# bench.py - run a workflow repeatedly and aggregate the algorithm timings
+#
+# Every run is launched as a new process and monitored like a single profile.
+# The calls of each run are grouped by their call path, the names of the
+# algorithms from the head down to the call, so that the runs can be compared
+# even if some calls were added or removed. The summary gives the median,
+# quartiles and a confidence interval of the median of the time spent on every
+# path, and an envelope of the CPU and memory use over all runs.
+#
+######################################################################
+
+import argparse
+import json
+import math
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.psrecord import parse_log as parse_cpu_log
+from mantidprofiler.sampler import monitor
+
+# format of the summary, increased when its layout changes
+SUMMARY_VERSION = 1
+# separator of the names of a call path
+PATH_SEPARATOR = "/"
+# number of points of the CPU and memory envelope
+ENVELOPE_POINTS = 1000
+
+
+def call_paths(forest) -> tuple:
+    """
+    Call path of every call of a ``Forest``.
+
+    Returns
+    -------
+    paths : list[str]
+        The distinct call paths, names joined by ``PATH_SEPARATOR``.
+    path_id : numpy.ndarray
+        Index into ``paths`` for every call.
+    """
+    num_names = len(forest.names)
+    path_id = np.zeros(len(forest), dtype=np.int64)
+    paths = []
+    # parents are one level up, so their paths are known when a level is reached
+    for level in range(forest.max_depth + 1 if len(forest) else 0):
+        calls = np.flatnonzero(forest.depth == level)
+        parent_path = path_id[forest.parent[calls]] if level else np.full(len(calls), -1)
+        keys, inverse = np.unique((parent_path + 1) * num_names + forest.name_id[calls], return_inverse=True)
+        for key in keys.tolist():
+            parent, name_id = divmod(key, num_names)
+            name = forest.names[name_id]
+            paths.append(paths[parent - 1] + PATH_SEPARATOR + name if parent else name)
+        path_id[calls] = len(paths) - len(keys) + inverse.ravel()
+    return paths, path_id
+
+
+def path_times(forest) -> dict:
+    """Total duration in seconds and number of calls of every call path, as ``{path: (time, count)}``"""
+    paths, path_id = call_paths(forest)
+    total = np.bincount(path_id, weights=forest.duration / 1.0e9, minlength=len(paths))
+    count = np.bincount(path_id, minlength=len(paths))
+    return {path: (total[i], int(count[i])) for i, path in enumerate(paths)}
+
+
+def median_confidence_ranks(num: int, level: float = 0.95) -> tuple:
+    """
+    Order statistics that bound the median of ``num`` values with probability ``level``.
+
+    The interval does not assume any distribution of the values. With few values the widest
+    interval, from the smallest to the largest value, has a lower coverage than ``level``.
+
+    Returns
+    -------
+    lo, hi : int
+        Positions in the sorted values of the ends of the interval.
+    coverage : float
+        Probability that the interval contains the median.
+    """
+    if num == 0:
+        return 0, 0, 0.0
+    # probability that exactly k of the values are below the median
+    probability = [math.comb(num, k) / 2.0**num for k in range(num + 1)]
+    lo = 0
+    coverage = 1.0 - 2.0 * probability[0]
+    # narrow the interval from both ends while it still covers the median often enough
+    while lo + 1 < num - lo - 2 and coverage - 2.0 * probability[lo + 1] >= level:
+        lo += 1
+        coverage -= 2.0 * probability[lo]
+    return lo, num - 1 - lo, max(coverage, 0.0)
+
+
+def statistics(values: np.ndarray, level: float = 0.95) -> dict:
+    """Median, quartiles and confidence interval of the median of every column of ``values``, one row per run"""
+    values = np.sort(values, axis=0)
+    num = values.shape[0]
+    q1, median, q3 = np.percentile(values, [25.0, 50.0, 75.0], axis=0)
+    lo, hi, _ = median_confidence_ranks(num, level)
+    return {
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "ci_low": values[lo],
+        "ci_high": values[hi],
+        "min": values[0],
+        "max": values[-1],
+        "mean": values.mean(axis=0),
+        "std": values.std(axis=0, ddof=1) if num > 1 else np.zeros(values.shape[1:]),
+    }
+
+
+def aggregate_paths(runs: list, level: float = 0.95) -> list:
+    """Statistics of the time and number of calls of every call path over the ``path_times`` of all runs.
+
+    A path that a run did not call counts as no time in that run."""
+    paths = sorted(set().union(*runs)) if runs else []
+    times = np.array([[run.get(path, (0.0, 0))[0] for path in paths] for run in runs]).reshape(len(runs), -1)
+    counts = np.array([[run.get(path, (0.0, 0))[1] for path in paths] for run in runs]).reshape(len(runs), -1)
+    time_stats = statistics(times, level)
+    count_stats = statistics(counts.astype(float), level)
+    return [
+        {
+            "path": path,
+            "runs": int(np.count_nonzero(counts[:, i])),
+            "calls": {name: float(count_stats[name][i]) for name in ("median", "min", "max")},
+            "time": {name: round(float(values[i]), 6) for name, values in time_stats.items()},
+        }
+        for i, path in enumerate(paths)
+    ]
+
+
+def envelope(series: list, num_points: int = ENVELOPE_POINTS) -> dict:
+    """
+    Median and range of time series of several runs on a common time axis.
+
+    Parameters
+    ----------
+    series : list of (numpy.ndarray, numpy.ndarray)
+        Times since the start of every run and the values at those times.
+
+    Returns
+    -------
+    dict
+        ``time`` and the ``median``, ``min`` and ``max`` over the runs still going at every time.
+    """
+    series = [(x, y) for x, y in series if len(x)]
+    if not series:
+        return {name: [] for name in ("time", "median", "min", "max")}
+    end = max(x[-1] for x, _ in series)
+    time = np.linspace(0.0, end, num_points)
+    values = np.full((len(series), num_points), np.nan)
+    for row, (x, y) in enumerate(series):
+        running = time <= x[-1]
+        values[row, running] = np.interp(time[running], x, y)
+    return {
+        "time": time,
+        "median": np.nanmedian(values, axis=0),
+        "min": np.nanmin(values, axis=0),
+        "max": np.nanmax(values, axis=0),
+    }
+
+
+def _rounded(values) -> list:
+    return np.round(np.asarray(values, dtype=float), 6).tolist()
+
+
+def run_once(command: list, infile: Path, rundir: Path, index: int, interval: Optional[float], mintime: float):
+    """Launch and monitor the command once, returning the ``path_times`` of its calls and its CPU/memory log"""
+    logfile = rundir / "run{}_cpu.txt".format(index)
+    diskfile = rundir / "run{}_disk.txt".format(index)
+    process = subprocess.Popen(command)
+    monitor(process.pid, logfile=logfile, diskfile=diskfile, interval=interval, infile=infile)
+    if process.wait() != 0:
+        raise SystemExit("run {} of {} failed with exit code {}".format(index, command, process.returncode))
+
+    times = {}
+    if infile.exists():
+        # keep the timing file of every run, and do not let the next run append to it
+        timing_file = rundir / "run{}.out".format(index)
+        shutil.move(infile, timing_file)
+        _, records, names = at.parseFile(timing_file, cleanup=False)
+        records = records[records["finish"] - records["start"] > mintime * 1.0e9]
+        times = path_times(at.Forest.from_record_array(records, names))
+    else:
+        print("run {} did not write the algorithm timing file {}".format(index, infile))
+    sync_time, cpu_data = parse_cpu_log(logfile, cleanup=False)
+    return times, sync_time, cpu_data
+
+
+def summarize(command: list, warmup: int, runs: list, logs: list, level: float = 0.95) -> dict:
+    """The machine-readable summary of the ``path_times`` and the CPU/memory logs of all measured runs"""
+    wall_time = np.array([data[-1, 0] - sync_time if len(data) else 0.0 for sync_time, data in logs])
+    peak_rss = np.array([data[:, 2].max() if len(data) else 0.0 for _, data in logs])
+    cpu = [(data[:, 0] - sync_time, data[:, 1]) for sync_time, data in logs]
+    rss = [(data[:, 0] - sync_time, data[:, 2]) for sync_time, data in logs]
+    _, _, coverage = median_confidence_ranks(len(runs), level)
+    summary = {
+        "format": "mantidprofiler-bench",
+        "version": SUMMARY_VERSION,
+        "command": list(command),
+        "runs": len(runs),
+        "warmup": warmup,
+        "confidence": {"level": level, "coverage": round(coverage, 6)},
+        "wall_time": {name: float(values[0]) for name, values in statistics(wall_time[:, None], level).items()},
+        "peak_rss": {name: float(values[0]) for name, values in statistics(peak_rss[:, None], level).items()},
+        "call_paths": aggregate_paths(runs, level),
+        "envelope": {
+            "cpu": {name: _rounded(values) for name, values in envelope(cpu).items()},
+            "rss": {name: _rounded(values) for name, values in envelope(rss).items()},
+        },
+    }
+    return summary
+
+
+def print_summary(summary: dict, num: int = 10) -> None:
+    wall = summary["wall_time"]
+    print(
+        "{} runs, wall time median {:.3f}s, IQR {:.3f}s, {:.0%} confidence interval [{:.3f}s, {:.3f}s]".format(
+            summary["runs"],
+            wall["median"],
+            wall["iqr"],
+            summary["confidence"]["coverage"],
+            wall["ci_low"],
+            wall["ci_high"],
+        )
+    )
+    paths = sorted(summary["call_paths"], key=lambda path: -path["time"]["median"])[:num]
+    print("{:60s} {:>10s} {:>10s} {:>10s} {:>10s}".format("Call path", "Median", "IQR", "CI low", "CI high"))
+    for path in paths:
+        time = path["time"]
+        name = path["path"] if len(path["path"]) <= 60 else "..." + path["path"][-57:]
+        print(
+            "{:60s} {:10.3f} {:10.3f} {:10.3f} {:10.3f}".format(
+                name, time["median"], time["iqr"], time["ci_low"], time["ci_high"]
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a Mantid workflow several times and aggregate its algorithm timings",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="the workflow to run, e.g. python reduce.py")
+    parser.add_argument("--runs", type=int, default=5, help="number of measured runs")
+    parser.add_argument("--warmup", type=int, default=1, help="number of runs before the measured ones, discarded")
+    parser.add_argument(
+        "--infile", type=Path, default="algotimeregister.out", help="algorithm timing file written by the workflow"
+    )
+    parser.add_argument("--outfile", type=Path, default="bench.json", help="name of output summary file")
+    parser.add_argument("--rundir", type=Path, help="directory to keep the timing file and logs of every run in")
+    parser.add_argument("--interval", type=float, help="how long to wait between each sample (in seconds)")
+    parser.add_argument(
+        "--confidence", type=float, default=0.95, help="confidence level of the intervals of the medians"
+    )
+    parser.add_argument(
+        "--mintime",
+        type=float,
+        default=0.0,
+        help="minimum duration for an algorithm call to be counted (in seconds).",
+    )
+    args = parser.parse_args(argv)
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error("no workflow to run")
+    if args.runs < 1:
+        parser.error("at least one measured run is needed")
+
+    infile = Path(args.infile)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rundir = Path(args.rundir or tmpdir)
+        rundir.mkdir(parents=True, exist_ok=True)
+        for index in range(args.warmup):
+            print("Warmup run {} of {}".format(index + 1, args.warmup))
+            if subprocess.run(args.command).returncode != 0:
+                raise SystemExit("warmup run of {} failed".format(args.command))
+            infile.unlink(missing_ok=True)
+
+        runs, logs = [], []
+        for index in range(args.runs):
+            print("Run {} of {}".format(index + 1, args.runs))
+            times, sync_time, cpu_data = run_once(args.command, infile, rundir, index, args.interval, args.mintime)
+            runs.append(times)
+            logs.append((sync_time, cpu_data))
+
+    summary = summarize(args.command, args.warmup, runs, logs, args.confidence)
+    with open(args.outfile, "w") as handle:
+        json.dump(summary, handle, indent=1)
+        handle.write("\n")
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# binary_log.py - fixed-width binary sample logs for the process monitors
+#
+# A log file starts with the 8 byte magic ``MPROFBIN`` and the length of a JSON
+# header as a little-endian uint32. The header holds the start time and the names
+# of the columns, and is padded with spaces so the samples that follow are 8 byte
+# aligned. Every sample is one row of float64 values, appended as it is taken.
+#
+# Per-thread CPU times go to a side file ``<logfile>.threads`` of THREAD_DTYPE
+# records. Only the threads that are new or whose times changed since the previous
+# sample are written, and with the change since then rather than the total.
+#
+# Both files are read back with ``numpy.memmap`` without parsing or copying.
+#
+######################################################################
+
+import json
+import struct
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+# formats the monitors can write their logs in
+LOG_FORMATS = ("text", "binary")
+
+MAGIC = b"MPROFBIN"
+VERSION = 1
+THREAD_DTYPE = np.dtype([("sample", "<u4"), ("tid", "<u8"), ("user_time", "<f8"), ("system_time", "<f8")])
+
+_PREFIX = struct.Struct("<8sI")
+_BUFFER_SIZE = 1024**2
+
+
+def threads_path(logfile: Path) -> Path:
+    return logfile.with_name(logfile.name + ".threads")
+
+
+def is_binary_log(filename: Path) -> bool:
+    with open(filename, "rb") as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+class BinaryLogWriter:
+    """Append samples of ``columns`` float64 values, and optionally per-thread CPU times, to a binary log"""
+
+    def __init__(self, logfile: Path, columns: Sequence[str], start_time: float, threads: bool = False):
+        self.logfile = Path(logfile)
+        self.columns = tuple(columns)
+        self.num_samples = 0
+
+        header = json.dumps({"version": VERSION, "start_time": start_time, "columns": self.columns}).encode()
+        header += b" " * (-(len(header) + _PREFIX.size) % 8)
+        # samples are small, let the buffer collect many of them between writes to disk
+        self._handle = open(self.logfile, "wb", buffering=_BUFFER_SIZE)
+        self._handle.write(_PREFIX.pack(MAGIC, len(header)))
+        self._handle.write(header)
+        self._row = struct.Struct("<{}d".format(len(self.columns)))
+
+        self._threads = open(threads_path(self.logfile), "wb", buffering=_BUFFER_SIZE) if threads else None
+        self._last_times: dict = {}
+
+    def write(self, row: Sequence[float]) -> None:
+        self._handle.write(self._row.pack(*row))
+        self.num_samples += 1
+
+    def write_threads(self, threads) -> int:
+        """Record the ``(id, user_time, system_time)`` of the threads for the next sample
+        and return how many of them are active, i.e. new or with changed times"""
+        last_times = self._last_times
+        changes = []
+        for tid, user_time, system_time in threads:
+            before = last_times.get(tid)
+            if before is None:
+                changes.append((self.num_samples, tid, user_time, system_time))
+            elif before[0] != user_time or before[1] != system_time:
+                changes.append((self.num_samples, tid, user_time - before[0], system_time - before[1]))
+        self._last_times = {tid: (user_time, system_time) for tid, user_time, system_time in threads}
+        if changes and self._threads is not None:
+            self._threads.write(np.array(changes, dtype=THREAD_DTYPE).tobytes())
+        return len(changes)
+
+    def flush(self) -> None:
+        self._handle.flush()
+        if self._threads is not None:
+            self._threads.flush()
+
+    def close(self) -> None:
+        self._handle.close()
+        if self._threads is not None:
+            self._threads.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _memmap(filename: Path, dtype, offset: int, width: Optional[int] = None) -> np.ndarray:
+    itemsize = dtype.itemsize * (width or 1)
+    # drop a partially written record at the end, e.g. if the monitor was killed
+    num = max(filename.stat().st_size - offset, 0) // itemsize
+    shape = (num, width) if width else (num,)
+    if num == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def read_binary_log(filename: Path):
+    """
+    Map a binary log into memory.
+
+    Returns
+    -------
+    header : dict
+        Contains ``start_time`` and the names of the ``columns``.
+    data : numpy.ndarray
+        Read-only array of shape (n_samples, n_columns).
+    threads : numpy.ndarray or None
+        Read-only THREAD_DTYPE array of the changes in thread CPU times, if the side file exists.
+    """
+    filename = Path(filename)
+    with open(filename, "rb") as handle:
+        magic, length = _PREFIX.unpack(handle.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a binary mantidprofiler log".format(filename))
+        header = json.loads(handle.read(length))
+
+    data = _memmap(filename, np.dtype("<f8"), _PREFIX.size + length, width=len(header["columns"]))
+    threads = None
+    if threads_path(filename).exists():
+        threads = _memmap(threads_path(filename), THREAD_DTYPE, 0)
+    return header, data, threads
+
+
+def remove_binary_log(filename: Path) -> None:
+    for path in (filename, threads_path(filename)):
+        if path.exists():
+            path.unlink()
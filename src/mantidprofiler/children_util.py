@@ -1,10 +1,22 @@
 # children_util.py - helper functions for dealing with child processes
 #
+# ``ProcessTree`` keeps the descendants of the monitored process between ticks.
+# Finding them from scratch with ``children(recursive=True)`` reads the parent of
+# every process on the machine, which dominates the cost of a tick on a node
+# with thousands of processes. The tree only lists the process ids, and looks up
+# the parents of those that are new since the previous tick.
+#
 ######################################################################
 
+import math
 
 import psutil
 
+from mantidprofiler.time_util import get_current_time
+
+# seconds between full scans of the tree, which catch processes that were reparented or whose pid was reused
+RESCAN_INTERVAL = 5.0
+
 
 def all_children(pr: psutil.Process) -> list[psutil.Process]:
     try:
@@ -13,21 +25,75 @@ def all_children(pr: psutil.Process) -> list[psutil.Process]:
         return []
 
 
-def update_children(old_children: dict[int, psutil.Process], new_children: list[psutil.Process]):
-    new_dct = {}
-    for ch in new_children:
-        new_dct.update({ch.pid: ch})
+class ProcessTree:
+    """
+    Descendants of a process, updated incrementally.
+
+    Every ``update`` compares the process ids on the machine with those of the previous
+    one. Processes that went away are dropped and only the new ones are asked for their
+    parent, so ticks where no process started cost a single listing of the ids. The
+    ``psutil.Process`` objects are kept as long as their process runs, so that the
+    baselines of ``cpu_percent`` survive between ticks.
+    """
+
+    def __init__(self, process: psutil.Process, rescan_interval: float = RESCAN_INTERVAL):
+        self.process = process
+        self.rescan_interval = rescan_interval
+        self.children: dict[int, psutil.Process] = {}
+        self._pids: set = set()
+        self._last_scan = -math.inf
+        # cost of the updates
+        self.num_updates = 0
+        self.num_scans = 0
+        self.update_time = 0.0
+
+    def update(self) -> dict[int, psutil.Process]:
+        """The descendants by pid"""
+        start = get_current_time()
+        pids = set(psutil.pids())
+        if start - self._last_scan >= self.rescan_interval:
+            self._scan()
+            self._last_scan = start
+        else:
+            for pid in self._pids - pids:
+                self.children.pop(pid, None)
+            new = pids - self._pids
+            if new:
+                self._add(new)
+        self._pids = pids
+        self.num_updates += 1
+        self.update_time += get_current_time() - start
+        return self.children
 
-    todel = []
-    for pid in old_children.keys():
-        if pid not in new_dct.keys():
-            todel.append(pid)
+    def _scan(self) -> None:
+        # keep the objects of the processes that are still the same
+        children = {}
+        for child in all_children(self.process):
+            known = self.children.get(child.pid)
+            children[child.pid] = known if known is not None and known == child else child
+        self.children = children
+        self.num_scans += 1
 
-    for pid in todel:
-        del old_children[pid]
+    def _add(self, pids: set) -> None:
+        parents = {}
+        for pid in pids:
+            try:
+                process = psutil.Process(pid)
+                parents[pid] = (process.ppid(), process)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        # a new process may be the parent of another new one, whatever the order of their ids
+        added = True
+        while added:
+            added = False
+            for pid, (ppid, process) in list(parents.items()):
+                if ppid == self.process.pid or ppid in self.children:
+                    self.children[pid] = process
+                    del parents[pid]
+                    added = True
 
-    updct = {}
-    for pid in new_dct.keys():
-        if pid not in old_children.keys():
-            updct.update({pid: new_dct[pid]})
-    old_children.update(updct)
+    def summary(self) -> str:
+        mean = 1.0e3 * self.update_time / self.num_updates if self.num_updates else 0.0
+        return "Process tree updated in {:.3f} ms per tick, with {} full scans in {} ticks".format(
+            mean, self.num_scans, self.num_updates
+        )
@@ -0,0 +1,24 @@
+# colors.py - colors of the algorithms
+#
+# Every algorithm name gets the same color in the report and in the live view.
+#
+######################################################################
+
+
+# Convert string to RGB color
+# This method is simple but does not guarantee uniqueness of the color.
+# It is however random enough for our purposes
+def stringToColor(string):
+    red = 0
+    grn = 0
+    blu = 0
+    for i in range(0, len(string), 3):
+        red += ord(string[i])
+    for i in range(1, len(string), 3):
+        grn += ord(string[i])
+    for i in range(2, len(string), 3):
+        blu += ord(string[i])
+    red %= 255
+    grn %= 255
+    blu %= 255
+    return [red, grn, blu, (red + grn + blu) / 3.0]
@@ -0,0 +1,61 @@
+# decimate.py - reduce the number of points of the time series in the report
+#
+# Long runs produce far more samples than a browser can draw. The series are
+# split into buckets of equal duration and only the smallest and largest value
+# of every bucket is kept, so that peaks in memory or bursts of I/O stay visible
+# however much the series is reduced.
+#
+######################################################################
+
+from pathlib import Path
+
+import numpy as np
+
+
+def _buckets(x, num_buckets: int) -> np.ndarray:
+    # index of the bucket of equal duration every sample falls in
+    num = len(x)
+    span = x[-1] - x[0]
+    if span > 0:
+        return np.minimum(((x - x[0]) * (num_buckets / span)).astype(np.int64), num_buckets - 1)
+    return np.arange(num) * num_buckets // num
+
+
+def minmax_indices(x, y, num_points: int) -> np.ndarray:
+    """Indices of at most ``num_points`` samples of ``y(x)`` that keep the first and last sample
+    and the minimum and maximum of each bucket. ``x`` has to be sorted."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    num = len(y)
+    if num_points <= 0 or num <= num_points or num < 3:
+        return np.arange(num)
+
+    bucket = _buckets(x, max((num_points - 2) // 2, 1))
+
+    # within each bucket the samples are sorted by value, so its first is the minimum and its last the maximum
+    order = np.lexsort((y, bucket))
+    bucket = bucket[order]
+    change = bucket[1:] != bucket[:-1]
+    first = order[np.r_[True, change]]
+    last = order[np.r_[change, True]]
+    return np.unique(np.concatenate(([0, num - 1], first, last)))
+
+
+def bucket_means(x, values, num_points: int):
+    """``x`` and the rows of ``values`` sampled at ``x``, averaged over at most ``num_points`` buckets of equal
+    duration. Used where the average matters more than the peaks, e.g. for the cells of a heatmap."""
+    x = np.asarray(x)
+    values = np.asarray(values)
+    num = len(x)
+    if num_points <= 0 or num <= num_points:
+        return x, values
+
+    bucket = _buckets(x, num_points)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, num])
+    return np.add.reduceat(x, starts) / counts, np.add.reduceat(values, starts, axis=-1) / counts
+
+
+def save_full_resolution(filename: Path, **series) -> None:
+    """Keep the series at full resolution next to the report, as a compressed ``.npz``"""
+    np.savez_compressed(filename, **{name: np.asarray(values) for name, values in series.items()})
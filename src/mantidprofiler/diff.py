@@ -0,0 +1,345 @@
+# diff.py - compare the algorithm calls of two runs
+#
+# Calls are matched by their call path: the calls of two matched parents, or the
+# heads of both runs, are aligned by name as a diff of two lists, and the aligned
+# calls are matched. Calls inserted or removed between two runs therefore leave
+# the other calls matched, and only the subtree under a call that has no match is
+# unmatched.
+#
+# The report draws the calls of the new run colored by how much slower or faster
+# they are than in the baseline, with tables of the changes per name and per call.
+#
+######################################################################
+
+import argparse
+import difflib
+import json
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.attribution import resource_statistics
+from mantidprofiler.diskrecord import COLUMNS as DISK_COLUMNS
+from mantidprofiler.hotspots import hotspots
+from mantidprofiler.mantidprofiler import ALGORITHM_TRACES_JS, algorithmTimes, writeAlgorithms
+from mantidprofiler.psrecord import parse_log as parse_cpu_log
+
+# relative changes are colored in bins from -MAX_CHANGE (blue, faster) to +MAX_CHANGE (red, slower)
+MAX_CHANGE = 0.5
+NUM_BINS = 11
+# calls with no match in the baseline
+NEW_CALL_COLOR = [150, 80, 190, 140.0]
+# rows shown in the table of calls
+TABLE_ROWS = 500
+
+
+class Run:
+    """The algorithm calls of one run, with their memory use if the CPU/memory log was kept"""
+
+    def __init__(self, timing_file: Path, log_file: Optional[Path] = None, mintime: float = 0.0):
+        header, records, names = at.parseFile(Path(timing_file), cleanup=False)
+        records = records[records["finish"] - records["start"] > mintime * 1.0e9]
+        self.forest = at.Forest.from_record_array(records, names)
+        self.header = int(header.split()[1]) if header else 0
+        # without a log, times count from the start point of the timing file
+        self.sync_time = self.header / 1.0e9
+        if log_file is not None:
+            self.sync_time, cpu_data = parse_cpu_log(Path(log_file), cleanup=False)
+            cpu_x = cpu_data[:, 0] - self.sync_time
+            start, finish = algorithmTimes(self.forest, self.sync_time, self.header)
+            self.forest.resources = resource_statistics(
+                start, finish, cpu_x, cpu_data, np.empty(0), np.empty((0, len(DISK_COLUMNS)))
+            )
+        start, finish = algorithmTimes(self.forest, self.sync_time, self.header)
+        self.wall_time = float(finish.max() - min(start.min(), 0.0)) if len(self.forest) else 0.0
+
+    @property
+    def has_memory(self) -> bool:
+        return "peak_rss" in self.forest.resources
+
+
+def _align(base_names: list, new_names: list) -> list:
+    # pairs of positions in two lists of sibling calls, aligned so that inserted or removed calls are skipped
+    if base_names == new_names:  # the common case, and that of calls without children
+        return list(zip(range(len(base_names)), range(len(new_names))))
+    pairs = []
+    matcher = difflib.SequenceMatcher(None, base_names, new_names, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs.extend(zip(range(i1, i2), range(j1, j2)))
+        elif tag == "replace":
+            # calls of the same name within a replaced stretch are still paired, in order
+            remaining: dict = {}
+            for j in range(j1, j2):
+                remaining.setdefault(new_names[j], []).append(j)
+            for i in range(i1, i2):
+                candidates = remaining.get(base_names[i])
+                if candidates:
+                    pairs.append((i, candidates.pop(0)))
+    return pairs
+
+
+def match_calls(base, new):
+    """
+    Match the calls of two forests by call path.
+
+    Returns
+    -------
+    base_match, new_match : numpy.ndarray
+        Index of the matching call in the other forest for every call, -1 where there is none.
+    """
+    base_match = np.full(len(base), -1, dtype=np.int64)
+    new_match = np.full(len(new), -1, dtype=np.int64)
+    # pairs of matched calls whose children are still to be aligned, -1 standing for the heads
+    pending = [(-1, -1)]
+    while pending:
+        base_parent, new_parent = pending.pop()
+        base_calls = base.heads if base_parent < 0 else base.children(base_parent)
+        new_calls = new.heads if new_parent < 0 else new.children(new_parent)
+        base_names = [base.names[name_id] for name_id in base.name_id[base_calls]]
+        new_names = [new.names[name_id] for name_id in new.name_id[new_calls]]
+        for i, j in _align(base_names, new_names):
+            base_match[base_calls[i]] = new_calls[j]
+            new_match[new_calls[j]] = base_calls[i]
+            pending.append((base_calls[i], new_calls[j]))
+    return base_match, new_match
+
+
+def _labels(forest) -> list:
+    return [forest.label(i) for i in range(len(forest))]
+
+
+def call_changes(base: Run, new: Run, base_match, new_match) -> dict:
+    """Duration, and peak memory if known, of every call in both runs: the matched pairs, the calls only in
+    the new run and those only in the baseline. Missing values are NaN."""
+    base_forest, new_forest = base.forest, new.forest
+    removed = np.flatnonzero(base_match < 0)
+    base_index = np.concatenate((new_match, removed))
+    new_index = np.concatenate((np.arange(len(new_forest)), np.full(len(removed), -1)))
+
+    def values(column, index):
+        result = np.full(len(index), np.nan)
+        present = index >= 0
+        result[present] = column[index[present]]
+        return result
+
+    new_labels, base_labels = _labels(new_forest), _labels(base_forest)
+    call = [new_labels[i] if i >= 0 else base_labels[j] for i, j in zip(new_index, base_index)]
+    parent = []
+    for i, j in zip(new_index, base_index):
+        forest, labels, k = (new_forest, new_labels, i) if i >= 0 else (base_forest, base_labels, j)
+        parent.append(labels[forest.parent[k]] if forest.parent[k] >= 0 else "")
+
+    changes = {
+        "call": call,
+        "parent": parent,
+        "base_time": values(base_forest.duration / 1.0e9, base_index),
+        "new_time": values(new_forest.duration / 1.0e9, new_index),
+    }
+    changes["time_change"] = changes["new_time"] - changes["base_time"]
+    if base.has_memory and new.has_memory:
+        changes["base_peak_rss"] = values(base_forest.resources["peak_rss"], base_index)
+        changes["new_peak_rss"] = values(new_forest.resources["peak_rss"], new_index)
+        changes["rss_change"] = values(new_forest.resources["delta_rss"], new_index) - values(
+            base_forest.resources["delta_rss"], base_index
+        )
+    return changes
+
+
+def name_changes(base: Run, new: Run) -> dict:
+    """Calls, total and self time, and peak memory if known, of every algorithm name in both runs"""
+    tables = [hotspots(run.forest, run.wall_time) for run in (base, new)]
+    names = sorted(set(tables[0]["name"]) | set(tables[1]["name"]))
+    changes = {"name": names}
+    for prefix, table in zip(("base", "new"), tables):
+        row = {name: i for i, name in enumerate(table["name"])}
+        index = np.array([row.get(name, -1) for name in names], dtype=np.int64)
+        for column in ("count", "total", "self"):
+            values = np.zeros(len(names))
+            values[index >= 0] = table[column][index[index >= 0]]
+            changes["{}_{}".format(prefix, column)] = values
+    changes["self_change"] = changes["new_self"] - changes["base_self"]
+    changes["total_change"] = changes["new_total"] - changes["base_total"]
+
+    if base.has_memory and new.has_memory:
+        for prefix, run in (("base", base), ("new", new)):
+            peak = np.zeros(len(run.forest.names))
+            np.maximum.at(peak, run.forest.name_id, run.forest.resources["peak_rss"])
+            by_name = dict(zip(run.forest.names, peak))
+            changes["{}_peak_rss".format(prefix)] = np.array([by_name.get(name, 0.0) for name in names])
+    return changes
+
+
+def change_colors(new_forest, new_match, base_forest):
+    """Index into the palette of every call of the new run, and the palette"""
+    base_time = base_forest.duration[np.maximum(new_match, 0)].astype(float)
+    new_time = new_forest.duration.astype(float)
+    relative = np.where(base_time > 0, (new_time - base_time) / np.where(base_time > 0, base_time, 1.0), 0.0)
+    color_id = np.rint((np.clip(relative, -MAX_CHANGE, MAX_CHANGE) / MAX_CHANGE + 1.0) * (NUM_BINS - 1) / 2)
+    color_id = np.where(new_match >= 0, color_id, NUM_BINS).astype(np.int32)
+
+    palette = []
+    for k in range(NUM_BINS):
+        # from blue through light grey to red
+        t = 2.0 * k / (NUM_BINS - 1) - 1.0
+        if t < 0:
+            rgb = [int(220 + 170 * t), int(220 + 120 * t), 220]
+        else:
+            rgb = [220, int(220 - 170 * t), int(220 - 170 * t)]
+        palette.append(rgb + [sum(rgb) / 3.0])
+    palette.append(NEW_CALL_COLOR)
+    return color_id, palette
+
+
+DIFF_TABLES_JS = """
+function diffTables(names, calls, nameElement, callElement, maxRows) {
+  function number(digits) {
+    return function(value) { return value === null ? '-' : value.toFixed(digits); };
+  }
+  function column(table, title, name, digits) {
+    return {title: title, value: function(i) { return table[name][i]; }, format: number(digits)};
+  }
+  function text(table, title, name) {
+    return {title: title, value: function(i) { return table[name][i]; }};
+  }
+  var columns = [text(names, 'Algorithm', 'name')].concat([
+    column(names, 'Calls before', 'base_count', 0),
+    column(names, 'Calls after', 'new_count', 0),
+    column(names, 'Self before (s)', 'base_self', 3),
+    column(names, 'Self after (s)', 'new_self', 3),
+    column(names, 'Self change (s)', 'self_change', 3),
+    column(names, 'Total change (s)', 'total_change', 3),
+  ]);
+  if (names.base_peak_rss) {
+    columns.push(column(names, 'Peak RAM before (MB)', 'base_peak_rss', 0));
+    columns.push(column(names, 'Peak RAM after (MB)', 'new_peak_rss', 0));
+  }
+  sortableTable(nameElement, columns, names.name.length, 5, names.name.length, 'algorithms');
+
+  columns = [text(calls, 'Call', 'call'), text(calls, 'Called from', 'parent')].concat([
+    column(calls, 'Before (s)', 'base_time', 3),
+    column(calls, 'After (s)', 'new_time', 3),
+    column(calls, 'Change (s)', 'time_change', 3),
+  ]);
+  if (calls.rss_change) {
+    columns.push(column(calls, 'Peak RAM before (MB)', 'base_peak_rss', 0));
+    columns.push(column(calls, 'Peak RAM after (MB)', 'new_peak_rss', 0));
+    columns.push(column(calls, 'RAM growth change (MB)', 'rss_change', 0));
+  }
+  sortableTable(callElement, columns, calls.call.length, 4, maxRows, 'calls');
+}
+"""
+
+
+def _json_columns(table: dict) -> str:
+    # NaN is not valid JSON
+    columns = {}
+    for name, values in table.items():
+        if isinstance(values, np.ndarray):
+            values = [None if np.isnan(value) else round(float(value), 6) for value in values]
+        columns[name] = values
+    return json.dumps(columns)
+
+
+def write_diff_html(filename: Path, base: Run, new: Run, html_height: int = 600) -> tuple:
+    """Write the differential view of the calls of ``new`` against ``base`` and return the tables of changes"""
+    base_match, new_match = match_calls(base.forest, new.forest)
+    calls = call_changes(base, new, base_match, new_match)
+    names = name_changes(base, new)
+    color_id, palette = change_colors(new.forest, new_match, base.forest)
+    baseline = np.where(new_match >= 0, base.forest.duration[np.maximum(new_match, 0)] / 1.0e9, -1.0)
+
+    with open(filename, "w") as htmlFile:
+        htmlFile.write("<head>\n")
+        htmlFile.write('  <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>\n')
+        htmlFile.write("</head>\n")
+        htmlFile.write("<body>\n")
+        htmlFile.write('  <div id="myDiv"></div>\n')
+        for div in ("nameTable", "callTable"):
+            htmlFile.write('  <div id="{}" style="font-family: sans-serif; font-size: small;"></div>\n'.format(div))
+        htmlFile.write("  <script>\n")
+        writeAlgorithms(htmlFile, new.forest, new.sync_time, new.header, new.wall_time)
+        htmlFile.write("algorithms.color_id = {};\n".format(json.dumps(color_id.tolist())))
+        htmlFile.write("algorithms.colors = {};\n".format(json.dumps(palette)))
+        htmlFile.write("algorithms.baseline = {};\n".format(json.dumps(baseline.round(6).tolist())))
+        htmlFile.write(ALGORITHM_TRACES_JS)
+        htmlFile.write(DIFF_TABLES_JS)
+        htmlFile.write(
+            "var data = algorithmTraces(algorithms, {}, {});\n".format(new.forest.max_depth, new.wall_time or 1.0)
+        )
+        htmlFile.write("var layout = {\n")
+        htmlFile.write("  'height': {},\n".format(html_height))
+        htmlFile.write(
+            "  'title': 'Calls of the new run, red when slower and blue when faster than the baseline, "
+            "purple when not in the baseline',\n"
+        )
+        htmlFile.write("  'xaxis' : {'title' : 'Time (s)', 'side' : 'top'},\n")
+        htmlFile.write(
+            "  'yaxis4': {'domain' : [0, 0.9], 'showgrid': false, 'ticks': '', 'showticklabels': false, "
+            "'fixedrange': true},\n"
+        )
+        htmlFile.write("  'hovermode' : 'closest',\n")
+        htmlFile.write("};\n")
+        htmlFile.write("Plotly.newPlot('myDiv', data, layout, {scrollZoom: true});\n")
+        htmlFile.write("var nameChanges = {};\n".format(_json_columns(names)))
+        htmlFile.write("var callChanges = {};\n".format(_json_columns(calls)))
+        htmlFile.write(
+            "diffTables(nameChanges, callChanges, document.getElementById('nameTable'), "
+            "document.getElementById('callTable'), {});\n".format(TABLE_ROWS)
+        )
+        htmlFile.write("</script>\n</body>\n</html>\n")
+    return names, calls
+
+
+def print_summary(names: dict, calls: dict, num: int = 10) -> None:
+    order = np.argsort(-np.abs(names["self_change"]), kind="stable")[:num]
+    print("{:40s} {:>12s} {:>12s} {:>12s}".format("Algorithm", "Self before", "Self after", "Change (s)"))
+    for i in order:
+        print(
+            "{:40s} {:12.3f} {:12.3f} {:+12.3f}".format(
+                names["name"][i], names["base_self"][i], names["new_self"][i], names["self_change"][i]
+            )
+        )
+    matched = np.isfinite(calls["time_change"])
+    print(
+        "{} calls matched, {} only in the new run, {} only in the baseline".format(
+            np.count_nonzero(matched),
+            np.count_nonzero(np.isnan(calls["base_time"])),
+            np.count_nonzero(np.isnan(calls["new_time"])),
+        )
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the algorithm timings of two Mantid runs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("baseline", type=Path, help="algorithm timing file of the baseline run")
+    parser.add_argument("new", type=Path, help="algorithm timing file of the run to compare")
+    parser.add_argument("--baselog", type=Path, help="CPU/memory log of the baseline run, for memory changes")
+    parser.add_argument("--newlog", type=Path, help="CPU/memory log of the run to compare, for memory changes")
+    parser.add_argument("--outfile", type=Path, default="diff.html", help="name of output html file")
+    parser.add_argument("--json", type=Path, help="name of a file to write the changes per name and per call to")
+    parser.add_argument("--height", type=int, default=600, help="height for html plot")
+    parser.add_argument(
+        "--mintime",
+        type=float,
+        default=0.0,
+        help="minimum duration for an algorithm to be compared (in seconds).",
+    )
+    args = parser.parse_args(argv)
+
+    base = Run(args.baseline, args.baselog, args.mintime)
+    new = Run(args.new, args.newlog, args.mintime)
+    names, calls = write_diff_html(args.outfile, base, new, args.height)
+    print_summary(names, calls)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write('{{"names": {}, "calls": {}}}\n'.format(_json_columns(names), _json_columns(calls)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,84 @@
 from pathlib import Path
-from time import sleep
-from typing import Optional
 
 import numpy as np
-import psutil
 
-from mantidprofiler.children_util import all_children
-from mantidprofiler.time_util import get_current_time, get_start_time
+from mantidprofiler.binary_log import BinaryLogWriter, is_binary_log, read_binary_log, remove_binary_log
 
+# columns of the array returned by parse_log, also used in the binary log
+COLUMNS = ("time", "read_chars", "write_chars", "read_bytes", "write_bytes", "read_ops", "write_ops")
+# mean bytes per read or write call below which the I/O counts as small operations
+SMALL_OPERATION = 65536
+# operations per call of an algorithm below which it is not flagged for small I/O
+MIN_OPERATIONS = 100
 
-def monitor(pid: int, logfile: Path, interval: Optional[float], show_bytes: bool = False) -> None:
-    """Monitor the disk usage of the supplied process id
-    The interval defaults to 0.05 if not supplied"""
-    # change interval to reasonable default
-    # being too small doesn't aid in understanding performance
-    DEFAULT_INTERVAL = 0.05
-    if interval is None:
-        interval = DEFAULT_INTERVAL
-    else:
-        interval = max(DEFAULT_INTERVAL, interval)
 
-    process = psutil.Process(pid)
+class DiskLog:
+    """Writes the samples of the disk monitor as text or in the binary format of ``binary_log``"""
 
-    # Record start time
-    starting_point = get_start_time()
-    start_time = get_current_time()
-    last_time = start_time
+    def __init__(self, logfile: Path, starting_point: float, log_format: str = "text"):
+        self.binary = log_format == "binary"
+        if self.binary:
+            self._handle = BinaryLogWriter(logfile, COLUMNS, starting_point)
+            return
 
-    disk_before = process.io_counters()
-
-    children_before = {}
-    for ch in all_children(process):
-        children_before.update({ch.pid: {"process": ch, "disk": ch.io_counters()}})
-
-    with open(logfile, "w") as handle:
+        self._handle = open(logfile, "w")
         # add header
-        handle.write(
-            "# {0:12s} {1:12s} {2:12s} {3:12s} {4}\n".format(
+        self._handle.write(
+            "# {0:12s} {1:12s} {2:12s} {3:12s} {4:12s} {5:12s} {6}\n".format(
                 "Elapsed time".center(12),
                 "ReadChars (Mbit per sec)".center(12),
                 "WriteChars (Gbit per sec)".center(12),
                 "ReadBytes (Gbit per sec)".center(12),
                 "WriteBytes (Gbit per sec)".center(12),
+                "ReadOps (per sec)".center(12),
+                "WriteOps (per sec)".center(12),
+            )
+        )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+
+    def write(self, sample_time, read_char, write_char, read_byte, write_byte, read_ops=0.0, write_ops=0.0) -> None:
+        if self.binary:
+            self._handle.write((sample_time, read_char, write_char, read_byte, write_byte, read_ops, write_ops))
+            return
+
+        self._handle.write(
+            "{0:12.6f} {1:12.3f} {2:12.3f} {3:12.3f} {4} {5:12.1f} {6:12.1f}\n".format(
+                sample_time,
+                read_char,
+                write_char,
+                read_byte,
+                write_byte,
+                read_ops,
+                write_ops,
             )
         )
-        handle.write("START_TIME: {}\n".format(starting_point))
-
-        # conversion factor of bytes per sec to Giga-bits per second - 8 bits in a byte
-        conversion_to_size = 1e-9
-        if not show_bytes:
-            conversion_to_size = 8.0 * conversion_to_size
-
-        # main event loop
-        try:
-            while True:
-                try:
-                    # update information
-                    current_time = get_current_time()
-                    disk_after = process.io_counters()
-
-                    delta_time = current_time - last_time
-                    if delta_time <= 0.0:
-                        continue
-
-                    # calculate bytes amount per second
-                    read_char_per_sec = (
-                        conversion_to_size * (disk_after.read_chars - disk_before.read_chars) / delta_time
-                    )
-                    write_char_per_sec = (
-                        conversion_to_size * (disk_after.write_chars - disk_before.write_chars) / delta_time
-                    )
-
-                    read_byte_per_sec = (
-                        conversion_to_size * (disk_after.read_bytes - disk_before.read_bytes) / delta_time
-                    )
-                    write_byte_per_sec = (
-                        conversion_to_size * (disk_after.write_bytes - disk_before.write_bytes) / delta_time
-                    )
-
-                    # get information from children
-                    children_after = {}
-                    for ch in all_children(process):
-                        # format the children dict
-                        children_after.update({ch.pid: {"process": ch, "disk": ch.io_counters()}})
-
-                        # initialize change with new child
-                        read_char_diff = children_after[ch.pid]["disk"].read_chars
-                        write_char_diff = children_after[ch.pid]["disk"].write_chars
-                        read_byte_diff = children_after[ch.pid]["disk"].read_bytes
-                        write_byte_diff = children_after[ch.pid]["disk"].write_bytes
-
-                        # subtract change from last iteration, if child already existed
-                        if ch.pid in children_before.keys():
-                            read_char_diff -= children_before[ch.pid]["disk"].read_chars
-                            write_char_diff -= children_before[ch.pid]["disk"].write_chars
-                            read_byte_diff -= children_before[ch.pid]["disk"].read_bytes
-                            write_byte_diff -= children_before[ch.pid]["disk"].write_bytes
-
-                        # add to totals
-                        read_char_per_sec += conversion_to_size * read_char_diff / delta_time
-                        write_char_per_sec += conversion_to_size * write_char_diff / delta_time
-                        read_byte_per_sec += conversion_to_size * read_byte_diff / delta_time
-                        write_byte_per_sec += conversion_to_size * write_byte_diff / delta_time
-
-                    # write information to the log file
-                    handle.write(
-                        "{0:12.6f} {1:12.3f} {2:12.3f} {3:12.3f} {4}\n".format(
-                            current_time - start_time + starting_point,
-                            read_char_per_sec,
-                            write_char_per_sec,
-                            read_byte_per_sec,
-                            write_byte_per_sec,
-                        )
-                    )
-
-                    # copy over information to new previous
-                    disk_before = disk_after
-                    children_before = children_after
-                    last_time = current_time
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    break  # all done
-
-                if interval > 0.0:
-                    sleep(interval)
-        except KeyboardInterrupt:  # pragma: no cover
-            print(f"killing process being monitored [PID={process.pid}]:", " ".join(process.cmdline()))
-            process.kill()
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _with_all_columns(data: np.ndarray) -> np.ndarray:
+    # logs written before the operation counts were recorded have no operations
+    if data.ndim != 2 or data.shape[1] >= len(COLUMNS):
+        return data
+    return np.hstack((data, np.zeros((len(data), len(COLUMNS) - data.shape[1]))))
 
 
 def parse_log(filename: Path, cleanup: bool = True):
+    if is_binary_log(filename):
+        header, data, _ = read_binary_log(filename)
+        if cleanup:
+            # copy the samples out and close the mapping first, mapped files cannot be removed on Windows
+            data = np.array(data)
+            remove_binary_log(filename)
+        return header["start_time"], _with_all_columns(data)
+
     rows = []
     start_time = 0.0
     with open(filename, "r") as handle:
@@ -148,4 +98,13 @@ def parse_log(filename: Path, cleanup: bool = True):
         filename.unlink()
 
     # return results
-    return start_time, np.array(rows)
+    return start_time, _with_all_columns(np.array(rows))
+
+
+def bytes_per_operation(data: np.ndarray, disk_in_bytes: bool = False) -> tuple:
+    """Mean bytes per read and per write call of every sample of ``parse_log``, NaN where there were none"""
+    to_bytes = 1.0e9 if disk_in_bytes else 1.0e9 / 8.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        read = np.where(data[:, 5] > 0.0, to_bytes * data[:, 1] / data[:, 5], np.nan)
+        write = np.where(data[:, 6] > 0.0, to_bytes * data[:, 2] / data[:, 6], np.nan)
+    return read, write
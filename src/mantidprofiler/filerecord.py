@@ -0,0 +1,407 @@
+# filerecord.py - disk I/O of every file opened by a multi-process workflow
+#
+# The disk log tells how much is read and written, not which file is read or
+# written. With a file log, ``sampler.monitor`` also lists the files each process
+# has open in /proc/<pid>/fd and follows their offsets in /proc/<pid>/fdinfo.
+# The growth of the offset of a file is the bytes read from or written to it since
+# the previous reading, depending on whether it is open for reading or writing.
+# Files open for both share the offset growth in the proportion of the characters
+# the process read and wrote, and the bytes of a process never exceed the
+# characters it read and wrote, so that seeking forward does not count as I/O.
+# Processes forked with a file open share its offset, which is counted once per
+# tick. Positioned reads and writes (pread, pwrite) and memory maps do not move
+# the offset, and are not seen.
+#
+# The fd table of a process is listed again every ``RESCAN_INTERVAL``, or every
+# ``MIN_RESCAN_INTERVAL`` while it reads or writes more than its known files
+# explain, and at most ``MAX_READS`` offsets are read per tick, in turns, so that
+# the cost of a tick stays bounded for processes that keep thousands of files
+# open. Offsets only grow, so the bytes of a file read less often are not lost,
+# only reported later. The characters of a process are kept for as many ticks as
+# it takes to read every offset once, so that they still bound the bytes of the
+# files read later. A file opened, read or written and closed between two
+# listings is never seen, which is common for the output of a workflow. The
+# characters a process read and wrote that its files do not account for once they
+# leave that window are therefore reported under ``UNATTRIBUTED``, along with the
+# I/O on pipes, sockets and devices, so that the files add up to the I/O of the
+# processes.
+#
+######################################################################
+
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from mantidprofiler.processrecord import MAX_LANES, rate_totals
+from mantidprofiler.time_util import get_current_time
+
+# columns of the array returned by parse_log
+COLUMNS = ("time", "file", "read", "write")
+# seconds between listings of the open files of a process
+RESCAN_INTERVAL = 1.0
+# seconds between listings at least, for processes whose I/O is not explained by their files
+MIN_RESCAN_INTERVAL = 0.1
+# bytes of I/O per tick not explained by the files of a process that make it list them again
+UNEXPLAINED_IO = 65536
+# offsets read per tick at most
+MAX_READS = 128
+# files listed in the table of the report
+TOP_FILES = 20
+# path under which the I/O that is not attributed to a file is logged
+UNATTRIBUTED = "(unattributed)"
+
+# open files that are not on a disk
+_SKIPPED = ("/dev/", "/proc/", "/sys/")
+# access modes of the flags in fdinfo
+_O_ACCMODE = 0o3
+_O_RDONLY = 0o0
+_O_WRONLY = 0o1
+
+
+def available() -> bool:
+    return os.path.exists("/proc/self/fdinfo")
+
+
+class _OpenFile:
+    __slots__ = ("path", "mode", "inode", "pos")
+
+    def __init__(self, path: str, pos: Optional[int]):
+        self.path = path
+        self.mode: Optional[int] = None
+        self.inode: Optional[bytes] = None
+        # None until the first reading, which is not counted
+        self.pos = pos
+
+
+class FileSampler:
+    """
+    Bytes read from and written to every open file of a changing set of processes.
+
+    The files open at the first update count from their offset at that time, and those opened
+    later from the start of the file, unless another process already has them open, as a forked
+    process would share their offset with its parent.
+    """
+
+    def __init__(
+        self,
+        rescan_interval: float = RESCAN_INTERVAL,
+        max_reads: int = MAX_READS,
+        min_rescan_interval: float = MIN_RESCAN_INTERVAL,
+    ):
+        self.rescan_interval = rescan_interval
+        self.min_rescan_interval = min(min_rescan_interval, rescan_interval)
+        self.max_reads = max_reads
+        self._files: dict = {}  # {pid: {fd: _OpenFile}}
+        self._last_scan: dict = {}
+        self._unexplained: set = set()
+        self._order: list = []  # (pid, fd) of all open files, read in turns
+        self._next = 0
+        # characters of every process not attributed to its files yet, one [read, written] per tick, oldest first
+        self._pending: dict = {}
+        self._started = False
+        # cost of the readings
+        self.num_updates = 0
+        self.num_scans = 0
+        self.num_reads = 0
+        self.update_time = 0.0
+
+    def update(self, pids) -> None:
+        """Follow the open files of the processes ``pids``, listing them again if they are due"""
+        now = get_current_time()
+        pids = set(pids)
+        changed = False
+        for pid in [pid for pid in self._files if pid not in pids]:
+            del self._files[pid]
+            del self._last_scan[pid]
+            self._unexplained.discard(pid)
+            changed = True
+        for pid in pids:
+            elapsed = now - self._last_scan.get(pid, -np.inf)
+            if elapsed >= self.rescan_interval or (pid in self._unexplained and elapsed >= self.min_rescan_interval):
+                self._unexplained.discard(pid)
+                self._scan(pid)
+                self._last_scan[pid] = now
+                changed = True
+        if changed:
+            self._order = [(pid, fd) for pid, files in self._files.items() for fd in files]
+            self._next %= max(len(self._order), 1)
+        self._started = True
+        self.update_time += get_current_time() - now
+
+    def _scan(self, pid: int) -> None:
+        root = "/proc/{}/fd/".format(pid)
+        try:
+            fds = os.listdir(root)
+        except (FileNotFoundError, PermissionError, ProcessLookupError):
+            self._files[pid] = {}
+            return
+        known = self._files.get(pid, {})
+        shared = set()
+        if pid not in self._files:
+            shared = {open_file.path for files in self._files.values() for open_file in files.values()}
+        files = {}
+        for fd in fds:
+            try:
+                path = os.readlink(root + fd)
+            except OSError:  # closed since
+                continue
+            if not path.startswith("/") or path.startswith(_SKIPPED):
+                continue  # pipes, sockets and devices
+            fd = int(fd)
+            current = known.get(fd)
+            if current is not None and current.path == path:
+                files[fd] = current
+            else:
+                files[fd] = _OpenFile(path, None if not self._started or path in shared else 0)
+        self._files[pid] = files
+        self.num_scans += 1
+
+    def _read(self, pid: int, fd: int, open_file: _OpenFile) -> Optional[tuple]:
+        # (mode, growth of the offset) or None if the file was closed or replaced
+        try:
+            with open("/proc/{}/fdinfo/{}".format(pid, fd), "rb") as handle:
+                info = handle.read()
+        except OSError:
+            return None
+        pos, flags, inode = 0, 0, None
+        for line in info.splitlines():
+            key, _, value = line.partition(b":")
+            if key == b"pos":
+                pos = int(value)
+            elif key == b"flags":
+                flags = int(value, 8)
+            elif key == b"ino":
+                inode = value.strip()
+        if open_file.inode is not None and inode != open_file.inode:
+            return None
+        open_file.inode = inode
+        open_file.mode = flags & _O_ACCMODE
+        growth = 0 if open_file.pos is None else max(pos - open_file.pos, 0)
+        open_file.pos = pos
+        return open_file.mode, growth
+
+    def sample(self, io_changes: Optional[dict] = None) -> dict:
+        """
+        ``{path: (read, written)}`` bytes since the previous sample, for the files that moved.
+
+        ``io_changes`` are the ``(read_chars, write_chars)`` of every process since the previous sample,
+        which split the offsets of files open for reading and writing and bound the bytes of each process.
+        They are kept until every offset was read once, and what the files of a process did not account for
+        by then is added up under ``UNATTRIBUTED``.
+        """
+        start = get_current_time()
+        self.num_updates += 1
+        io_changes = io_changes or {}
+        # ticks it takes to read every offset once, the characters of a process wait as long for its files
+        window = -(-len(self._order) // self.max_reads) if self._order else 1
+        moved: dict = {}  # {pid: {path: [read, written, both]}}
+        shared = set()  # offsets seen this tick
+        count = min(self.max_reads, len(self._order))
+        for k in range(count):
+            pid, fd = self._order[(self._next + k) % len(self._order)]
+            open_file = self._files.get(pid, {}).get(fd)
+            if open_file is None:
+                continue
+            reading = self._read(pid, fd, open_file)
+            self.num_reads += 1
+            if reading is None:
+                # listed again at the next update
+                del self._files[pid][fd]
+                self._last_scan[pid] = -np.inf
+                continue
+            mode, growth = reading
+            if growth and (open_file.inode, open_file.pos) not in shared:
+                shared.add((open_file.inode, open_file.pos))
+                column = 0 if mode == _O_RDONLY else (1 if mode == _O_WRONLY else 2)
+                moved.setdefault(pid, {}).setdefault(open_file.path, [0.0, 0.0, 0.0])[column] += growth
+        if self._order:
+            self._next = (self._next + count) % len(self._order)
+
+        for pid, (read_chars, write_chars) in io_changes.items():
+            explained = sum(sum(counts) for counts in moved.get(pid, {}).values())
+            if read_chars + write_chars > explained + UNEXPLAINED_IO:
+                self._unexplained.add(pid)
+            self._pending.setdefault(pid, []).append([float(read_chars), float(write_chars)])
+
+        result: dict = {}
+        for pid, files in moved.items():
+            pending = self._pending.get(pid)
+            chars = [sum(ticks[column] for ticks in pending) for column in (0, 1)] if pending else None
+            read_share = 0.5
+            if chars is not None and chars[0] + chars[1] > 0:
+                read_share = chars[0] / (chars[0] + chars[1])
+            for path, counts in files.items():
+                counts[0] += read_share * counts[2]
+                counts[1] += (1.0 - read_share) * counts[2]
+            # seeking moves the offset too, so a process never reads or writes more than its characters
+            for column in (0, 1):
+                total = sum(counts[column] for counts in files.values())
+                if chars is None:
+                    continue
+                if total > chars[column]:
+                    for counts in files.values():
+                        counts[column] *= chars[column] / total
+                    total = chars[column]
+                # the oldest characters are the first to be accounted for
+                for ticks in pending:
+                    used = min(ticks[column], total)
+                    ticks[column] -= used
+                    total -= used
+            for path, counts in files.items():
+                read, written = result.get(path, (0.0, 0.0))
+                result[path] = (read + counts[0], written + counts[1])
+
+        # what the files did not account for within the window, or of the processes that are gone
+        unattributed = [0.0, 0.0]
+        for pid in list(self._pending):
+            pending = self._pending[pid]
+            keep = window - 1 if pid in io_changes else 0
+            for ticks in pending[: max(len(pending) - keep, 0)]:
+                unattributed[0] += ticks[0]
+                unattributed[1] += ticks[1]
+            if keep:
+                self._pending[pid] = pending[-keep:]
+            else:
+                del self._pending[pid]
+        if unattributed[0] > 0.0 or unattributed[1] > 0.0:
+            result[UNATTRIBUTED] = tuple(unattributed)
+        self.update_time += get_current_time() - start
+        return result
+
+    def summary(self) -> str:
+        mean = 1.0e3 * self.update_time / self.num_updates if self.num_updates else 0.0
+        return "Open files followed in {:.3f} ms per tick, with {} listings and {} offsets read in {} ticks".format(
+            mean, self.num_scans, self.num_reads, self.num_updates
+        )
+
+
+class FileLog:
+    """Writes one line per file and sample of ``sampler.monitor`` in which the file was read or written"""
+
+    def __init__(self, logfile: Path, starting_point: float):
+        self._handle = open(logfile, "w")
+        self._handle.write(
+            "# {0:12s} {1:8s} {2:12s} {3:12s}\n".format(
+                "Elapsed time".center(12), "File".center(8), "Read".center(12), "Write".center(12)
+            )
+        )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+        self._ids: dict = {}
+
+    def write(self, sample_time, path: str, read, write) -> None:
+        file_id = self._ids.get(path)
+        if file_id is None:
+            # name the file the first time it is seen
+            file_id = self._ids[path] = len(self._ids)
+            self._handle.write("FILE: {} {}\n".format(file_id, path))
+        self._handle.write("{0:12.6f} {1:8d} {2:12.6f} {3:12.6f}\n".format(sample_time, file_id, read, write))
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_log(filename: Path, cleanup: bool = True):
+    """
+    Parse the log written by ``FileLog``.
+
+    Returns
+    -------
+    start_time : float
+        The absolute start time of the monitoring session (seconds since epoch).
+    data : numpy.ndarray
+        One row per file and sample in which it was read or written, with the ``COLUMNS``.
+    paths : dict
+        ``{file: path}`` of every file.
+    """
+    rows = []
+    paths = {}
+    start_time = 0.0
+    with open(filename, "r") as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            elif line.startswith("START_TIME:"):
+                start_time = float(line.split()[-1])
+                continue
+            elif line.startswith("FILE:"):
+                _, file_id, path = line.rstrip("\n").split(" ", 2)
+                paths[int(file_id)] = path
+                continue
+            rows.append(line.split())
+
+    if cleanup and filename.exists():
+        filename.unlink()
+
+    return start_time, np.array(rows, dtype=float).reshape(-1, len(COLUMNS)), paths
+
+
+def file_matrix(times: np.ndarray, data: np.ndarray) -> tuple:
+    """
+    The rates of every file at the ``times`` of all samples, zero where it was not read or written.
+
+    Returns
+    -------
+    files : numpy.ndarray
+        File ids, in the order of ``FileLog``.
+    series : dict
+        Array of shape (n_files, n_times) for ``read`` and ``write``.
+    """
+    files, row = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    # the samples of the file log are taken at the same times as the others
+    sample = np.clip(np.searchsorted(times, data[:, 0] - 1.0e-6), 0, max(len(times) - 1, 0))
+    series = {}
+    for column, name in ((2, "read"), (3, "write")):
+        values = np.zeros((len(files), len(times)))
+        np.add.at(values, (row.ravel(), sample), data[:, column])
+        series[name] = values
+    return files, series
+
+
+def file_summary(times, files, paths: dict, series: dict, disk_in_bytes: bool = False) -> dict:
+    """Bytes read and written and first and last time of I/O of every file, as columns"""
+    active = (series["read"] > 0.0) | (series["write"] > 0.0)
+    first = np.argmax(active, axis=1)
+    last = active.shape[1] - 1 - np.argmax(active[:, ::-1], axis=1)
+    to_bytes = 1.0e9 if disk_in_bytes else 1.0e9 / 8.0
+    return {
+        "path": [paths.get(int(file_id), "") for file_id in files],
+        "first": times[first] if len(times) else np.zeros(0),
+        "last": times[last] if len(times) else np.zeros(0),
+        "read_bytes": rate_totals(times, series["read"]) * to_bytes,
+        "write_bytes": rate_totals(times, series["write"]) * to_bytes,
+    }
+
+
+def _label(path: str, width: int = 40) -> str:
+    return path if len(path) <= width else "..." + path[3 - width :]
+
+
+def fold_files(files, paths: dict, series: dict, max_lanes: int = MAX_LANES):
+    """
+    Keep a lane for each of the ``max_lanes`` files read and written the most, and fold the others into one.
+
+    Returns
+    -------
+    labels : list[str]
+        Path of every lane kept, shortened, and ``"other (n)"`` for the lane of the n others if there are any.
+    read, write : numpy.ndarray
+        The lanes of the files kept followed by the sum of the others.
+    """
+    used = np.sum(series["read"] + series["write"], axis=1)
+    kept = np.sort(np.argsort(-used, kind="stable")[:max_lanes])
+    folded = np.setdiff1d(np.arange(len(files)), kept)
+    labels = [_label(paths.get(int(files[i]), "")) for i in kept]
+    read_rows, write_rows = [series["read"][kept]], [series["write"][kept]]
+    if len(folded):
+        labels.append("other ({})".format(len(folded)))
+        read_rows.append(series["read"][folded].sum(axis=0)[None])
+        write_rows.append(series["write"][folded].sum(axis=0)[None])
+    return labels, np.concatenate(read_rows), np.concatenate(write_rows)
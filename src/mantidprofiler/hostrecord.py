@@ -0,0 +1,261 @@
+# hostrecord.py - contention from the rest of the node the workflow runs on
+#
+# The fill factor compares the CPU used by the workflow with the threads it was
+# given, as if the node ran nothing else. On a shared analysis node other users
+# take cores, memory and frequency headroom away from it. With a host log,
+# ``sampler.monitor`` also records, at a low rate on the same timeline: the use
+# of every core, the load average, the CPU frequency, the memory in use and the
+# share of time tasks stalled waiting for memory (from /proc/pressure/memory,
+# where available), the CPU used by processes outside of the monitored tree and
+# the processes among them that used the most.
+#
+######################################################################
+
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import psutil
+
+from mantidprofiler.time_util import get_current_time
+
+# columns of the array returned by parse_log, followed by the use of every core in percent
+COLUMNS = ("time", "load", "frequency", "memory_used", "memory_pressure", "other_cpu")
+# seconds between samples of the host, reading every process of the node is too costly to do often
+HOST_INTERVAL = 1.0
+# competing processes recorded per sample at most
+TOP_PROCESSES = 5
+# percentage of a core a process has to use to be recorded as competing
+MIN_COMPETING_CPU = 5.0
+
+_PRESSURE = "/proc/pressure/memory"
+
+
+def _memory_stall() -> Optional[float]:
+    # total microseconds in which some task stalled waiting for memory
+    try:
+        with open(_PRESSURE, "r") as handle:
+            for line in handle:
+                if line.startswith("some"):
+                    return float(line.rsplit("total=", 1)[1])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class HostSampler:
+    """Readings of the whole node, taken every ``interval`` seconds"""
+
+    def __init__(self, interval: float = HOST_INTERVAL, top: int = TOP_PROCESSES):
+        self.interval = interval
+        self.top = top
+        # the first call of cpu_percent sets the baseline of the next one
+        self.num_cores = len(psutil.cpu_percent(percpu=True))
+        self._last_time = get_current_time()
+        self._next_time = self._last_time
+        self._stall = _memory_stall()
+        self._cpu_times = self._process_times()
+        self.sample_time = 0.0
+        self.num_samples = 0
+
+    def due(self, now: float) -> bool:
+        return now >= self._next_time
+
+    @staticmethod
+    def _process_times() -> dict:
+        # {pid: (cpu seconds, name)} of every process of the node
+        times = {}
+        for process in psutil.process_iter(["name", "cpu_times"]):
+            cpu_times = process.info["cpu_times"]
+            if cpu_times is not None:
+                times[process.pid] = (cpu_times.user + cpu_times.system, process.info["name"] or "")
+        return times
+
+    def sample(self, now: float, monitored) -> tuple:
+        """
+        Readings since the previous sample, ignoring the processes of ``monitored`` for the competition.
+
+        Returns
+        -------
+        values : list
+            ``COLUMNS`` after the time, then the use of every core in percent.
+        top : list
+            ``(pid, cpu, name)`` of the processes that used the most CPU, in percent of a core.
+        """
+        start = get_current_time()
+        delta_time = max(now - self._last_time, 1.0e-9)
+        cores = psutil.cpu_percent(percpu=True)
+        try:
+            load = os.getloadavg()[0]
+        except (AttributeError, OSError):  # not available on Windows
+            load = np.nan
+        try:
+            frequency = psutil.cpu_freq().current
+        except (AttributeError, NotImplementedError, FileNotFoundError):
+            frequency = np.nan
+        stall = _memory_stall()
+        pressure = np.nan
+        if stall is not None and self._stall is not None:
+            pressure = 100.0 * (stall - self._stall) * 1.0e-6 / delta_time
+        self._stall = stall
+
+        cpu_times = self._process_times()
+        # the profiler does not compete with the workflow it watches
+        monitored = set(monitored) | {os.getpid()}
+        others = []
+        for pid, (cpu_time, name) in cpu_times.items():
+            if pid in monitored:
+                continue
+            # processes started since the previous sample count from their start
+            before = self._cpu_times.get(pid, (0.0, name))[0]
+            if cpu_time >= before:
+                others.append((100.0 * (cpu_time - before) / delta_time, pid, name))
+        self._cpu_times = cpu_times
+        self._last_time = now
+        self._next_time = now + self.interval
+
+        others.sort(reverse=True)
+        top = [(pid, cpu, name) for cpu, pid, name in others[: self.top] if cpu >= MIN_COMPETING_CPU]
+        other_cpu = sum(cpu for cpu, _, _ in others)
+        values = [load, frequency, psutil.virtual_memory().percent, pressure, other_cpu] + cores
+        self.num_samples += 1
+        self.sample_time += get_current_time() - start
+        return values, top
+
+    def summary(self) -> str:
+        mean = 1.0e3 * self.sample_time / self.num_samples if self.num_samples else 0.0
+        return "Host sampled in {:.3f} ms, {} times".format(mean, self.num_samples)
+
+
+class HostLog:
+    """Writes the samples of ``HostSampler``, with a line per competing process"""
+
+    def __init__(self, logfile: Path, starting_point: float, num_cores: int):
+        self._handle = open(logfile, "w")
+        self._handle.write(
+            "# {0:12s} {1:8s} {2:10s} {3:10s} {4:10s} {5:10s} {6}\n".format(
+                "Elapsed time".center(12),
+                "Load".center(8),
+                "Freq (MHz)".center(10),
+                "Memory (%)".center(10),
+                "Stall (%)".center(10),
+                "Others (%)".center(10),
+                "CPU of every core (%)",
+            )
+        )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+        self._handle.write("CORES: {}\n".format(num_cores))
+
+    def write(self, sample_time, values, top) -> None:
+        load, frequency, memory_used, pressure, other_cpu, *cores = values
+        self._handle.write(
+            "{0:12.6f} {1:8.2f} {2:10.1f} {3:10.1f} {4:10.2f} {5:10.1f} {6}\n".format(
+                sample_time,
+                load,
+                frequency,
+                memory_used,
+                pressure,
+                other_cpu,
+                " ".join("{:.1f}".format(core) for core in cores),
+            )
+        )
+        for pid, cpu, name in top:
+            self._handle.write("PROCESS: {:.6f} {} {:.1f} {}\n".format(sample_time, pid, cpu, name))
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_log(filename: Path, cleanup: bool = True):
+    """
+    Parse the log written by ``HostLog``.
+
+    Returns
+    -------
+    start_time : float
+        The absolute start time of the monitoring session (seconds since epoch).
+    data : numpy.ndarray
+        One row per sample, with the ``COLUMNS`` and then the use of every core.
+    top : list
+        ``(time, pid, cpu, name)`` of the competing processes of every sample.
+    """
+    rows = []
+    top = []
+    start_time = 0.0
+    num_cores = 0
+    with open(filename, "r") as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            elif line.startswith("START_TIME:"):
+                start_time = float(line.split()[-1])
+                continue
+            elif line.startswith("CORES:"):
+                num_cores = int(line.split()[-1])
+                continue
+            elif line.startswith("PROCESS:"):
+                _, sample_time, pid, cpu, name = line.rstrip("\n").split(" ", 4)
+                top.append((float(sample_time), int(pid), float(cpu), name))
+                continue
+            rows.append(line.split())
+
+    if cleanup and filename.exists():
+        filename.unlink()
+
+    return start_time, np.array(rows, dtype=float).reshape(-1, len(COLUMNS) + num_cores), top
+
+
+def competitor_summary(top: list, sync_time: float = 0.0) -> dict:
+    """First and last time, mean and peak CPU of every competing process over the samples it was recorded in,
+    as columns"""
+    by_process: dict = {}
+    for sample_time, pid, cpu, name in top:
+        by_process.setdefault((pid, name), []).append((sample_time - sync_time, cpu))
+    processes = sorted(by_process)
+    samples = [np.array(by_process[process]) for process in processes]
+    return {
+        "pid": [pid for pid, _ in processes],
+        "name": [name for _, name in processes],
+        "first": [float(values[:, 0].min()) for values in samples],
+        "last": [float(values[:, 0].max()) for values in samples],
+        "samples": [len(values) for values in samples],
+        "mean_cpu": [float(values[:, 1].mean()) for values in samples],
+        "max_cpu": [float(values[:, 1].max()) for values in samples],
+    }
+
+
+def contention_fill_factor(cpu_x, cpu, host_x, other_cpu, nthreads: int, num_cores: int) -> tuple:
+    """
+    Fill factor of the cores the other processes of the node left to the workflow.
+
+    The workflow could use at most ``nthreads`` cores, and no more than the ``num_cores`` of the
+    node minus those used by other processes at the time. Each sample of the host holds since the
+    previous one.
+
+    Returns
+    -------
+    fill_factor : float
+        CPU used by the workflow over the CPU it could have used, in percent.
+    taken : float
+        Mean number of cores used by other processes.
+    """
+    cpu_x = np.asarray(cpu_x, dtype=float)
+    if len(cpu_x) < 2 or len(host_x) == 0:
+        return 0.0, 0.0
+    # the host sample that covers every sample of the workflow
+    index = np.clip(np.searchsorted(host_x, cpu_x, side="left"), 0, len(host_x) - 1)
+    taken = np.asarray(other_cpu, dtype=float)[index] / 100.0
+    available = 100.0 * np.clip(num_cores - taken, 0.0, nthreads)
+    dx = np.diff(cpu_x)
+    used = np.sum(0.5 * (cpu[1:] + cpu[:-1]) * dx)
+    possible = np.sum(0.5 * (available[1:] + available[:-1]) * dx)
+    duration = cpu_x[-1] - cpu_x[0]
+    mean_taken = np.sum(0.5 * (taken[1:] + taken[:-1]) * dx) / duration if duration > 0.0 else 0.0
+    return (100.0 * used / possible if possible > 0.0 else 0.0), float(mean_taken)
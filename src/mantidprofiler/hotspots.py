@@ -0,0 +1,151 @@
+# hotspots.py - flat profile of the algorithm calls, aggregated by algorithm name
+#
+# For every algorithm name: the number of calls, their total (inclusive) and self
+# time, the shortest, longest and 95th percentile call and the share of the wall
+# time. Calls nested inside a call of the same name count only once towards the
+# total, so recursive algorithms do not exceed the time they actually ran.
+#
+# With the resources of ``attribution``, also the read and write calls each
+# algorithm made itself, outside of its child algorithms, and the mean bytes per
+# call. Algorithms that made many calls of few bytes are flagged, as this is how
+# reading small chunks of an HDF5 file one at a time shows. Such loops are made
+# of many short calls, so the table is built from every call that was logged,
+# not only those long enough to be drawn.
+#
+######################################################################
+
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+from mantidprofiler.diskrecord import MIN_OPERATIONS, SMALL_OPERATION
+
+# columns of the table, times in seconds and the wall time share in percent
+HOTSPOT_COLUMNS = ("name", "count", "total", "self", "min", "max", "p95", "wall_share")
+# columns added when the calls have their disk I/O, from the calls made by each algorithm itself
+IO_COLUMNS = ("read_ops", "write_ops", "bytes_per_op", "small_io")
+
+
+def nested_in_same_name(forest) -> np.ndarray:
+    """Whether every call runs inside another call of the same algorithm"""
+    nested = np.zeros(len(forest), dtype=bool)
+    ancestor = forest.parent.copy()
+    # climb one level for all calls at a time
+    while True:
+        has_ancestor = ancestor >= 0
+        if not has_ancestor.any():
+            return nested
+        nested[has_ancestor] |= forest.name_id[ancestor[has_ancestor]] == forest.name_id[has_ancestor]
+        ancestor[has_ancestor] = forest.parent[ancestor[has_ancestor]]
+
+
+def hotspots(forest, wall_time: float, window=None) -> dict:
+    """
+    Aggregate the calls of a ``Forest`` by algorithm name.
+
+    Parameters
+    ----------
+    forest : algorithm_tree.Forest
+        The algorithm calls.
+    wall_time : float
+        Duration of the run in seconds, for the share of the wall time.
+    window : tuple, optional
+        Start and finish of the sampled part of the run, in the nanoseconds of the calls. Only the part of
+        every call inside it counts towards the total and self time, so that calls that started before the
+        monitoring do not take more than the wall time. The shortest, longest and 95th percentile call are
+        of the whole calls.
+
+    Returns
+    -------
+    dict
+        One array per entry of ``HOTSPOT_COLUMNS``, and of ``IO_COLUMNS`` if the resources of the
+        calls are known, one entry per algorithm name that was called, sorted by decreasing self time.
+    """
+    num_names = len(forest.names)
+    name_id = forest.name_id
+    duration = forest.duration / 1.0e9
+
+    count = np.bincount(name_id, minlength=num_names)
+    outermost = ~nested_in_same_name(forest)
+    inside = duration
+    if window is not None:
+        inside = np.maximum(np.minimum(forest.finish, window[1]) - np.maximum(forest.start, window[0]), 0) / 1.0e9
+    self_time = inside - forest.child_sum(inside)
+    total = np.bincount(name_id[outermost], weights=inside[outermost], minlength=num_names)
+    self_total = np.bincount(name_id, weights=self_time, minlength=num_names)
+
+    # calls grouped by name in increasing duration, so the order statistics are picked by position
+    order = np.lexsort((duration, name_id))
+    sorted_duration = duration[order]
+    first = np.concatenate(([0], np.cumsum(count)[:-1]))
+    called = count > 0
+    shortest = np.zeros(num_names)
+    longest = np.zeros(num_names)
+    p95 = np.zeros(num_names)
+    shortest[called] = sorted_duration[first[called]]
+    longest[called] = sorted_duration[first[called] + count[called] - 1]
+    # nearest rank percentile
+    rank = np.ceil(0.95 * count[called]).astype(np.int64) - 1
+    p95[called] = sorted_duration[first[called] + rank]
+
+    # a window converted from seconds since the epoch is off by a few hundred nanoseconds, which must not
+    # take a call that covers the whole run over 100%
+    share = np.minimum(100.0 * total / wall_time, 100.0) if wall_time > 0.0 else np.zeros(num_names)
+    table = {
+        "name": np.asarray(forest.names, dtype=object),
+        "count": count,
+        "total": total,
+        "self": self_total,
+        "min": shortest,
+        "max": longest,
+        "p95": p95,
+        "wall_share": share,
+    }
+    columns = HOTSPOT_COLUMNS
+    if "read_ops" in forest.resources:
+        table.update(_self_io(forest, count))
+        columns = columns + IO_COLUMNS
+    rows = np.flatnonzero(called)
+    rows = rows[np.argsort(-self_total[rows], kind="stable")]
+    return {column: table[column][rows] for column in columns}
+
+
+def _self_io(forest, count) -> dict:
+    # I/O calls and bytes of every algorithm outside of its children
+    num_names = len(forest.names)
+    io = {}
+    for name in ("read_ops", "write_ops", "read_bytes", "write_bytes"):
+        values = forest.resources[name]
+        own = np.maximum(values - forest.child_sum(values), 0.0)
+        io[name] = np.bincount(forest.name_id, weights=own, minlength=num_names)
+    operations = io["read_ops"] + io["write_ops"]
+    safe = np.where(operations > 0.0, operations, 1.0)
+    bytes_per_op = np.where(operations > 0.0, (io["read_bytes"] + io["write_bytes"]) / safe, 0.0)
+    small = (operations >= MIN_OPERATIONS * np.maximum(count, 1)) & (bytes_per_op < SMALL_OPERATION)
+    return {
+        "read_ops": io["read_ops"],
+        "write_ops": io["write_ops"],
+        "bytes_per_op": bytes_per_op,
+        "small_io": small,
+    }
+
+
+def rows(table: dict) -> list:
+    """The table as a list of dicts of python values, one per algorithm"""
+    columns = [table[column].tolist() for column in table]
+    return [dict(zip(table, row)) for row in zip(*columns)]
+
+
+def write_hotspots(filename: Path, table: dict) -> None:
+    """Write the table as JSON if ``filename`` ends in ``.json``, otherwise as CSV"""
+    filename = Path(filename)
+    if filename.suffix.lower() == ".json":
+        with open(filename, "w") as handle:
+            json.dump(rows(table), handle, indent=1)
+        return
+    with open(filename, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(table))
+        writer.writeheader()
+        writer.writerows(rows(table))
@@ -0,0 +1,328 @@
+# live.py - live view of the profile, served over HTTP while the process runs
+#
+# The sampling loop of ``sampler`` hands every sample to a LiveReport, which also
+# follows the algorithm timing file as it grows. A page served on localhost plots
+# them as they arrive: it subscribes to a server-sent event stream, and every
+# event only carries the samples and the completed algorithms the page does not
+# have yet. A page opened late gets the history so far, reduced as in the static
+# report, as its first event.
+#
+######################################################################
+
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.colors import stringToColor
+from mantidprofiler.decimate import minmax_indices
+
+# seconds between two events sent to a page
+UPDATE_INTERVAL = 0.5
+# samples kept per update and when sending the history, per series
+POINTS_PER_UPDATE = 10
+HISTORY_POINTS = 10000
+
+# time, cpu (%), real memory (MB), active threads, read and write rates
+_NUM_COLUMNS = 6
+
+LIVE_PAGE = """<head>
+  <meta charset='utf-8'>
+  {plotly}
+</head>
+<body>
+  <div id="status">Running</div>
+  <div id="myDiv"></div>
+  <script>
+var div = document.getElementById('myDiv');
+var series = [
+  {{name: 'CPU', yaxis: 'y1', column: 1, scale: 1.0}},
+  {{name: 'RAM', yaxis: 'y2', column: 2, scale: 0.001}},
+  {{name: 'Active threads', yaxis: 'y1', column: 3, scale: 100.0}},
+  {{name: 'Read', yaxis: 'y3', column: 4, scale: 1.0}},
+  {{name: 'Write', yaxis: 'y3', column: 5, scale: 1.0}},
+];
+var traces = series.map(function(s) {{
+  return {{x: [], y: [], name: s.name, xaxis: 'x', yaxis: s.yaxis, type: 'scattergl', mode: 'lines'}};
+}});
+// invisible markers on top of the algorithm boxes, for the hover text
+traces.push({{x: [], y: [], hovertext: [], hoverinfo: 'text', type: 'scattergl', mode: 'markers',
+              marker: {{size: 8, opacity: 0}}, xaxis: 'x', yaxis: 'y4', showlegend: false}});
+var hoverTrace = traces.length - 1;
+var layout = {{
+  height: {height},
+  xaxis: {{domain: [0, 1.0], title: 'Time (s)', side: 'top'}},
+  yaxis1: {{domain: [0.6, 1.0], title: 'CPU (%)', side: 'left', fixedrange: true}},
+  yaxis2: {{title: 'RAM (GB)', overlaying: 'y1', side: 'right', fixedrange: true, showgrid: false}},
+  yaxis3: {{domain: [0.45, 0.6], anchor: 'x', title: '{disk_unit}', side: 'left', fixedrange: true}},
+  yaxis4: {{domain: [0, 0.45], anchor: 'x', showgrid: false, ticks: '', showticklabels: false, fixedrange: true}},
+  hovermode: 'closest',
+  hoverdistance: 100,
+  legend: {{x: 0, y: 1.1, orientation: 'h'}},
+}};
+Plotly.newPlot(div, traces, layout, {{scrollZoom: true}});
+
+// one trace of boxes per algorithm name, created when the name is first seen
+var algorithmTraces = {{}};
+function addAlgorithms(algorithms, colors) {{
+  var boxes = {{}};
+  var hover = {{x: [], y: [], hovertext: []}};
+  algorithms.forEach(function(alg) {{
+    var name = alg[0], x0 = alg[2], x1 = alg[3], y1 = -alg[4];
+    if (!(name in boxes)) boxes[name] = {{x: [], y: []}};
+    boxes[name].x.push(x0, x0, x1, x1, x0, null);
+    boxes[name].y.push(0, y1, y1, 0, 0, null);
+    var text = name + ' ' + alg[1] + ' : ' + (x1 - x0).toFixed(3) + 's';
+    hover.x.push(x0, 0.5 * (x0 + x1), x1);
+    hover.y.push(y1, y1, y1);
+    hover.hovertext.push(text, text, text);
+  }});
+  Object.keys(boxes).forEach(function(name) {{
+    if (name in algorithmTraces) {{
+      Plotly.extendTraces(div, {{x: [boxes[name].x], y: [boxes[name].y]}}, [algorithmTraces[name]]);
+      return;
+    }}
+    var color = colors[name];
+    Plotly.addTraces(div, {{
+      x: boxes[name].x, y: boxes[name].y, type: 'scattergl', mode: 'lines', fill: 'toself',
+      fillcolor: 'rgb(' + color[0] + ',' + color[1] + ',' + color[2] + ')', line: {{color: '#000000', width: 1.0}},
+      hoverinfo: 'skip', xaxis: 'x', yaxis: 'y4', showlegend: false,
+    }});
+    algorithmTraces[name] = div.data.length - 1;
+  }});
+  if (hover.x.length > 0) {{
+    Plotly.extendTraces(div, {{x: [hover.x], y: [hover.y], hovertext: [hover.hovertext]}}, [hoverTrace]);
+  }}
+}}
+
+var source = new EventSource('events');
+source.onmessage = function(event) {{
+  var delta = JSON.parse(event.data);
+  if (delta.samples.length > 0) {{
+    var update = {{x: [], y: []}};
+    series.forEach(function(s) {{
+      update.x.push(delta.samples.map(function(row) {{ return row[0]; }}));
+      update.y.push(delta.samples.map(function(row) {{ return row[s.column] * s.scale; }}));
+    }});
+    Plotly.extendTraces(div, update, series.map(function(s, i) {{ return i; }}));
+  }}
+  addAlgorithms(delta.algorithms, delta.colors);
+}};
+source.addEventListener('end', function(event) {{
+  source.close();
+  document.getElementById('status').textContent = 'Finished, full report written to ' + JSON.parse(event.data).report;
+}});
+</script>
+</body>
+</html>
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        report = self.server.report
+        if self.path == "/":
+            self._send(200, "text/html; charset=utf-8", report.page().encode())
+        elif self.path == "/events":
+            self._stream(report)
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, code: int, content_type: str, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, report) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        cursor = (0, 0)
+        try:
+            while True:
+                delta, cursor, finished = report.wait_delta(cursor, first=cursor == (0, 0))
+                if delta is not None:
+                    self.wfile.write("data: {}\n\n".format(json.dumps(delta)).encode())
+                if finished:
+                    self.wfile.write("event: end\ndata: {}\n\n".format(json.dumps(finished)).encode())
+                    self.wfile.flush()
+                    return
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):  # the page was closed
+            return
+
+    def log_message(self, *args):  # keep the output of the profiler readable
+        pass
+
+
+class LiveReport:
+    """Collects the samples and completed algorithms of a run and serves them on ``http://localhost:<port>/``"""
+
+    def __init__(
+        self,
+        port: int,
+        infile: Optional[Path] = None,
+        mintime: float = 0.0,
+        disk_in_bytes: bool = False,
+        plotly_js: Optional[str] = None,
+    ):
+        self.port = port
+        self.infile = infile
+        self.mintime = mintime
+        self.disk_in_bytes = disk_in_bytes
+        self.plotly_js = plotly_js
+        self.starting_point = 0.0
+
+        self._condition = threading.Condition()
+        self._samples = np.empty((1024, _NUM_COLUMNS))
+        self._num_samples = 0
+        self._algorithms: list = []
+        self._finished: Optional[dict] = None
+        self._last_times: dict = {}
+
+        # following the algorithm timing file
+        self._offset = 0
+        self._partial = ""
+        self._header: Optional[int] = None
+        self._counters: dict = {}
+        # completed calls of every thread that are not inside another completed call yet
+        self._outermost: dict = {}
+
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self, starting_point: float) -> None:
+        """Start serving, with times counted from ``starting_point``"""
+        self.starting_point = starting_point
+        self._server = ThreadingHTTPServer(("localhost", self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.report = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print("Live profile at http://localhost:{}/".format(self._server.server_address[1]))
+
+    def page(self) -> str:
+        if self.plotly_js is not None:
+            plotly = "<script>\n{}\n</script>".format(self.plotly_js)
+        else:
+            plotly = '<script src="https://cdn.plot.ly/plotly-latest.min.js"></script>'
+        # the height of the algorithm lane is not known ahead, leave room for it
+        return LIVE_PAGE.format(plotly=plotly, height=1000, disk_unit="GBps" if self.disk_in_bytes else "Gbps")
+
+    def add_sample(self, sample_time: float, cpu: float, mem_real: float, threads, rates) -> None:
+        """Record one tick of the sampling loop, ``rates`` being the read and write chars and bytes"""
+        # a thread is active if it is new or its CPU times changed since the previous sample
+        last_times = self._last_times
+        active = 0
+        for tid, user_time, system_time in threads:
+            if last_times.get(tid) != (user_time, system_time):
+                active += 1
+        self._last_times = {tid: (user_time, system_time) for tid, user_time, system_time in threads}
+
+        with self._condition:
+            if self._num_samples == len(self._samples):
+                self._samples = np.concatenate((self._samples, np.empty_like(self._samples)))
+            self._samples[self._num_samples] = (
+                sample_time - self.starting_point,
+                cpu,
+                mem_real,
+                active,
+                rates[0],
+                rates[1],
+            )
+            self._num_samples += 1
+            self._condition.notify_all()
+
+    def read_algorithms(self) -> None:
+        """Pick up the algorithms written to the timing file since the last call"""
+        if self.infile is None:
+            return
+        try:
+            with open(self.infile, "r") as handle:
+                handle.seek(self._offset)
+                text = handle.read()
+                self._offset = handle.tell()
+        except FileNotFoundError:
+            return
+        lines = (self._partial + text).split("\n")
+        # the last line can still be in the middle of being written
+        self._partial = lines.pop()
+
+        algorithms = []
+        for line in lines:
+            if line.startswith("START_POINT:"):
+                self._header = int(line.split()[1])
+            elif "AlgorithmName=" in line and self._header is not None:
+                record = at.parseLine(line)
+                if record["finish"] - record["start"] > self.mintime * 1.0e9:
+                    algorithms.append(self._place(record))
+        if algorithms:
+            with self._condition:
+                self._algorithms.extend(algorithms)
+                self._condition.notify_all()
+
+    def _place(self, record: dict) -> list:
+        # calls complete after everything they called, so the calls nested inside this one are already known
+        # and the box is drawn as tall as the deepest of them plus one. The outermost calls of a thread do not
+        # overlap and are kept sorted by start, so the nested ones are at the end of the list.
+        outermost = self._outermost.setdefault(record["thread_id"], [])
+        first = bisect.bisect_left(outermost, (record["start"],))
+        inside = [call for call in outermost[first:] if call[1] <= record["finish"]]
+        height = 1 + max((call[2] for call in inside), default=0)
+        del outermost[first:]
+        outermost.append((record["start"], record["finish"], height))
+
+        name = record["name"]
+        self._counters[name] = self._counters.get(name, 0) + 1
+        return [
+            name,
+            self._counters[name],
+            (record["start"] + self._header) / 1.0e9 - self.starting_point,
+            (record["finish"] + self._header) / 1.0e9 - self.starting_point,
+            height,
+        ]
+
+    def wait_delta(self, cursor: tuple, first: bool = False):
+        """Wait for data past ``cursor`` and return it with the new cursor and the final message, if any"""
+        with self._condition:
+            # collect what arrives in the meantime, rather than sending every sample separately
+            self._condition.wait_for(lambda: self._finished is not None, timeout=UPDATE_INTERVAL)
+            samples = self._samples[cursor[0] : self._num_samples].copy()
+            algorithms = self._algorithms[cursor[1] :]
+            finished = self._finished
+            new_cursor = (self._num_samples, len(self._algorithms))
+
+        if len(samples) == 0 and not algorithms:
+            return None, new_cursor, finished
+        indices = self._reduce(samples, HISTORY_POINTS if first else POINTS_PER_UPDATE)
+        delta = {
+            "samples": samples[indices].tolist(),
+            "algorithms": algorithms,
+            "colors": {alg[0]: stringToColor(alg[0]) for alg in algorithms},
+        }
+        return delta, new_cursor, finished
+
+    @staticmethod
+    def _reduce(samples: np.ndarray, num_points: int) -> np.ndarray:
+        # keep the peaks of every series
+        if len(samples) <= num_points:
+            return np.arange(len(samples))
+        indices = [minmax_indices(samples[:, 0], samples[:, column], num_points) for column in range(1, _NUM_COLUMNS)]
+        return np.unique(np.concatenate(indices))
+
+    def close(self, report: Optional[Path] = None) -> None:
+        """Tell the pages the run is over and stop serving"""
+        with self._condition:
+            self._finished = {"report": str(report) if report is not None else ""}
+            self._condition.notify_all()
+        if self._server is not None:
+            # give the pages time to receive the last event
+            threading.Event().wait(UPDATE_INTERVAL)
+            self._server.shutdown()
+            self._server.server_close()
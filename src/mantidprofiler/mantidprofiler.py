@@ -17,120 +17,436 @@
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
+import io
+import json
 from pathlib import Path
-from threading import Thread
 
 import argcomplete
 import numpy as np
 
 import mantidprofiler.algorithm_tree as at
 from mantidprofiler import __version__
-from mantidprofiler.diskrecord import monitor as diskmonitor
+from mantidprofiler.attribution import resource_statistics
+from mantidprofiler.binary_log import LOG_FORMATS
+from mantidprofiler.colors import stringToColor
+from mantidprofiler.decimate import bucket_means, minmax_indices, save_full_resolution
+from mantidprofiler.diskrecord import bytes_per_operation
 from mantidprofiler.diskrecord import parse_log as parse_disk_log
-from mantidprofiler.psrecord import monitor as cpumonitor
+from mantidprofiler.filerecord import TOP_FILES, file_matrix, file_summary, fold_files
+from mantidprofiler.filerecord import parse_log as parse_file_log
+from mantidprofiler.hostrecord import COLUMNS as HOST_COLUMNS
+from mantidprofiler.hostrecord import HOST_INTERVAL, competitor_summary, contention_fill_factor
+from mantidprofiler.hostrecord import parse_log as parse_host_log
+from mantidprofiler.hotspots import hotspots, write_hotspots
+from mantidprofiler.memoryrecord import parse_log as parse_memory_log
+from mantidprofiler.processrecord import MAX_LANES, fold_processes, process_summary
+from mantidprofiler.processrecord import parse_log as parse_process_log
 from mantidprofiler.psrecord import parse_log as parse_cpu_log
+from mantidprofiler.report_arrays import DECODE_ARRAYS_JS, EncodedArrays, plotly_bundle
+from mantidprofiler.sampler import COLLECTORS, OptionalLogs, monitor
+from mantidprofiler.scheduler import DEFAULT_MAX_INTERVAL
+from mantidprofiler.trace import write_trace
 
+# number of time buckets of the per-thread CPU heatmap
+THREAD_COLUMNS = 2000
+# numpy 2 renamed trapz to trapezoid and removed trapz later on
+trapezoid = getattr(np, "trapezoid", None) or np.trapz
+# rows shown in the table of algorithm calls
+TABLE_ROWS = 500
+# traces of the columns of the memory log: column, name, label, axis and scale
+MEMORY_TRACES = (
+    (1, "pss", "PSS", "y2", 1.0e-3),
+    (2, "uss", "USS", "y2", 1.0e-3),
+    (3, "swap", "Swap", "y2", 1.0e-3),
+    (4, "minorFaults", "Minor faults", "y7", 1.0),
+    (5, "majorFaults", "Major faults", "y7", 1.0),
+)
+# traces of the columns of the host log on the CPU axis: column, name, label and scale
+HOST_TRACES = (
+    (5, "otherCpu", "Other processes", 1.0),
+    (1, "load", "Load average (x100)", 100.0),
+    (4, "memoryStall", "Memory stall (%)", 1.0),
+)
 
-# Convert string to RGB color
-# This method is simple but does not guarantee uniqueness of the color.
-# It is however random enough for our purposes
-def stringToColor(string):
-    red = 0
-    grn = 0
-    blu = 0
-    for i in range(0, len(string), 3):
-        red += ord(string[i])
-    for i in range(1, len(string), 3):
-        grn += ord(string[i])
-    for i in range(2, len(string), 3):
-        blu += ord(string[i])
-    red %= 255
-    grn %= 255
-    blu %= 255
-    return [red, grn, blu, (red + grn + blu) / 3.0]
-
-
-# Generate HTML output for a tree node
-def treeNodeToHtml(node, lmax, sync_time, header, count, tot_time):
-    x0 = ((node.info[1] + header) / 1.0e9) - sync_time
-    x1 = ((node.info[2] + header) / 1.0e9) - sync_time
-    x2 = 0.5 * (x0 + x1)
-    y0 = 0.0
-    y1 = -(lmax - node.level + 1)
-    dt = x1 - x0
 
-    # Get unique color from algorithm name
-    color = stringToColor(node.info[0].split(" ")[0])
-    # Compute raw time and percentages
-    rawTime = dt
-    if len(node.children) > 0:
-        for ch in node.children:
-            rawTime -= (ch.info[2] - ch.info[1]) / 1.0e9
-    percTot = dt * 100.0 / tot_time
-    percRaw = rawTime * 100.0 / tot_time
-
-    # Create the text inside hover box
-    boxText = node.info[0] + " : "
-    if dt < 0.1:
-        boxText += "%.1E" % dt
-    else:
-        boxText += "%.1f" % dt
-    boxText += "s (%.1f%%) | %.1fs (%.1f%%)<br>" % (percTot, rawTime, percRaw)
-
-    if node.parent is not None:
-        boxText += "Parent: " + node.parent.info[0] + "<br>"
-    if len(node.children) > 0:
-        boxText += "Children: <br>"
-        for ch in node.children:
-            boxText += "  - " + ch.info[0] + "<br>"
-
-    # Create trace
-    base_url = "https://docs.mantidproject.org/nightly/algorithms/"
-    outputString = "trace%i = {\n" % count
-    outputString += "x: [%f, %f, %f, %f, %f],\n" % (x0, x0, x2, x1, x1)
-    outputString += "y: [%f, %f, %f, %f, %f],\n" % (y0, y1, y1, y1, y0)
-    outputString += "fill: 'tozeroy',\n"
-    outputString += "fillcolor: 'rgb(%i,%i,%i)',\n" % (color[0], color[1], color[2])
-    outputString += "line: {\n"
-    outputString += "color: '#000000',\n"
-    outputString += "dash: 'solid',\n"
-    outputString += "shape: 'linear',\n"
-    outputString += "width: 1.0\n"
-    outputString += "},\n"
-    outputString += "mode: 'lines+text',\n"
-    # If the background color is too bright, make the font color black.
-    # Default font color is white
-    if color[3] > 180:
-        textcolor = "#000000"
-    else:
-        textcolor = "#ffffff"
-    outputString += (
-        "text: ['', '', '<a style=\"text-decoration: none; color: %s;\" href=\"%s%s-v1.html\">%s</a>', '', ''],\n"
-        % (textcolor, base_url, node.info[0].split()[0], node.info[0])
-    )
-    outputString += "textposition: 'top',\n"
-    outputString += "hovertext: '" + boxText + "',\n"
-    outputString += "hoverinfo: 'text',\n"
-    outputString += "type: 'scatter',\n"
-    outputString += "xaxis: 'x',\n"
-    outputString += "yaxis: 'y4',\n"
-    outputString += "showlegend: false,\n"
-    outputString += "};\n"
+# Builds the Plotly traces of the algorithm lane from the compact per-call arrays written by writeAlgorithms:
+# one trace of filled rectangles per depth and algorithm name, drawn from the outermost calls inwards,
+# invisible markers along the top of every box for the hover text, and the names of the longer calls.
+# Threads that run calls at the same time get lanes of their own, one under the other
+ALGORITHM_TRACES_JS = """
+function algorithmTraces(alg, lmax, totTime) {
+  var baseUrl = 'https://docs.mantidproject.org/nightly/algorithms/';
+  var maxChildren = 20;
+  var n = alg.start.length;
+  var children = [];
+  for (var i = 0; i < n; i++) children.push([]);
+  for (var i = 0; i < n; i++) if (alg.parent[i] >= 0) children[alg.parent[i]].push(i);
+  function label(i) { return alg.names[alg.name_id[i]] + ' ' + alg.counter[i]; }
+  function seconds(dt) { return dt < 0.1 ? dt.toExponential(1).toUpperCase() : dt.toFixed(1); }
+  function percent(dt) { return (dt * 100.0 / totTime).toFixed(1) + '%'; }
+  var res = alg.resources;
+  // boxes are colored by name, unless other colors are given for every call, as in the diff of two runs
+  var colorId = alg.color_id || alg.name_id;
+
+  var groups = {}, keys = [];
+  var hover = {x: [], y: [], text: [], index: []};
+  var labels = {x: [], y: [], text: [], color: []};
+  for (var i = 0; i < n; i++) {
+    var y0 = alg.lane ? -alg.lane[i] * (lmax + 2) : 0;
+    var x0 = alg.start[i], x1 = alg.finish[i], x2 = 0.5 * (x0 + x1), y1 = y0 - (lmax - alg.depth[i] + 1);
+    var dt = x1 - x0, raw = alg.self_time[i];
+    var key = alg.depth[i] + ':' + colorId[i];
+    if (!(key in groups)) {
+      groups[key] = {x: [], y: [], depth: alg.depth[i], color: colorId[i]};
+      keys.push(key);
+    }
+    groups[key].x.push(x0, x0, x1, x1, x0, null);
+    groups[key].y.push(y0, y1, y1, y0, y0, null);
+
+    var text = label(i) + ' : ' + seconds(dt) + 's (' + percent(dt) + ') | '
+               + raw.toFixed(1) + 's (' + percent(raw) + ')<br>';
+    if (res) {
+      text += 'CPU: ' + res.mean_cpu[i].toFixed(0) + '% mean, ' + res.max_cpu[i].toFixed(0) + '% max<br>'
+              + 'RAM: ' + formatBytes(res.peak_rss[i] * 1048576) + ' peak, '
+              + (res.delta_rss[i] >= 0 ? '+' : '-') + formatBytes(Math.abs(res.delta_rss[i]) * 1048576) + '<br>'
+              + 'Disk: ' + formatBytes(res.read_bytes[i]) + ' read in ' + res.read_ops[i].toFixed(0) + ' calls, '
+              + formatBytes(res.write_bytes[i]) + ' written in ' + res.write_ops[i].toFixed(0) + ' calls<br>'
+              + 'Active threads: ' + res.mean_threads[i].toFixed(1) + '<br>';
+      if (res.peak_pss) {
+        text += 'PSS: ' + formatBytes(res.peak_pss[i] * 1048576) + ' peak, USS: '
+                + formatBytes(res.peak_uss[i] * 1048576) + ' peak<br>';
+      }
+    }
+    if (alg.baseline) {
+      var before = alg.baseline[i];
+      text += before < 0 ? 'Not in the baseline<br>'
+                         : 'Baseline: ' + seconds(before) + 's (' + (dt >= before ? '+' : '')
+                           + (before > 0 ? ((dt - before) * 100.0 / before).toFixed(1) : '0.0') + '%)<br>';
+    }
+    if (alg.parent[i] >= 0) text += 'Parent: ' + label(alg.parent[i]) + '<br>';
+    if (children[i].length > 0) {
+      text += 'Children: <br>';
+      children[i].slice(0, maxChildren).forEach(function(ch) { text += '  - ' + label(ch) + '<br>'; });
+      if (children[i].length > maxChildren) text += '  ... ' + (children[i].length - maxChildren) + ' more<br>';
+    }
+    hover.x.push(x0, x2, x1);
+    hover.y.push(y1, y1, y1);
+    hover.text.push(text, text, text);
+    hover.index.push(i, i, i);
+
+    if (dt >= alg.label_time) {
+      var color = alg.colors[colorId[i]];
+      // If the background color is too bright, make the font color black.
+      var textcolor = color[3] > 180 ? '#000000' : '#ffffff';
+      labels.x.push(x2);
+      labels.y.push(y1);
+      labels.color.push(textcolor);
+      labels.text.push('<a style="text-decoration: none; color: ' + textcolor + ';" href="' + baseUrl
+                       + alg.names[alg.name_id[i]] + '-v1.html">' + label(i) + '</a>');
+    }
+  }
+
+  keys.sort(function(a, b) { return groups[a].depth - groups[b].depth; });
+  var traces = keys.map(function(key) {
+    var color = alg.colors[groups[key].color];
+    return {
+      x: groups[key].x, y: groups[key].y, type: 'scattergl', mode: 'lines', fill: 'toself',
+      fillcolor: 'rgb(' + color[0] + ',' + color[1] + ',' + color[2] + ')',
+      line: {color: '#000000', width: 1.0}, hoverinfo: 'skip', xaxis: 'x', yaxis: 'y4', showlegend: false,
+    };
+  });
+  traces.push({
+    x: hover.x, y: hover.y, hovertext: hover.text, customdata: hover.index, hoverinfo: 'text',
+    type: 'scattergl', mode: 'markers', marker: {size: 8, opacity: 0}, xaxis: 'x', yaxis: 'y4', showlegend: false,
+  });
+  traces.push({
+    x: labels.x, y: labels.y, text: labels.text, textfont: {color: labels.color}, textposition: 'top center',
+    type: 'scatter', mode: 'text', hoverinfo: 'skip', xaxis: 'x', yaxis: 'y4', showlegend: false,
+  });
+  return traces;
+}
+
+function formatBytes(value) {
+  var units = ['B', 'kB', 'MB', 'GB', 'TB'];
+  var unit = 0;
+  while (Math.abs(value) >= 1000 && unit < units.length - 1) {
+    value /= 1000;
+    unit++;
+  }
+  return value.toFixed(unit > 0 ? 1 : 0) + ' ' + units[unit];
+}
+
+// table of the calls with the resources they used, sorted by clicking on a column
+function algorithmTable(alg, element, maxRows) {
+  var res = alg.resources;
+  function number(digits) { return function(value) { return value.toFixed(digits); }; }
+  var columns = [
+    {title: 'Algorithm', value: function(i) { return alg.names[alg.name_id[i]] + ' ' + alg.counter[i]; }},
+    {title: 'Start (s)', value: function(i) { return alg.start[i]; }, format: number(2)},
+    {title: 'Duration (s)', value: function(i) { return alg.finish[i] - alg.start[i]; }, format: number(3)},
+    {title: 'Self (s)', value: function(i) { return alg.self_time[i]; }, format: number(3)},
+  ];
+  if (res) {
+    columns = columns.concat([
+      {title: 'Mean CPU (%)', value: function(i) { return res.mean_cpu[i]; }, format: number(0)},
+      {title: 'Max CPU (%)', value: function(i) { return res.max_cpu[i]; }, format: number(0)},
+      {title: 'Peak RAM', value: function(i) { return res.peak_rss[i] * 1048576; }, format: formatBytes},
+      {title: 'RAM change', value: function(i) { return res.delta_rss[i] * 1048576; }, format: formatBytes},
+      {title: 'Read', value: function(i) { return res.read_bytes[i]; }, format: formatBytes},
+      {title: 'Written', value: function(i) { return res.write_bytes[i]; }, format: formatBytes},
+      {title: 'I/O calls', value: function(i) { return res.read_ops[i] + res.write_ops[i]; }, format: number(0)},
+      {title: 'Bytes per call', value: function(i) {
+        var calls = res.read_ops[i] + res.write_ops[i];
+        return calls > 0 ? (res.read_bytes[i] + res.write_bytes[i]) / calls : null;
+      }, format: formatBytes},
+      {title: 'Active threads', value: function(i) { return res.mean_threads[i]; }, format: number(1)},
+    ]);
+    if (res.peak_pss) {
+      columns.splice(7, 0,
+        {title: 'Peak PSS', value: function(i) { return res.peak_pss[i] * 1048576; }, format: formatBytes},
+        {title: 'Peak USS', value: function(i) { return res.peak_uss[i] * 1048576; }, format: formatBytes});
+    }
+  }
+  sortableTable(element, columns, alg.start.length, 2, maxRows, 'algorithm calls');
+}
+
+// table of the hotspots of hotspots.py, sorted by self time
+function hotspotTable(hot, element) {
+  function number(digits) { return function(value) { return value.toFixed(digits); }; }
+  function column(title, name, digits) {
+    return {title: title, value: function(i) { return hot[name][i]; }, format: number(digits)};
+  }
+  var columns = [
+    {title: 'Algorithm', value: function(i) { return hot.name[i]; }},
+    column('Calls', 'count', 0),
+    column('Total (s)', 'total', 3),
+    column('Self (s)', 'self', 3),
+    column('Min (s)', 'min', 3),
+    column('Max (s)', 'max', 3),
+    column('95th percentile (s)', 'p95', 3),
+    column('Wall time (%)', 'wall_share', 1),
+  ];
+  if (hot.small_io) {
+    columns = columns.concat([
+      column('Read calls', 'read_ops', 0),
+      column('Write calls', 'write_ops', 0),
+      {title: 'Bytes per call', value: function(i) { return hot.bytes_per_op[i]; }, format: formatBytes},
+      {title: 'Small I/O', value: function(i) { return hot.small_io[i] ? 'yes' : ''; }},
+    ]);
+  }
+  sortableTable(element, columns, hot.name.length, 3, hot.name.length, 'algorithms');
+}
+
+// rows 0 to numRows - 1 of the columns, sorted in descending order of sortColumn and then by clicking on a column
+function sortableTable(element, columns, numRows, sortColumn, maxRows, what) {
+  var order = [];
+  for (var i = 0; i < numRows; i++) order.push(i);
+  var descending = true;
+
+  function sort() {
+    var values = order.map(columns[sortColumn].value);
+    var keys = order.map(function(index, k) { return k; });
+    keys.sort(function(a, b) {
+      // missing values last in either direction
+      if (values[a] === null || values[b] === null) return (values[a] === null) - (values[b] === null);
+      var cmp = values[a] < values[b] ? -1 : (values[a] > values[b] ? 1 : 0);
+      return descending ? -cmp : cmp;
+    });
+    order = keys.map(function(k) { return order[k]; });
+  }
+  // the cells are set as text, as file paths and process names may hold markup
+  function cell(tag, text, style) {
+    var node = document.createElement(tag);
+    node.textContent = text;
+    node.style.cssText = style;
+    return node;
+  }
+  function render() {
+    var caption = document.createElement('p');
+    caption.textContent = Math.min(maxRows, order.length) + ' of ' + order.length + ' ' + what
+                          + ', click on a column to sort';
+    var table = document.createElement('table');
+    table.style.borderCollapse = 'collapse';
+    var header = table.insertRow();
+    columns.forEach(function(column, c) {
+      var arrow = c === sortColumn ? (descending ? ' \u25bc' : ' \u25b2') : '';
+      var th = header.appendChild(cell('th', column.title + arrow, 'cursor: pointer; padding: 2px 8px;'));
+      th.dataset.column = c;
+    });
+    order.slice(0, maxRows).forEach(function(i) {
+      var row = table.insertRow();
+      columns.forEach(function(column) {
+        var value = column.value(i);
+        var text = value === null ? '' : (column.format ? column.format(value) : value);
+        row.appendChild(cell('td', text, 'padding: 2px 8px; text-align: right;'));
+      });
+    });
+    element.replaceChildren(caption, table);
+  }
+  element.addEventListener('click', function(event) {
+    var column = event.target.dataset.column;
+    if (column === undefined) return;
+    column = parseInt(column);
+    descending = column === sortColumn ? !descending : true;
+    sortColumn = column;
+    sort();
+    render();
+  });
+  sort();
+  render();
+}
+
+// table of the processes of processrecord.py, sorted by CPU time
+function processTable(proc, element) {
+  function number(digits) { return function(value) { return value.toFixed(digits); }; }
+  var columns = [
+    {title: 'PID', value: function(i) { return proc.pid[i]; }},
+    {title: 'Name', value: function(i) { return proc.name[i]; }},
+    {title: 'Start (s)', value: function(i) { return proc.spawn[i]; }, format: number(2)},
+    {title: 'Exit (s)', value: function(i) { return proc.exit[i]; }, format: number(2)},
+    {title: 'CPU time (s)', value: function(i) { return proc.cpu_time[i]; }, format: number(1)},
+    {title: 'Peak RAM', value: function(i) { return proc.peak_rss[i] * 1048576; }, format: formatBytes},
+    {title: 'Read', value: function(i) { return proc.read_bytes[i]; }, format: formatBytes},
+    {title: 'Written', value: function(i) { return proc.write_bytes[i]; }, format: formatBytes},
+  ];
+  sortableTable(element, columns, proc.pid.length, 4, proc.pid.length, 'processes');
+}
+
+// table of the files of filerecord.py, the ones read and written the most first
+function fileTable(files, element, maxRows) {
+  function number(digits) { return function(value) { return value.toFixed(digits); }; }
+  var columns = [
+    {title: 'File', value: function(i) { return files.path[i]; }},
+    {title: 'First I/O (s)', value: function(i) { return files.first[i]; }, format: number(2)},
+    {title: 'Last I/O (s)', value: function(i) { return files.last[i]; }, format: number(2)},
+    {title: 'Read + written', value: function(i) { return files.read_bytes[i] + files.write_bytes[i]; },
+     format: formatBytes},
+    {title: 'Read', value: function(i) { return files.read_bytes[i]; }, format: formatBytes},
+    {title: 'Written', value: function(i) { return files.write_bytes[i]; }, format: formatBytes},
+  ];
+  sortableTable(element, columns, files.path.length, 3, maxRows, 'files');
+}
+
+// table of the processes of other users of the node of hostrecord.py, sorted by their mean CPU
+function competitorTable(comp, element) {
+  function number(digits) { return function(value) { return value.toFixed(digits); }; }
+  var columns = [
+    {title: 'PID', value: function(i) { return comp.pid[i]; }},
+    {title: 'Name', value: function(i) { return comp.name[i]; }},
+    {title: 'First seen (s)', value: function(i) { return comp.first[i]; }, format: number(1)},
+    {title: 'Last seen (s)', value: function(i) { return comp.last[i]; }, format: number(1)},
+    {title: 'Samples', value: function(i) { return comp.samples[i]; }},
+    {title: 'Mean CPU (%)', value: function(i) { return comp.mean_cpu[i]; }, format: number(0)},
+    {title: 'Max CPU (%)', value: function(i) { return comp.max_cpu[i]; }, format: number(0)},
+  ];
+  sortableTable(element, columns, comp.pid.length, 5, comp.pid.length, 'competing processes');
+}
+
+// clicking an algorithm opens its documentation
+function algorithmDocumentation(alg, event) {
+  var point = event.points[0];
+  if (point.customdata === undefined) return;
+  var name = alg.names[alg.name_id[point.customdata]];
+  window.open('https://docs.mantidproject.org/nightly/algorithms/' + name + '-v1.html');
+}
+"""
+
+
+# Start and finish of the algorithm calls in seconds on the time axis of the plot
+def algorithmTimes(forest, sync_time, header):
+    offset = header or 0  # no header without algorithm timings
+    return (forest.start + offset) / 1.0e9 - sync_time, (forest.finish + offset) / 1.0e9 - sync_time
 
-    return outputString
 
+# Lane of the algorithm plot of every call: threads share a lane unless their calls overlap in time
+def threadLanes(forest):
+    threads, thread_index = np.unique(forest.thread_id, return_inverse=True)
+    first = np.full(len(threads), np.iinfo(np.int64).max)
+    last = np.full(len(threads), np.iinfo(np.int64).min)
+    np.minimum.at(first, thread_index, forest.start)
+    np.maximum.at(last, thread_index, forest.finish)
+    # the first lane that is free when the thread starts its first call
+    lanes = np.zeros(len(threads), dtype=np.int32)
+    busy_until = []
+    for thread in np.argsort(first, kind="stable"):
+        for lane, finish in enumerate(busy_until):
+            if finish <= first[thread]:
+                break
+        else:
+            lane = len(busy_until)
+            busy_until.append(0)
+        busy_until[lane] = last[thread]
+        lanes[thread] = lane
+    return lanes[thread_index.ravel()]
 
-def writeArray(stream, array):
+
+# Write the compact per-call arrays of the algorithm lane
+def writeAlgorithms(stream, forest, sync_time, header, tot_time, label_fraction=0.002, arrays=None):
+    start, finish = algorithmTimes(forest, sync_time, header)
+    duration = forest.duration
+    columns = {
+        "start": (start, np.float64),
+        "finish": (finish, np.float64),
+        "self_time": ((duration - forest.child_sum(duration)) / 1.0e9, np.float32),
+        "depth": (forest.depth, np.int32),
+        "parent": (forest.parent, np.int32),
+        "name_id": (forest.name_id, np.int32),
+        "counter": (forest.counter, np.int32),
+        "lane": (threadLanes(forest), np.int32),
+    }
+
+    stream.write("  var algorithms = {\n")
+    stream.write("    names: {},\n".format(json.dumps(forest.names)))
+    # Get unique color from algorithm name
+    stream.write("    colors: {},\n".format(json.dumps([stringToColor(name) for name in forest.names])))
+    # only calls longer than this get their name written on the plot, to keep it readable
+    stream.write("    label_time: {},\n".format(label_fraction * tot_time))
+    for name, (values, dtype) in columns.items():
+        stream.write("    {}: ".format(name))
+        writeArray(stream, values, arrays, dtype)
+    if forest.resources:
+        stream.write("    resources: {\n")
+        for name, values in forest.resources.items():
+            stream.write("      {}: ".format(name))
+            writeArray(stream, np.round(values, 3), arrays, np.float32)
+        stream.write("    },\n")
+    stream.write("  };\n")
+
+
+# Write an array as text, or as a reference to its copy in the EncodedArrays if supplied
+def writeArray(stream, array, arrays=None, dtype=np.float64):
+    if arrays is not None:
+        stream.write(arrays.add(array, dtype))
+        stream.write(",\n")
+        return
     stream.write("[")
-    stream.write(",".join([str(value) for value in array]))
+    stream.write(",".join([str(value) if value == value else "NaN" for value in array]))
     stream.write("],\n")
 
 
-def writeTrace(stream, x_axis, y_axis, x_name: str, y_name: str, label: str):
+def writeTrace(
+    stream,
+    x_axis,
+    y_axis,
+    x_name: str,
+    y_name: str,
+    label: str,
+    max_points: int = 0,
+    arrays=None,
+    customdata=None,
+    hover=None,
+):
+    # keep the peaks when reducing the series to what the browser can handle
+    indices = minmax_indices(x_axis, y_axis, max_points)
+    # times need double precision on long runs, the readings do not
     stream.write("    x: ")
-    writeArray(stream, x_axis)
+    writeArray(stream, np.asarray(x_axis)[indices], arrays, np.float64)
     stream.write("    y: ")
-    writeArray(stream, y_axis)
+    writeArray(stream, np.asarray(y_axis)[indices], arrays, np.float32)
+    if customdata is not None:
+        stream.write("    customdata: ")
+        writeArray(stream, np.asarray(customdata)[indices], arrays, np.float32)
+        stream.write("  hovertemplate: '{}<extra></extra>',\n".format(hover))
 
     stream.write("  xaxis: '{}',\n".format(x_name))
     stream.write("  yaxis: '{}',\n".format(y_name))
@@ -138,6 +454,46 @@ def writeTrace(stream, x_axis, y_axis, x_name: str, y_name: str, label: str):
     stream.write("  name:'{}',\n".format(label))
 
 
+def writeHeatmap(
+    stream, x_axis, labels, z, y_name: str, label: str, hover: str, arrays=None, customdata=None, zmax: float = 100.0
+):
+    stream.write("    x: ")
+    writeArray(stream, x_axis, arrays, np.float64)
+    stream.write("    y: {},\n".format(json.dumps(labels)))
+    for name, rows in (("z", z), ("customdata", customdata)):
+        if rows is None:
+            continue
+        stream.write("    {}: [\n".format(name))
+        for row in np.round(rows, 1):
+            writeArray(stream, row, arrays, np.float32)
+        stream.write("    ],\n")
+    stream.write("  xaxis: 'x',\n")
+    stream.write("  yaxis: '{}',\n".format(y_name))
+    stream.write("  type: 'heatmap',\n")
+    stream.write("  colorscale: 'Viridis',\n")
+    stream.write("  zmin: 0,\n")
+    stream.write("  zmax: {},\n".format(zmax))
+    stream.write("  showscale: false,\n")
+    stream.write("  hovertemplate: '{}<extra></extra>',\n".format(hover))
+    stream.write("  name:'{}',\n".format(label))
+
+
+# Domains of the lanes of the plot, from the top: CPU, the heatmaps, disk and algorithms
+def laneDomains(heatmaps):
+    if not heatmaps:
+        return {"y1": (0.6, 1.0), "y3": (0.45, 0.6), "y4": (0, 0.45)}
+    domains = {"y1": (0.65, 1.0)}
+    top = 0.63
+    height = {1: 0.13, 2: 0.1}.get(len(heatmaps), 0.08)
+    for axis in heatmaps:
+        domains[axis] = (round(top - height, 3), top)
+        top = round(top - height - 0.02, 3)
+    top = round(top + 0.02, 3)
+    domains["y3"] = (round(top - 0.13, 3), top)
+    domains["y4"] = (0, round(top - 0.13, 3))
+    return domains
+
+
 # Generate HTML interactive plot with Plotly library
 def htmlProfile(
     filename=None,
@@ -146,57 +502,244 @@ def htmlProfile(
     disk_x=None,
     disk_data=None,
     disk_in_bytes=False,
-    algm_records=None,
+    algm_forest=None,
     fill_factor=0,
     nthreads=0,
     lmax=0,
     sync_time=0,
     header=None,
     html_height=800,
+    max_points=0,
+    self_contained=False,
+    compress=False,
+    plotly_js=None,
+    thread_labels=None,
+    thread_data=None,
+    hotspot_table=None,
+    process_labels=None,
+    process_data=None,
+    process_table=None,
+    memory_x=None,
+    memory_data=None,
+    file_labels=None,
+    file_data=None,
+    file_table=None,
+    host_x=None,
+    host_data=None,
+    host_table=None,
+    contention=None,
 ):
-    htmlFile = open(filename, "w")
-    htmlFile.write("<head>\n")
-    htmlFile.write('  <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>\n')
-    htmlFile.write("</head>\n")
-    htmlFile.write("<body>\n")
-    htmlFile.write('  <div id="myDiv"></div>\n')
-    htmlFile.write("  <script>\n")
+    # a self-contained report embeds plotly.js and stores its arrays as base64 typed arrays,
+    # so the plot is written to a buffer first and the arrays it refers to are written ahead of it
+    arrays = EncodedArrays(compress) if self_contained else None
+    htmlFile = io.StringIO()
 
     # CPU
     htmlFile.write("  var trace1 = {\n")
-    writeTrace(htmlFile, x_axis=cpu_x, y_axis=cpu_data[:, 1], x_name="x", y_name="y1", label="CPU")
+    writeTrace(
+        htmlFile,
+        x_axis=cpu_x,
+        y_axis=cpu_data[:, 1],
+        x_name="x",
+        y_name="y1",
+        label="CPU",
+        max_points=max_points,
+        arrays=arrays,
+    )
     htmlFile.write("};\n")
 
     # RAM, in GB
     htmlFile.write("  var trace2 = {\n")
-    writeTrace(htmlFile, x_axis=cpu_x, y_axis=cpu_data[:, 2] / 1000, x_name="x", y_name="y2", label="RAM")
+    writeTrace(
+        htmlFile,
+        x_axis=cpu_x,
+        y_axis=cpu_data[:, 2] / 1000,
+        x_name="x",
+        y_name="y2",
+        label="RAM",
+        max_points=max_points,
+        arrays=arrays,
+    )
     htmlFile.write("};\n")
 
     # Active threads
     htmlFile.write("  var trace3 = {\n")
-    writeTrace(htmlFile, x_axis=cpu_x, y_axis=cpu_data[:, 4] * 100.0, x_name="x", y_name="y1", label="Active threads")
+    writeTrace(
+        htmlFile,
+        x_axis=cpu_x,
+        y_axis=cpu_data[:, 4] * 100.0,
+        x_name="x",
+        y_name="y1",
+        label="Active threads",
+        max_points=max_points,
+        arrays=arrays,
+    )
     htmlFile.write("};\n")
 
     # read chars
     htmlFile.write("  var trace4 = {\n")
-    writeTrace(htmlFile, x_axis=disk_x, y_axis=disk_data[:, 1], x_name="x", y_name="y3", label="Read")
+    writeTrace(
+        htmlFile,
+        x_axis=disk_x,
+        y_axis=disk_data[:, 1],
+        x_name="x",
+        y_name="y3",
+        label="Read",
+        max_points=max_points,
+        arrays=arrays,
+    )
     htmlFile.write("};\n")
 
     # write chars
     htmlFile.write("  var trace5 = {\n")
-    writeTrace(htmlFile, x_axis=disk_x, y_axis=disk_data[:, 2], x_name="x", y_name="y3", label="Write")
+    writeTrace(
+        htmlFile,
+        x_axis=disk_x,
+        y_axis=disk_data[:, 2],
+        x_name="x",
+        y_name="y3",
+        label="Write",
+        max_points=max_points,
+        arrays=arrays,
+    )
     htmlFile.write("};\n")
 
-    count = 6
-    dataString = "[" + ",".join(["trace{}".format(i) for i in range(1, 6)])  # traces that already exist
-    for tree in at.toTrees(algm_records):
-        for node in tree.to_list():
-            htmlFile.write(treeNodeToHtml(node, lmax, sync_time, header, count, cpu_x[-1]))
-            dataString += ",trace%i" % count
-            count += 1
-    dataString += "]"
+    # read and write calls, with the mean bytes per call in their hover text
+    bytes_per_call = bytes_per_operation(disk_data, disk_in_bytes)
+    for number, column, label, call in ((6, 5, "Read calls", "read"), (7, 6, "Write calls", "write")):
+        htmlFile.write("  var trace{} = {{\n".format(number))
+        writeTrace(
+            htmlFile,
+            x_axis=disk_x,
+            y_axis=disk_data[:, column],
+            x_name="x",
+            y_name="y7",
+            label=label,
+            max_points=max_points,
+            arrays=arrays,
+            customdata=bytes_per_call[column - 5],
+            hover="%{{y:.0f}} {0}s/s, %{{customdata:.3s}}B per {0} at %{{x:.1f}}s".format(call),
+        )
+        htmlFile.write("};\n")
 
-    htmlFile.write("var data = " + dataString + ";\n")
+    traces = ["trace{}".format(i) for i in range(1, 8)]
+
+    # proportional and unique memory and swap next to the RAM, in GB, and the page faults next to the disk
+    if memory_data is not None:
+        for column, name, label, y_name, scale in MEMORY_TRACES:
+            htmlFile.write("  var {}Trace = {{\n".format(name))
+            writeTrace(
+                htmlFile,
+                x_axis=memory_x,
+                y_axis=memory_data[:, column] * scale,
+                x_name="x",
+                y_name=y_name,
+                label=label,
+                max_points=max_points,
+                arrays=arrays,
+            )
+            htmlFile.write("};\n")
+            traces.append("{}Trace".format(name))
+
+    # CPU used by each thread, averaged over time buckets
+    if thread_labels:
+        thread_x, thread_z = bucket_means(cpu_x, thread_data, THREAD_COLUMNS)
+        htmlFile.write("  var threadTrace = {\n")
+        writeHeatmap(
+            htmlFile, thread_x, thread_labels, thread_z, "y5", "Threads", "Thread %{y}: %{z:.0f}% at %{x:.1f}s", arrays
+        )
+        htmlFile.write("};\n")
+        traces.append("threadTrace")
+
+    # CPU and memory used by each child process, averaged over time buckets
+    if process_labels:
+        process_x, process_z = bucket_means(process_data[0], np.stack(process_data[1:]), THREAD_COLUMNS)
+        htmlFile.write("  var processTrace = {\n")
+        writeHeatmap(
+            htmlFile,
+            process_x,
+            process_labels,
+            process_z[0],
+            "y6",
+            "Processes",
+            "%{y}: %{z:.0f}% CPU, %{customdata:.0f} MB at %{x:.1f}s",
+            arrays,
+            customdata=process_z[1],
+            # processes use several cores
+            zmax=max(100.0, float(np.nanmax(process_z[0], initial=0.0))),
+        )
+        htmlFile.write("};\n")
+        traces.append("processTrace")
+
+    # bytes read and written to each file, averaged over time buckets
+    if file_labels:
+        file_x, file_z = bucket_means(file_data[0], np.stack(file_data[1:]), THREAD_COLUMNS)
+        unit = "GBps" if disk_in_bytes else "Gbps"
+        htmlFile.write("  var fileTrace = {\n")
+        writeHeatmap(
+            htmlFile,
+            file_x,
+            file_labels,
+            file_z[0] + file_z[1],
+            "y8",
+            "Files",
+            "%{y}: %{z:.3f} " + unit + " read and written at %{x:.1f}s",
+            arrays,
+            zmax=max(float(np.nanmax(file_z[0] + file_z[1], initial=0.0)), 1.0e-6),
+        )
+        htmlFile.write("};\n")
+        traces.append("fileTrace")
+
+    # CPU used by other processes, load and memory stalls of the node next to the CPU of the workflow,
+    # and the use of every core with its frequency
+    core_labels = None
+    if host_data is not None:
+        for column, name, label, scale in HOST_TRACES:
+            if np.isnan(host_data[:, column]).all():
+                continue  # not available on this node
+            htmlFile.write("  var {}Trace = {{\n".format(name))
+            writeTrace(
+                htmlFile,
+                x_axis=host_x,
+                y_axis=host_data[:, column] * scale,
+                x_name="x",
+                y_name="y1",
+                label=label,
+                max_points=max_points,
+                arrays=arrays,
+            )
+            htmlFile.write("};\n")
+            traces.append("{}Trace".format(name))
+        cores = host_data[:, len(HOST_COLUMNS) :].T
+        core_labels = ["Core {}".format(core) for core in range(len(cores))]
+        frequency = np.tile(host_data[:, 2] / 1.0e3, (len(cores), 1))
+        core_x, core_z = bucket_means(host_x, np.stack((cores, frequency)), THREAD_COLUMNS)
+        htmlFile.write("  var coreTrace = {\n")
+        writeHeatmap(
+            htmlFile,
+            core_x,
+            core_labels,
+            core_z[0],
+            "y9",
+            "Cores",
+            "%{y}: %{z:.0f}% at %{x:.1f}s, %{customdata:.2f} GHz",
+            arrays,
+            customdata=core_z[1],
+        )
+        htmlFile.write("};\n")
+        traces.append("coreTrace")
+
+    # lanes of the plot from the top, with the heatmaps of threads, processes, files and cores under the CPU
+    lanes = (("y5", thread_labels), ("y6", process_labels), ("y8", file_labels), ("y9", core_labels))
+    heatmaps = [axis for axis, labels in lanes if labels]
+    domains = laneDomains(heatmaps)
+
+    # algorithms, batched into a few traces
+    writeAlgorithms(htmlFile, algm_forest, sync_time, header, cpu_x[-1], arrays=arrays)
+    htmlFile.write(ALGORITHM_TRACES_JS)
+
+    dataString = "[" + ",".join(traces) + "]"
+    htmlFile.write("var data = {}.concat(algorithmTraces(algorithms, {}, {}));\n".format(dataString, lmax, cpu_x[-1]))
     htmlFile.write("var layout = {\n")
     htmlFile.write("  'height': {},\n".format(html_height))
     htmlFile.write("  'xaxis' : {\n")
@@ -205,7 +748,7 @@ def htmlProfile(
     htmlFile.write("    'side' : 'top',\n")
     htmlFile.write("  },\n")
     htmlFile.write("  'yaxis1': {\n")  # upper - CPU on left
-    htmlFile.write("    'domain' : [0.6, 1.0],\n")
+    htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y1"]))
     htmlFile.write("    'title': 'CPU (%)',\n")
     htmlFile.write("    'side': 'left',\n")
     htmlFile.write("    'fixedrange': true,\n")
@@ -217,8 +760,44 @@ def htmlProfile(
     htmlFile.write("    'fixedrange': true,\n")
     htmlFile.write("    'showgrid': false,\n")
     htmlFile.write("    },\n")
+    if thread_labels:
+        htmlFile.write("  'yaxis5': {\n")  # under the CPU - threads
+        htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y5"]))
+        htmlFile.write("    'anchor' : 'x',\n")
+        htmlFile.write("    'title': 'Threads',\n")
+        htmlFile.write("    'type': 'category',\n")
+        htmlFile.write("    'showticklabels': false,\n")
+        htmlFile.write("    'fixedrange': true,\n")
+        htmlFile.write("    },\n")
+    if process_labels:
+        htmlFile.write("  'yaxis6': {\n")  # under the CPU - child processes
+        htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y6"]))
+        htmlFile.write("    'anchor' : 'x',\n")
+        htmlFile.write("    'title': 'Processes',\n")
+        htmlFile.write("    'type': 'category',\n")
+        htmlFile.write("    'showticklabels': false,\n")
+        htmlFile.write("    'fixedrange': true,\n")
+        htmlFile.write("    },\n")
+    if file_labels:
+        htmlFile.write("  'yaxis8': {\n")  # under the CPU - files
+        htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y8"]))
+        htmlFile.write("    'anchor' : 'x',\n")
+        htmlFile.write("    'title': 'Files',\n")
+        htmlFile.write("    'type': 'category',\n")
+        htmlFile.write("    'showticklabels': false,\n")
+        htmlFile.write("    'fixedrange': true,\n")
+        htmlFile.write("    },\n")
+    if core_labels:
+        htmlFile.write("  'yaxis9': {\n")  # under the CPU - cores of the node
+        htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y9"]))
+        htmlFile.write("    'anchor' : 'x',\n")
+        htmlFile.write("    'title': 'Cores',\n")
+        htmlFile.write("    'type': 'category',\n")
+        htmlFile.write("    'showticklabels': false,\n")
+        htmlFile.write("    'fixedrange': true,\n")
+        htmlFile.write("    },\n")
     htmlFile.write("  'yaxis3': {\n")  # middle - disk
-    htmlFile.write("    'domain' : [0.45, 0.6],\n")
+    htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y3"]))
     htmlFile.write("    'anchor' : 'x',\n")
     if disk_in_bytes:
         htmlFile.write("    'title': 'GBps',\n")
@@ -227,8 +806,18 @@ def htmlProfile(
     htmlFile.write("    'side': 'left',\n")
     htmlFile.write("    'fixedrange': true,\n")
     htmlFile.write("    },\n")
+    htmlFile.write("  'yaxis7': {\n")  # middle - I/O calls and page faults on right
+    if memory_data is not None:
+        htmlFile.write("    'title': 'Calls, faults/s',\n")
+    else:
+        htmlFile.write("    'title': 'Calls/s',\n")
+    htmlFile.write("    'overlaying': 'y3',\n")
+    htmlFile.write("    'side': 'right',\n")
+    htmlFile.write("    'fixedrange': true,\n")
+    htmlFile.write("    'showgrid': false,\n")
+    htmlFile.write("    },\n")
     htmlFile.write("  'yaxis4': {\n")  # lower - algorithm annotations
-    htmlFile.write("    'domain' : [0, 0.45],\n")
+    htmlFile.write("    'domain' : [{}, {}],\n".format(*domains["y4"]))
     htmlFile.write("    'anchor' : 'x',\n")
     htmlFile.write("    'showgrid': false,\n")
     htmlFile.write("    'ticks': '',\n")
@@ -250,7 +839,13 @@ def htmlProfile(
     htmlFile.write("    xanchor: 'right',\n")
     htmlFile.write("    y: 1.1,\n")
     htmlFile.write("    yanchor: 'bottom',\n")
-    htmlFile.write("    text: 'Fill factor: %.1f%%',\n" % fill_factor)
+    if contention is not None:
+        htmlFile.write(
+            "    text: 'Fill factor: %.1f%%, %.1f%% of the cores left by other processes (%.1f used on average)',\n"
+            % (fill_factor, *contention)
+        )
+    else:
+        htmlFile.write("    text: 'Fill factor: %.1f%%',\n" % fill_factor)
     htmlFile.write("    showarrow: false\n")
     htmlFile.write("  }],\n")
     htmlFile.write("  'shapes': [{\n")
@@ -268,8 +863,53 @@ def htmlProfile(
     htmlFile.write("    }],\n")
     htmlFile.write("};\n")
     htmlFile.write("Plotly.newPlot('myDiv', data, layout, {scrollZoom: true});\n")
-    htmlFile.write("</script>\n</body>\n</html>\n")
-    htmlFile.close()
+    htmlFile.write("document.getElementById('myDiv').on('plotly_click', function(event) {\n")
+    htmlFile.write("  algorithmDocumentation(algorithms, event);\n")
+    htmlFile.write("});\n")
+    if hotspot_table is not None:
+        columns = {column: values.tolist() for column, values in hotspot_table.items()}
+        htmlFile.write("var hotspots = {};\n".format(json.dumps(columns)))
+        htmlFile.write("hotspotTable(hotspots, document.getElementById('hotspotTable'));\n")
+    htmlFile.write("algorithmTable(algorithms, document.getElementById('algorithmTable'), {});\n".format(TABLE_ROWS))
+    if process_table is not None:
+        columns = {column: np.asarray(values).tolist() for column, values in process_table.items()}
+        htmlFile.write("var processes = {};\n".format(json.dumps(columns)))
+        htmlFile.write("processTable(processes, document.getElementById('processTable'));\n")
+    if file_table is not None:
+        columns = {column: np.asarray(values).tolist() for column, values in file_table.items()}
+        htmlFile.write("var files = {};\n".format(json.dumps(columns)))
+        htmlFile.write("fileTable(files, document.getElementById('fileTable'), {});\n".format(TOP_FILES))
+    if host_table is not None:
+        htmlFile.write("var competitors = {};\n".format(json.dumps(host_table)))
+        htmlFile.write("competitorTable(competitors, document.getElementById('competitorTable'));\n")
+
+    with open(filename, "w") as outFile:
+        outFile.write("<head>\n")
+        if self_contained:
+            outFile.write("  <meta charset='utf-8'>\n")
+            outFile.write("  <script>\n")
+            outFile.write(plotly_js if plotly_js is not None else plotly_bundle())
+            outFile.write("\n  </script>\n")
+        else:
+            outFile.write('  <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>\n')
+        outFile.write("</head>\n")
+        outFile.write("<body>\n")
+        outFile.write('  <div id="myDiv"></div>\n')
+        outFile.write('  <div id="hotspotTable" style="font-family: sans-serif; font-size: small;"></div>\n')
+        outFile.write('  <div id="algorithmTable" style="font-family: sans-serif; font-size: small;"></div>\n')
+        outFile.write('  <div id="processTable" style="font-family: sans-serif; font-size: small;"></div>\n')
+        outFile.write('  <div id="fileTable" style="font-family: sans-serif; font-size: small;"></div>\n')
+        outFile.write('  <div id="competitorTable" style="font-family: sans-serif; font-size: small;"></div>\n')
+        outFile.write("  <script>\n")
+        if self_contained:
+            outFile.write(DECODE_ARRAYS_JS)
+            arrays.write(outFile)
+            outFile.write("decodeArrays(encodedArrays).then(function(arrays) {\n")
+            outFile.write(htmlFile.getvalue())
+            outFile.write("});\n")
+        else:
+            outFile.write(htmlFile.getvalue())
+        outFile.write("</script>\n</body>\n</html>\n")
 
 
 # Main function to launch process monitor and create interactive HTML plot
@@ -298,8 +938,97 @@ def main(argv=None):
         "--interval",
         type=float,
         help="how long to wait between each sample (in "
-        "seconds). By default the process is sampled "
-        "as often as possible.",
+        "seconds). By default the sampling period adapts "
+        "to how quickly the readings change.",
+    )
+
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adapt the sampling period between INTERVAL, while the readings change or algorithms finish, "
+        "and MAXINTERVAL during steady phases",
+    )
+
+    parser.add_argument(
+        "--maxinterval",
+        type=float,
+        default=DEFAULT_MAX_INTERVAL,
+        help="longest sampling period in seconds when the sampling is adaptive",
+    )
+
+    parser.add_argument(
+        "--logformat",
+        choices=LOG_FORMATS,
+        default="text",
+        help="format of the process monitor logs. The binary format is cheaper to write and to read back.",
+    )
+
+    parser.add_argument(
+        "--collector",
+        choices=COLLECTORS,
+        default="psutil",
+        help="how to read the processes. procfs reads /proc directly and keeps up with shorter intervals (Linux only).",
+    )
+
+    parser.add_argument(
+        "--processfile",
+        type=Path,
+        help="name of output file containing the samples of every process, for a lane per child process in the "
+        "report. Off by default.",
+    )
+
+    parser.add_argument(
+        "--maxprocesses",
+        type=int,
+        default=MAX_LANES,
+        help="processes shown in their own lane at most, the others and those that never use 10%% of a core "
+        "are folded together",
+    )
+
+    parser.add_argument(
+        "--filesfile",
+        type=Path,
+        help="name of output file containing the bytes read from and written to every open file, from the offsets "
+        "in /proc/<pid>/fdinfo, for a table of the files and a lane per file in the report (Linux only). "
+        "Off by default.",
+    )
+
+    parser.add_argument(
+        "--maxfiles",
+        type=int,
+        default=MAX_LANES,
+        help="files shown in their own lane at most, the others are folded together",
+    )
+
+    parser.add_argument(
+        "--hostfile",
+        type=Path,
+        help="name of output file containing the use of every core, load average, CPU frequency, memory pressure "
+        "and the competing processes of the whole node, for contention tracks and a fill factor of the cores "
+        "other processes left. Off by default.",
+    )
+
+    parser.add_argument(
+        "--hostinterval",
+        type=float,
+        default=HOST_INTERVAL,
+        help="seconds between samples of the whole node",
+    )
+
+    parser.add_argument(
+        "--memoryfile",
+        type=Path,
+        help="name of output file containing the PSS, USS, swap and page fault rates of the processes. PSS shares "
+        "the pages mapped by several processes between them, rather than counting them in the RAM of each. "
+        "Off by default, as reading them costs more than the other readings.",
+    )
+
+    parser.add_argument(
+        "--burst",
+        type=float,
+        metavar="INTERVAL",
+        help="sample at least every INTERVAL seconds while the RAM climbs, so that its peaks are captured. "
+        "Off by default.",
     )
 
     parser.add_argument("--noclean", action="store_true", help="remove files upon successful completion")
@@ -315,41 +1044,145 @@ def main(argv=None):
         help="minimum duration for an algorithm to appear in the profiling graph (in seconds).",
     )
 
+    parser.add_argument(
+        "--maxpoints",
+        type=int,
+        default=10000,
+        help="maximum number of points of each time series in the html plot. Series are reduced keeping the "
+        "minimum and maximum of each time bucket. Use 0 to keep all points.",
+    )
+
+    parser.add_argument(
+        "--hotspots",
+        type=Path,
+        help="name of a file to write the time spent in every algorithm to, as JSON if it ends in .json "
+        "and as CSV otherwise",
+    )
+
+    parser.add_argument(
+        "--idlethreads",
+        type=float,
+        default=10.0,
+        help="threads that never use this percentage of a core are shown as a single row of the thread heatmap",
+    )
+
+    parser.add_argument(
+        "--fulldata",
+        type=Path,
+        help="name of a compressed numpy (.npz) file to keep the time series at full resolution in",
+    )
+
+    parser.add_argument(
+        "--archive",
+        type=Path,
+        help="name of a profile archive (SQLite) to add the algorithm calls, time series and metadata of this run "
+        "to, under the name of the output file",
+    )
+
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="name of a Chrome trace file, compressed if it ends in .gz, to write the algorithm calls and time "
+        "series to, for viewing large profiles in https://ui.perfetto.dev",
+    )
+
+    parser.add_argument(
+        "--selfcontained",
+        action="store_true",
+        help="write a report that works offline, with plotly.js embedded and the data stored as binary arrays",
+    )
+
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="compress the data of a self-contained report, for browsers that support DecompressionStream",
+    )
+
+    parser.add_argument(
+        "--plotlyjs",
+        type=Path,
+        help="plotly.js bundle to embed in a self-contained report. By default the copy installed with "
+        "mantidprofiler, or with the plotly python package, is used.",
+    )
+
+    parser.add_argument(
+        "--live",
+        type=int,
+        metavar="PORT",
+        help="serve a live view of the profile on http://localhost:PORT/ while the process runs",
+    )
+
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the time spent on the readings at the end of the monitoring"
+    )
+
     parser.add_argument("--version", action="version", version=f"mantidprofiler {__version__}")
 
     # parse command line arguments
     argcomplete.autocomplete(parser)
     args = parser.parse_args(argv)  # allow getting them supplied to `main()` in tests
 
+    # find plotly.js before the monitoring starts rather than after
+    self_contained = args.selfcontained or args.compress
+    plotly_js = None
+    if self_contained:
+        try:
+            plotly_js = plotly_bundle(args.plotlyjs)
+        except (FileNotFoundError, UnicodeDecodeError) as e:
+            parser.error(str(e))
+
+    live = None
+    if args.live is not None:
+        # imported here as it is only needed for the live view
+        from mantidprofiler.live import LiveReport
+
+        live = LiveReport(args.live, Path(args.infile), args.mintime, args.bytes, plotly_js)
+
     print(f"Attaching to process {args.pid}")
 
-    # start the disk monitor in a separate thread
-    diskthread = Thread(
-        target=diskmonitor,
-        args=(args.pid,),
-        kwargs={"logfile": args.diskfile, "interval": args.interval, "show_bytes": args.bytes},
-    )
-    diskthread.start()
+    command = None
+    if args.archive:
+        # the command line is gone once the process finished
+        import psutil
 
-    # cpu monitor in main thread to prevent early exit
-    cpumonitor(int(args.pid), logfile=args.logfile, interval=args.interval)
+        try:
+            command = psutil.Process(args.pid).cmdline()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
 
-    # wait for disk monitor to finish
-    diskthread.join()
+    # sample CPU, memory and disk together in the main thread
+    monitor(
+        int(args.pid),
+        logfile=args.logfile,
+        diskfile=args.diskfile,
+        interval=args.interval,
+        show_bytes=args.bytes,
+        log_format=args.logformat,
+        collector=args.collector,
+        adaptive=args.adaptive,
+        max_interval=args.maxinterval,
+        infile=Path(args.infile),
+        live=live,
+        burst=args.burst,
+        logs=OptionalLogs(
+            processfile=args.processfile,
+            memoryfile=args.memoryfile,
+            filesfile=args.filesfile,
+            hostfile=args.hostfile,
+            host_interval=args.hostinterval,
+        ),
+        verbose=args.verbose,
+    )
 
     # Read in algorithm timing log and build tree
     try:
-        header, records = at.fromFile(Path(args.infile), cleanup=not args.noclean)
-        records = [x for x in records if x["finish"] - x["start"] > (args.mintime * 1.0e9)]
+        header, all_records, names = at.parseFile(Path(args.infile), cleanup=not args.noclean)
         # Number of threads allocated to this run
         nthreads = int(header.split()[3])
         # Run start time
         header = int(header.split()[1])
-        # Find maximum level in all trees
-        lmax = 0
-        for tree in at.toTrees(records):
-            for node in tree.to_list():
-                lmax = max(node.level, lmax)
+        # Build the trees once, with every call for the hotspots and the resources
+        calls = at.Forest.from_record_array(all_records, names)
     except FileNotFoundError as e:
         print("failed to load file:", e.filename)
         print("creating plot without algorithm annotations")
@@ -357,26 +1190,88 @@ def main(argv=None):
         import psutil
 
         nthreads = psutil.cpu_count()
-        lmax = 1
         header = ""
-        records = []
-
-    # Read in disk usage - sync_time will be overwritten by cpu below
-    args.diskfile = Path(args.diskfile)
-    sync_time, disk_data = parse_disk_log(args.diskfile, cleanup=not args.noclean)
-    # Time series
-    disk_x = disk_data[:, 0] - sync_time
+        calls = at.Forest.from_records([])
+        all_records = np.empty(0, dtype=at.RECORD_DTYPE)
+        names = []
 
     # Read in CPU and memory activity log
-    sync_time, cpu_data = parse_cpu_log(args.logfile, cleanup=not args.noclean)
+    sync_time, cpu_data, (thread_labels, thread_data) = parse_cpu_log(
+        args.logfile, cleanup=not args.noclean, threads=True, min_peak=args.idlethreads
+    )
     # Time series
     cpu_x = cpu_data[:, 0] - sync_time
+
+    # Read in disk usage, sampled at the same times as the CPU
+    args.diskfile = Path(args.diskfile)
+    _, disk_data = parse_disk_log(args.diskfile, cleanup=not args.noclean)
+    disk_x = cpu_x
+
+    # CPU, memory and I/O of every process
+    process_labels, process_data, process_table = None, None, None
+    if args.processfile:
+        _, process_log, process_names = parse_process_log(Path(args.processfile), cleanup=not args.noclean)
+        process_table = process_summary(process_log, process_names, sync_time, args.bytes)
+        process_times, process_labels, process_cpu, process_rss = fold_processes(
+            process_log, process_names, args.maxprocesses
+        )
+        process_data = (process_times - sync_time, process_cpu, process_rss)
+
+    # bytes read and written to every file
+    file_labels, file_data, file_table = None, None, None
+    if args.filesfile:
+        _, file_log, file_paths = parse_file_log(Path(args.filesfile), cleanup=not args.noclean)
+        files, file_series = file_matrix(cpu_data[:, 0], file_log)
+        file_table = file_summary(cpu_x, files, file_paths, file_series, args.bytes)
+        file_labels, file_read, file_write = fold_files(files, file_paths, file_series, args.maxfiles)
+        file_data = (cpu_x, file_read, file_write)
+
+    # proportional and unique memory, swap and page faults
+    memory_x, memory_data = None, None
+    if args.memoryfile:
+        _, memory_data = parse_memory_log(Path(args.memoryfile), cleanup=not args.noclean)
+        memory_x = memory_data[:, 0] - sync_time
+
+    # resources used by every algorithm call
+    calls.resources = resource_statistics(
+        *algorithmTimes(calls, sync_time, header),
+        cpu_x,
+        cpu_data,
+        disk_x,
+        disk_data,
+        args.bytes,
+        memory_x=memory_x,
+        memory_data=memory_data,
+    )
     print(sync_time)
 
+    # time spent in every algorithm, summed over all of its calls however short, within the sampled window
+    window = ((cpu_x[[0, -1]] + sync_time) * 1.0e9 - (header or 0)).astype(np.int64)
+    hotspot_table = hotspots(calls, cpu_x[-1] - cpu_x[0], window)
+    if args.hotspots:
+        write_hotspots(args.hotspots, hotspot_table)
+    for name, bytes_per_op in zip(
+        hotspot_table["name"][hotspot_table["small_io"]], hotspot_table["bytes_per_op"][hotspot_table["small_io"]]
+    ):
+        print("{} is dominated by small I/O calls of {:.0f} bytes on average".format(name, bytes_per_op))
+
+    # only the calls longer than mintime are drawn, with the callers of every call drawn
+    forest = calls.select(calls.duration > args.mintime * 1.0e9)
+    lmax = forest.max_depth if len(forest) else 1
+
     # Integrate under the curve and compute CPU usage fill factor
-    area_under_curve = np.trapz(cpu_data[:, 1], x=cpu_x)
+    area_under_curve = trapezoid(cpu_data[:, 1], x=cpu_x)
     fill_factor = area_under_curve / ((cpu_x[-1] - cpu_x[0]) * nthreads)
 
+    # use of the node by other processes, and the fill factor of the cores they left to the workflow
+    host_x, host_data, host_table, contention = None, None, None, None
+    if args.hostfile:
+        _, host_data, competitors = parse_host_log(Path(args.hostfile), cleanup=not args.noclean)
+        host_x = host_data[:, 0] - sync_time
+        host_table = competitor_summary(competitors, sync_time)
+        num_cores = host_data.shape[1] - len(HOST_COLUMNS)
+        contention = contention_fill_factor(cpu_x, cpu_data[:, 1], host_x, host_data[:, 5], nthreads, num_cores)
+
     # Create HTML output with Plotly
     htmlProfile(
         filename=args.outfile,
@@ -385,11 +1280,89 @@ def main(argv=None):
         disk_x=disk_x,
         disk_data=disk_data,
         disk_in_bytes=args.bytes,
-        algm_records=records,
+        algm_forest=forest,
         fill_factor=fill_factor,
+        contention=contention,
         nthreads=nthreads,
         lmax=lmax,
         sync_time=sync_time,
         header=header,
         html_height=args.height,
+        max_points=args.maxpoints,
+        thread_labels=thread_labels,
+        thread_data=thread_data,
+        hotspot_table=hotspot_table,
+        process_labels=process_labels,
+        process_data=process_data,
+        process_table=process_table,
+        memory_x=memory_x,
+        memory_data=memory_data,
+        file_labels=file_labels,
+        file_data=file_data,
+        file_table=file_table,
+        host_x=host_x,
+        host_data=host_data,
+        host_table=host_table,
+        self_contained=self_contained,
+        compress=args.compress,
+        plotly_js=plotly_js,
     )
+
+    if live is not None:
+        live.close(args.outfile)
+
+    if args.archive:
+        # imported here as it is only needed for the archive
+        from mantidprofiler.archive import ProfileArchive
+
+        series = {"cpu": cpu_data, "disk": disk_data}
+        if memory_data is not None:
+            series["memory"] = memory_data
+        with ProfileArchive(args.archive) as archive:
+            run_id = archive.add_run(
+                calls,
+                header=header or 0,
+                sync_time=sync_time,
+                nthreads=nthreads,
+                series=series,
+                command=command,
+                name=Path(args.outfile).stem,
+                metadata={"mantidprofiler": __version__, "outfile": str(args.outfile)},
+            )
+        print("Archived as run {} of {}".format(run_id, args.archive))
+
+    if args.trace:
+        write_trace(
+            args.trace,
+            [(header or 0, all_records, names)],
+            sync_time,
+            cpu_data,
+            disk_data,
+            disk_in_bytes=args.bytes,
+            memory_data=memory_data,
+        )
+
+    if args.fulldata:
+        series = {
+            "sync_time": sync_time,
+            "cpu_x": cpu_x,
+            "cpu_data": cpu_data,
+            "disk_x": disk_x,
+            "disk_data": disk_data,
+            "thread_labels": thread_labels,
+            "thread_usage": thread_data,
+        }
+        # the rows of the other logs as they were read, with absolute times
+        if args.processfile:
+            series["process_log"] = process_log
+            series["process_pids"] = list(process_names)
+            series["process_names"] = [name for _, name in process_names.values()]
+        if args.filesfile:
+            series["file_log"] = file_log
+            series["file_ids"] = list(file_paths)
+            series["file_paths"] = list(file_paths.values())
+        if memory_data is not None:
+            series["memory_data"] = memory_data
+        if host_data is not None:
+            series["host_data"] = host_data
+        save_full_resolution(args.fulldata, **series)
@@ -0,0 +1,224 @@
+# memoryrecord.py - proportional and unique memory, swap and page faults
+#
+# The real memory of the CPU/memory log adds up the RSS of the monitored process
+# and its children, which counts the pages that forked workers share once per
+# worker. With a memory log, ``sampler.monitor`` also records the proportional
+# set size (PSS, shared pages divided between the processes that map them), the
+# unique set size (USS, pages of a single process), the swap and the rates of
+# minor and major page faults. On Linux these come from /proc/<pid>/smaps_rollup
+# and /proc/<pid>/stat, kept open between ticks. The kernel walks every mapping
+# to fill in smaps_rollup, so this costs more than the other readings and is off
+# by default.
+#
+######################################################################
+
+import errno
+import os
+from collections import namedtuple
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import psutil
+
+from mantidprofiler.procfs import ProcFile, stat_fields
+
+# columns of the array returned by parse_log
+COLUMNS = ("time", "pss", "uss", "swap", "minor_faults", "major_faults")
+
+# readings of one process: sizes in bytes and page faults since the process started
+pmemory = namedtuple("pmemory", ["pss", "uss", "swap", "minor_faults", "major_faults"])
+
+# fields of /proc/<pid>/stat counted from the one after the command name
+_MINFLT = 7
+_MAJFLT = 9
+
+
+def available() -> bool:
+    return os.path.exists("/proc/self/smaps_rollup")
+
+
+class ProcMemoryReader:
+    """Memory and page faults of one process from /proc"""
+
+    def __init__(self, process: psutil.Process):
+        self.pid = process.pid
+        root = "/proc/{}/".format(self.pid)
+        try:
+            self._stat = ProcFile(root + "stat")
+        except FileNotFoundError:
+            raise psutil.NoSuchProcess(self.pid)
+        try:
+            self._rollup = ProcFile(root + "smaps_rollup")
+        except PermissionError:  # needs the same permissions as attaching a debugger
+            self._stat.close()
+            raise psutil.AccessDenied(self.pid)
+        except FileNotFoundError:
+            self._stat.close()
+            raise psutil.NoSuchProcess(self.pid)
+
+    def _read(self, procfile: ProcFile) -> memoryview:
+        try:
+            return procfile.read()
+        except OSError as e:
+            if e.errno in (errno.ESRCH, errno.ENOENT):
+                raise psutil.NoSuchProcess(self.pid)
+            raise
+
+    def sample(self) -> pmemory:
+        sizes = {b"Pss:": 0, b"Private_Clean:": 0, b"Private_Dirty:": 0, b"Swap:": 0}
+        # the first line is the range of addresses, the others are "Name: value kB"
+        for line in bytes(self._read(self._rollup)).splitlines()[1:]:
+            fields = line.split()
+            if fields and fields[0] in sizes:
+                sizes[fields[0]] = int(fields[1]) * 1024
+        fields = stat_fields(self._read(self._stat))
+        return pmemory(
+            sizes[b"Pss:"],
+            sizes[b"Private_Clean:"] + sizes[b"Private_Dirty:"],
+            sizes[b"Swap:"],
+            int(fields[_MINFLT]),
+            int(fields[_MAJFLT]),
+        )
+
+    def close(self) -> None:
+        self._stat.close()
+        self._rollup.close()
+
+
+class PsutilMemoryReader:
+    """Memory of one process through psutil, where there is no smaps_rollup. Page faults are not available."""
+
+    def __init__(self, process: psutil.Process):
+        self.process = process
+        self.pid = process.pid
+
+    def sample(self) -> pmemory:
+        memory = self.process.memory_full_info()
+        return pmemory(
+            getattr(memory, "pss", memory.rss), getattr(memory, "uss", memory.rss), getattr(memory, "swap", 0), 0, 0
+        )
+
+    def close(self) -> None:
+        pass
+
+
+def get_memory_reader_type():
+    if available():
+        return ProcMemoryReader
+    print("/proc/<pid>/smaps_rollup is not available, reading the memory through psutil without page faults")
+    return PsutilMemoryReader
+
+
+class MemoryLog:
+    """Writes the memory of the monitored processes, summed over them, at every sample of ``sampler.monitor``"""
+
+    def __init__(self, logfile: Path, starting_point: float):
+        self._handle = open(logfile, "w")
+        self._handle.write(
+            "# {0:12s} {1:12s} {2:12s} {3:12s} {4:14s} {5:14s}\n".format(
+                "Elapsed time".center(12),
+                "PSS (MB)".center(12),
+                "USS (MB)".center(12),
+                "Swap (MB)".center(12),
+                "Minor faults/s".center(14),
+                "Major faults/s".center(14),
+            )
+        )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+
+    def write(self, sample_time, pss, uss, swap, minor_faults, major_faults) -> None:
+        self._handle.write(
+            "{0:12.6f} {1:12.3f} {2:12.3f} {3:12.3f} {4:14.1f} {5:14.1f}\n".format(
+                sample_time, pss, uss, swap, minor_faults, major_faults
+            )
+        )
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemorySampler:
+    """
+    Sums the memory of a changing set of processes and turns their page fault counts into rates.
+
+    A reader is kept for every process between ticks. Processes that are new since the previous
+    tick count with all of their page faults, like the I/O of new processes in ``sampler``.
+    """
+
+    def __init__(self, make_reader=None):
+        self.make_reader = make_reader or get_memory_reader_type()
+        self.readers: dict = {}
+        self._faults: dict = {}
+
+    def update(self, processes: dict) -> None:
+        """Keep one reader for every process of ``{pid: psutil.Process}``"""
+        for pid in [pid for pid in self.readers if pid not in processes]:
+            self.readers.pop(pid).close()
+        for pid, process in processes.items():
+            if pid not in self.readers:
+                try:
+                    self.readers[pid] = self.make_reader(process)
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+
+    def sample(self, delta_time: Optional[float]) -> tuple:
+        """PSS, USS and swap in MB and the minor and major page faults per second since the previous
+        sample, or ``None`` for the first one"""
+        sizes = [0, 0, 0]
+        faults = [0, 0]
+        counts = {}
+        for pid, reader in self.readers.items():
+            try:
+                memory = reader.sample()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            sizes[0] += memory.pss
+            sizes[1] += memory.uss
+            sizes[2] += memory.swap
+            minor_before, major_before = self._faults.get(pid, (0, 0))
+            faults[0] += memory.minor_faults - minor_before
+            faults[1] += memory.major_faults - major_before
+            counts[pid] = (memory.minor_faults, memory.major_faults)
+        self._faults = counts
+        to_rate = 1.0 / delta_time if delta_time else 0.0
+        return tuple(size / 1024.0**2 for size in sizes) + tuple(to_rate * fault for fault in faults)
+
+    def close(self) -> None:
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+
+
+def parse_log(filename: Path, cleanup: bool = True):
+    """
+    Parse the log written by ``MemoryLog``.
+
+    Returns
+    -------
+    start_time : float
+        The absolute start time of the monitoring session (seconds since epoch).
+    data : numpy.ndarray
+        One row per sample, with the ``COLUMNS``.
+    """
+    rows = []
+    start_time = 0.0
+    with open(filename, "r") as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            elif line.startswith("START_TIME:"):
+                start_time = float(line.split()[-1])
+                continue
+            rows.append(line.split())
+
+    if cleanup and filename.exists():
+        filename.unlink()
+
+    return start_time, np.array(rows, dtype=float).reshape(-1, len(COLUMNS))
@@ -0,0 +1,194 @@
+# processrecord.py - samples of every process of a multi-process workflow
+#
+# The CPU/memory and disk logs add up the monitored process and all of its
+# children. With a process log, ``sampler.monitor`` also writes one line per
+# process and sample: its CPU, real memory and I/O rates. A process is named by
+# a ``PROCESS:`` line the first time it is seen, and lives from its first to its
+# last sample. Workflows may start many short-lived workers, so the report folds
+# the processes that are rarely busy into a single lane.
+#
+######################################################################
+
+from pathlib import Path
+
+import numpy as np
+
+# columns of the array returned by parse_log
+COLUMNS = ("time", "pid", "cpu", "real_mb", "read", "write")
+# processes shown in their own lane of the report at most, the others are folded together
+MAX_LANES = 8
+
+
+class ProcessLog:
+    """Writes one line per process and sample of ``sampler.monitor``"""
+
+    def __init__(self, logfile: Path, starting_point: float):
+        self._handle = open(logfile, "w")
+        self._handle.write(
+            "# {0:12s} {1:8s} {2:10s} {3:12s} {4:12s} {5:12s}\n".format(
+                "Elapsed time".center(12),
+                "PID".center(8),
+                "CPU (%)".center(10),
+                "Real (MB)".center(12),
+                "Read".center(12),
+                "Write".center(12),
+            )
+        )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+        self._named: set = set()
+
+    def name(self, pid: int, ppid: int, name: str) -> None:
+        """Record the parent and name of a process, once"""
+        if pid not in self._named:
+            self._named.add(pid)
+            self._handle.write("PROCESS: {} {} {}\n".format(pid, ppid, name))
+
+    def is_named(self, pid: int) -> bool:
+        return pid in self._named
+
+    def write(self, sample_time, pid, cpu, mem_real, read, write) -> None:
+        self._handle.write(
+            "{0:12.6f} {1:8d} {2:10.3f} {3:12.3f} {4:12.6f} {5:12.6f}\n".format(
+                sample_time, pid, cpu, mem_real, read, write
+            )
+        )
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_log(filename: Path, cleanup: bool = True):
+    """
+    Parse the log written by ``ProcessLog``.
+
+    Returns
+    -------
+    start_time : float
+        The absolute start time of the monitoring session (seconds since epoch).
+    data : numpy.ndarray
+        One row per process and sample, with the ``COLUMNS``.
+    names : dict
+        ``{pid: (ppid, name)}`` of every process.
+    """
+    rows = []
+    names = {}
+    start_time = 0.0
+    with open(filename, "r") as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            elif line.startswith("START_TIME:"):
+                start_time = float(line.split()[-1])
+                continue
+            elif line.startswith("PROCESS:"):
+                _, pid, ppid, name = line.rstrip("\n").split(" ", 3)
+                names[int(pid)] = (int(ppid), name)
+                continue
+            rows.append(line.split())
+
+    if cleanup and filename.exists():
+        filename.unlink()
+
+    return start_time, np.array(rows, dtype=float).reshape(-1, len(COLUMNS)), names
+
+
+def process_index(data: np.ndarray) -> tuple:
+    """
+    Where every row of the process log goes on the common timeline of all samples.
+
+    Returns
+    -------
+    times : numpy.ndarray
+        Time of every sample.
+    sample : numpy.ndarray
+        Index in ``times`` of every row.
+    pids : numpy.ndarray
+        Process ids, in the order the processes were first seen.
+    rank : numpy.ndarray
+        Index in ``pids`` of every row.
+    """
+    times, sample = np.unique(data[:, 0], return_inverse=True)
+    pids, first_index, row = np.unique(data[:, 1].astype(np.int64), return_index=True, return_inverse=True)
+    # order the processes by when they were first seen
+    order = np.argsort(first_index, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return times, sample.ravel(), pids[order], rank[row.ravel()]
+
+
+def rate_totals(times, rates) -> np.ndarray:
+    """Sum over the last axis of ``rates`` sampled at ``times``, each rate holding since the previous sample"""
+    dt = np.diff(times, prepend=times[0] if len(times) else 0.0)
+    return np.nansum(rates * dt, axis=-1)
+
+
+def process_summary(data: np.ndarray, names: dict, start_time: float = 0.0, disk_in_bytes: bool = False) -> dict:
+    """Lifetime since ``start_time``, CPU time, peak memory and bytes read and written of every process, as
+    columns"""
+    times, sample, pids, rank = process_index(data)
+    num = len(pids)
+    # every rate holds since the previous sample of any process
+    dt = np.diff(times, prepend=times[0] if len(times) else 0.0)[sample]
+    first = np.full(num, len(times), dtype=np.int64)
+    last = np.zeros(num, dtype=np.int64)
+    peak_rss = np.zeros(num)
+    np.minimum.at(first, rank, sample)
+    np.maximum.at(last, rank, sample)
+    np.maximum.at(peak_rss, rank, data[:, 3])
+    to_bytes = 1.0e9 if disk_in_bytes else 1.0e9 / 8.0
+    return {
+        "pid": pids.tolist(),
+        "name": [names.get(int(pid), (0, ""))[1] for pid in pids],
+        "spawn": times[first] - start_time,
+        "exit": times[last] - start_time,
+        "cpu_time": np.bincount(rank, data[:, 2] * dt, num) / 100.0,
+        "peak_rss": peak_rss,
+        "read_bytes": np.bincount(rank, data[:, 4] * dt, num) * to_bytes,
+        "write_bytes": np.bincount(rank, data[:, 5] * dt, num) * to_bytes,
+    }
+
+
+def fold_processes(data: np.ndarray, names: dict, max_lanes: int = MAX_LANES, min_peak: float = 10.0):
+    """
+    Keep a lane for each of the ``max_lanes`` processes that used the most CPU and ever used ``min_peak``
+    percent of a core, and fold the others into a single lane. The lanes are built from the rows of the
+    process log once the processes to keep are known, so there is no series for every process.
+
+    Returns
+    -------
+    times : numpy.ndarray
+        Time of every sample.
+    labels : list[str]
+        ``"pid name"`` of every lane kept, and ``"other (n)"`` for the lane of the n others if there are any.
+    cpu, real_mb : numpy.ndarray
+        The lanes of the processes kept followed by the sum of the others, NaN where no process of a lane runs.
+    """
+    times, sample, pids, rank = process_index(data)
+    num = len(pids)
+    peak = np.zeros(num)
+    np.maximum.at(peak, rank, data[:, 2])
+    used = np.bincount(rank, data[:, 2], num)
+    candidates = np.flatnonzero(peak >= min_peak)
+    kept = np.sort(candidates[np.argsort(-used[candidates], kind="stable")[:max_lanes]])
+    labels = ["{} {}".format(int(pids[i]), names.get(int(pids[i]), (0, ""))[1]).strip() for i in kept]
+    # the folded processes all go to the last lane
+    lane = np.full(num, len(kept), dtype=np.int64)
+    lane[kept] = np.arange(len(kept))
+    if len(kept) < num:
+        labels.append("other ({})".format(num - len(kept)))
+
+    shape = (len(labels), len(times))
+    running = np.zeros(shape, dtype=bool)
+    running[lane[rank], sample] = True
+    lanes = []
+    for column in (2, 3):
+        values = np.zeros(shape)
+        np.add.at(values, (lane[rank], sample), data[:, column])
+        lanes.append(np.where(running, values, np.nan))
+    return times, labels, lanes[0], lanes[1]
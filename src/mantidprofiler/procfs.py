@@ -0,0 +1,180 @@
+# procfs.py - direct /proc reader for high frequency sampling on Linux
+#
+# Keeps descriptors open on /proc/<pid>/stat, statm, io and task/<tid>/stat and
+# re-reads them with pread into preallocated buffers, instead of creating the
+# psutil objects and opening the files again on every sample. The fields are
+# picked out of the buffers in place, without copying what was read.
+#
+######################################################################
+
+import errno
+import os
+import re
+import sys
+from collections import namedtuple
+from typing import Optional
+
+import psutil
+
+from mantidprofiler.sampler import ProcessSample, PsutilReader
+from mantidprofiler.time_util import get_current_time
+
+# same names and fields as the psutil tuples, so the logs look the same for both collectors
+pmem = namedtuple("pmem", ["rss", "vms"])
+pio = namedtuple("pio", ["read_count", "write_count", "read_bytes", "write_bytes", "read_chars", "write_chars"])
+pthread = namedtuple("pthread", ["id", "user_time", "system_time"])
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# fields of /proc/<pid>/stat counted from the one after the command name
+_STATE = 0
+_UTIME = 11
+_STIME = 12
+_NUM_THREADS = 17
+
+_BUFFER_SIZE = 4096
+_FIELD = re.compile(rb"\S+")
+
+
+def available() -> bool:
+    return sys.platform.startswith("linux") and hasattr(os, "preadv") and os.path.exists("/proc/self/stat")
+
+
+class ProcFile:
+    """A /proc file kept open and re-read from the start into the same buffer"""
+
+    __slots__ = ("fd", "buffer")
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(_BUFFER_SIZE)
+
+    def read(self) -> memoryview:
+        """The content of the file, as a view of the buffer that is only valid until the next read"""
+        size = os.preadv(self.fd, [self.buffer], 0)
+        if size == len(self.buffer):  # grow for files larger than the buffer
+            self.buffer = bytearray(2 * len(self.buffer))
+            return self.read()
+        return memoryview(self.buffer)[:size]
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _fields(data: memoryview) -> list:
+    # whitespace separated fields
+    return _FIELD.findall(data)
+
+
+def stat_fields(data: memoryview) -> list:
+    """Fields of a /proc/<pid>/stat file after the command name, which is in parentheses and can contain spaces"""
+    return _FIELD.findall(data, data.obj.rindex(b")", 0, len(data)) + 2)
+
+
+class ProcfsReader:
+    """Drop-in replacement for the psutil readings of one process in ``sampler``"""
+
+    def __init__(self, process: psutil.Process):
+        self.pid = process.pid
+        root = "/proc/{}/".format(self.pid)
+        try:
+            self._stat = ProcFile(root + "stat")
+            self._statm = ProcFile(root + "statm")
+        except FileNotFoundError:
+            raise psutil.NoSuchProcess(self.pid)
+        try:
+            self._io: Optional[ProcFile] = ProcFile(root + "io")
+        except PermissionError:  # only readable for processes of the same user
+            self._io = None
+        self._task_root = root + "task/"
+        self._tasks: dict = {}
+        self._last_cpu_time: Optional[float] = None
+        self._last_time = 0.0
+
+    def _read(self, procfile: ProcFile) -> memoryview:
+        try:
+            return procfile.read()
+        except OSError as e:
+            if e.errno in (errno.ESRCH, errno.ENOENT):
+                raise psutil.NoSuchProcess(self.pid)
+            raise
+
+    def finished(self) -> bool:
+        return stat_fields(self._read(self._stat))[_STATE] in (b"Z", b"X")
+
+    def _threads(self, num_threads: int) -> list:
+        if num_threads != len(self._tasks):
+            # threads were created or joined, refresh the open descriptors
+            try:
+                current = set(int(tid) for tid in os.listdir(self._task_root))
+            except FileNotFoundError:
+                raise psutil.NoSuchProcess(self.pid)
+            for tid in set(self._tasks) - current:
+                self._tasks.pop(tid).close()
+            for tid in current - set(self._tasks):
+                try:
+                    self._tasks[tid] = ProcFile("{}{}/stat".format(self._task_root, tid))
+                except FileNotFoundError:
+                    continue
+
+        threads = []
+        for tid, procfile in list(self._tasks.items()):
+            try:
+                fields = stat_fields(procfile.read())
+            except OSError:  # the thread has exited since
+                self._tasks.pop(tid).close()
+                continue
+            threads.append(pthread(tid, int(fields[_UTIME]) / CLOCK_TICKS, int(fields[_STIME]) / CLOCK_TICKS))
+        return threads
+
+    def _io_counters(self) -> Optional[pio]:
+        if self._io is None:
+            return None
+        # rchar, wchar, syscr, syscw, read_bytes, write_bytes, cancelled_write_bytes
+        values = _fields(self._read(self._io))[1::2]
+        return pio(int(values[2]), int(values[3]), int(values[4]), int(values[5]), int(values[0]), int(values[1]))
+
+    def sample(self) -> ProcessSample:
+        now = get_current_time()
+        fields = stat_fields(self._read(self._stat))
+        cpu_time = (int(fields[_UTIME]) + int(fields[_STIME])) / CLOCK_TICKS
+        # percentage of one core since the previous sample, like psutil.Process.cpu_percent
+        cpu = 0.0
+        if self._last_cpu_time is not None and now > self._last_time:
+            cpu = 100.0 * (cpu_time - self._last_cpu_time) / (now - self._last_time)
+        self._last_cpu_time, self._last_time = cpu_time, now
+
+        statm = _fields(self._read(self._statm))
+        memory = pmem(int(statm[1]) * PAGE_SIZE, int(statm[0]) * PAGE_SIZE)
+
+        return ProcessSample(self.pid, cpu, memory, self._threads(int(fields[_NUM_THREADS])), self._io_counters())
+
+    def close(self) -> None:
+        for procfile in [self._stat, self._statm, self._io] + list(self._tasks.values()):
+            if procfile is not None:
+                procfile.close()
+        self._tasks.clear()
+
+
+def benchmark(pid: int, num_samples: int = 2000) -> dict:
+    """Sustainable samples per second of the psutil and the /proc readers on one process and its children"""
+    process = psutil.Process(pid)
+    processes = [process] + process.children(recursive=True)
+    rates = {}
+    for name, make_reader in (("psutil", PsutilReader), ("procfs", ProcfsReader)):
+        readers = [make_reader(proc) for proc in processes]
+        start = get_current_time()
+        for _ in range(num_samples):
+            readers[0].finished()
+            for reader in readers:
+                reader.sample()
+        rates[name] = num_samples / (get_current_time() - start)
+        for reader in readers:
+            reader.close()
+    return rates
+
+
+if __name__ == "__main__":
+    for name, rate in benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else os.getpid()).items():
+        print("{:8s} {:10.1f} samples per second".format(name, rate))
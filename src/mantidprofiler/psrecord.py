@@ -30,16 +30,24 @@
 #
 ###############################################################################
 
-import copy
+import re
 from pathlib import Path
-from time import sleep
-from typing import Optional
 
 import numpy as np
-import psutil
 
-from mantidprofiler.children_util import all_children, update_children
-from mantidprofiler.time_util import get_current_time, get_start_time
+from mantidprofiler.binary_log import (
+    THREAD_DTYPE,
+    BinaryLogWriter,
+    is_binary_log,
+    read_binary_log,
+    remove_binary_log,
+)
+
+# columns of the array returned by parse_log, also used in the binary log
+COLUMNS = ("time", "cpu", "real_mb", "virtual_mb", "active_threads", "total_threads")
+
+# matches the repr of one entry of psutil.Process.threads()
+_THREAD_PATTERN = re.compile(r"id=(\d+), user_time=([^,\s]+), system_time=([^)\s]+)")
 
 
 # returns percentage for system + user time
@@ -55,97 +63,172 @@ def get_threads(process):
     return process.threads()
 
 
-def monitor(pid: int, logfile: Path, interval: Optional[float]) -> None:
-    # change None to reasonable default
-    if interval is None:
-        interval = 0.0
+class CpuLog:
+    """Writes the samples of the CPU/memory monitor as text or in the binary format of ``binary_log``"""
 
-    pr = psutil.Process(pid)
+    def __init__(self, logfile: Path, starting_point: float, log_format: str = "text"):
+        self.binary = log_format == "binary"
+        if self.binary:
+            self._handle = BinaryLogWriter(logfile, COLUMNS, starting_point, threads=True)
+            return
 
-    # Record start time
-    starting_point = get_start_time()
-    start_time = get_current_time()
-
-    f = open(logfile, "w")
-    f.write(
-        "# {0:12s} {1:12s} {2:12s} {3:12s} {4}\n".format(
-            "Elapsed time".center(12),
-            "CPU (%)".center(12),
-            "Real (MB)".center(12),
-            "Virtual (MB)".center(12),
-            "Threads info".center(12),
+        self._handle = open(logfile, "w")
+        self._handle.write(
+            "# {0:12s} {1:12s} {2:12s} {3:12s} {4}\n".format(
+                "Elapsed time".center(12),
+                "CPU (%)".center(12),
+                "Real (MB)".center(12),
+                "Virtual (MB)".center(12),
+                "Threads info".center(12),
+            )
         )
-    )
-    f.write("START_TIME: {}\n".format(starting_point))
-
-    children = {}
-    for ch in all_children(pr):
-        children.update({ch.pid: ch})
-
-    try:
-        # Start main event loop
-        while True:
-            # Find current time
-            current_time = get_current_time()
-
-            try:
-                pr_status = pr.status()
-            except TypeError:  # psutil < 2.0
-                pr_status = pr.status
-            except psutil.NoSuchProcess:  # pragma: no cover
-                break
-
-            # Check if process status indicates we should exit
-            if pr_status in [psutil.STATUS_ZOMBIE, psutil.STATUS_DEAD]:
-                print("Process finished ({0:.2f} seconds)".format(current_time - start_time))
-                break
-
-            # Get current CPU and memory
-            try:
-                current_cpu = get_percent(pr)
-                current_mem = get_memory(pr)
-                current_threads = get_threads(pr)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                break
-            current_mem_real = current_mem.rss / 1024.0**2
-            current_mem_virtual = current_mem.vms / 1024.0**2
-
-            # Get information for children
-            update_children(children, all_children(pr))
-            for key, child in children.items():
-                try:
-                    current_cpu += get_percent(child)
-                    current_mem = get_memory(child)
-                    current_threads.extend(get_threads(child))
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-                current_mem_real += current_mem.rss / 1024.0**2
-                current_mem_virtual += current_mem.vms / 1024.0**2
-
-            f.write(
-                "{0:12.6f} {1:12.3f} {2:12.3f} {3:12.3f} {4}\n".format(
-                    current_time - start_time + starting_point,
-                    current_cpu,
-                    current_mem_real,
-                    current_mem_virtual,
-                    current_threads,
-                )
+        self._handle.write("START_TIME: {}\n".format(starting_point))
+
+    def write(self, sample_time, cpu, mem_real, mem_virtual, threads) -> None:
+        if self.binary:
+            active = self._handle.write_threads(threads)
+            self._handle.write((sample_time, cpu, mem_real, mem_virtual, active, len(threads)))
+            return
+
+        self._handle.write(
+            "{0:12.6f} {1:12.3f} {2:12.3f} {3:12.3f} {4}\n".format(
+                sample_time,
+                cpu,
+                mem_real,
+                mem_virtual,
+                threads,
             )
-            f.flush()
+        )
+        self._handle.flush()
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
 
-            if interval > 0.0:
-                sleep(interval)
+    def __exit__(self, *args):
+        self.close()
 
-    except KeyboardInterrupt:  # pragma: no cover
-        print(f"killing process being monitored [PID={pr.pid}]:", " ".join(pr.cmdline()))
-        pr.kill()
 
-    if logfile:
-        f.close()
+def thread_activity(sample, tid, user_time, system_time, num_samples: int):
+    """
+    Count the active and total threads of every sample.
+
+    A thread is active in a sample when it did not exist in the previous sample
+    or its user or system time changed since then.
+
+    Parameters
+    ----------
+    sample, tid, user_time, system_time : numpy.ndarray
+        One entry per thread per sample: index of the sample, thread id and CPU times.
+    num_samples : int
+        Total number of samples, including those without threads.
+
+    Returns
+    -------
+    active, total : numpy.ndarray
+        Number of active threads and number of threads in each sample.
+    """
+    sample = np.asarray(sample, dtype=np.int64)
+    tid = np.asarray(tid)
+    user_time = np.asarray(user_time)
+    system_time = np.asarray(system_time)
+
+    # group the samples of each thread together, in time order
+    order = np.lexsort((sample, tid))
+    sample, tid = sample[order], tid[order]
+    user_time, system_time = user_time[order], system_time[order]
+
+    changed = np.ones(len(order), dtype=bool)
+    unchanged = (
+        (tid[1:] == tid[:-1])
+        & (sample[1:] == sample[:-1] + 1)
+        & (user_time[1:] == user_time[:-1])
+        & (system_time[1:] == system_time[:-1])
+    )
+    changed[1:] = ~unchanged
+
+    active = np.bincount(sample[changed], minlength=num_samples)
+    total = np.bincount(sample, minlength=num_samples)
+    return active, total
+
+
+def thread_utilization(sample, tid, cpu_time, previous, times, min_peak: float = 10.0):
+    """
+    Per-thread CPU utilization over time, with the threads that never use ``min_peak`` percent of a core
+    folded into a single row.
+
+    Parameters
+    ----------
+    sample, tid, cpu_time, previous : numpy.ndarray
+        One entry per change of the CPU time of a thread: index of the sample, thread id,
+        CPU seconds used since the sample ``previous``.
+    times : numpy.ndarray
+        Time of every sample, in seconds.
+
+    Returns
+    -------
+    labels : list[str]
+        Thread id of every busy thread, in the order the threads were first seen, and ``"idle (n)"``
+        for the row of the n idle threads if there are any.
+    utilization : numpy.ndarray
+        Array of shape (n_rows, n_samples) with the percentage of one core used by each
+        busy thread, and then by the idle threads together, between the previous sample and each sample.
+    """
+    sample = np.asarray(sample, dtype=np.int64)
+    previous = np.asarray(previous, dtype=np.int64)
+    times = np.asarray(times, dtype=float)
+    num_samples = len(times)
+
+    tids, row = np.unique(np.asarray(tid), return_inverse=True)
+    # order the threads by when they were first seen
+    first_sample = np.full(len(tids), num_samples, dtype=np.int64)
+    np.minimum.at(first_sample, row, sample)
+    order = np.lexsort((tids, first_sample))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    elapsed = times[sample] - times[previous]
+    valid = (previous >= 0) & (elapsed > 0.0)
+    # the utilization of every thread in the samples where it changed, to find the peaks before building any rows
+    cell, cell_index = np.unique(rank[row[valid]] * num_samples + sample[valid], return_inverse=True)
+    usage = np.bincount(cell_index, 100.0 * np.asarray(cpu_time, dtype=float)[valid] / elapsed[valid], len(cell))
+    peak = np.zeros(len(tids))
+    np.maximum.at(peak, cell // num_samples, usage)
+
+    busy = peak >= min_peak
+    labels = [str(int(thread)) for thread in tids[order][busy]]
+    num_idle = len(tids) - len(labels)
+    # every idle thread goes to the last row
+    thread_row = np.cumsum(busy) - 1
+    thread_row[~busy] = len(labels)
+    if num_idle:
+        labels.append("idle ({})".format(num_idle))
+
+    utilization = np.zeros((len(labels), num_samples))
+    np.add.at(utilization, (thread_row[cell // num_samples], cell % num_samples), usage)
+    return labels, utilization
+
+
+def _cumulative_to_changes(sample, tid, user_time, system_time):
+    # CPU seconds used by each thread since its previous sample, or -1 as previous sample where it is new
+    sample = np.asarray(sample, dtype=np.int64)
+    tid = np.asarray(tid)
+    cpu_time = np.asarray(user_time, dtype=float) + np.asarray(system_time, dtype=float)
+
+    order = np.lexsort((sample, tid))
+    sample, tid, cpu_time = sample[order], tid[order], cpu_time[order]
+    previous = np.full(len(order), -1, dtype=np.int64)
+    same = tid[1:] == tid[:-1]
+    previous[1:][same] = sample[:-1][same]
+    change = np.zeros(len(order))
+    change[1:][same] = cpu_time[1:][same] - cpu_time[:-1][same]
+    return sample, tid, change, previous
 
 
 # Parse the logfile outputted by psrecord
-def parse_log(filename: Path, cleanup: bool = True):
+def parse_log(filename: Path, cleanup: bool = True, threads: bool = False, min_peak: float = 10.0):
     """
     Parse the CPU/memory monitoring log file generated by psrecord.
 
@@ -155,6 +238,10 @@ def parse_log(filename: Path, cleanup: bool = True):
         Path to the log file to parse.
     cleanup : bool, optional
         If True, delete the log file after parsing. Default is True.
+    threads : bool, optional
+        If True, also return the utilization of every thread. Default is False.
+    min_peak : float, optional
+        Threads that never use this percentage of a core are summed into one row. Default is 10.
 
     Returns
     -------
@@ -169,10 +256,13 @@ def parse_log(filename: Path, cleanup: bool = True):
         - Column 3: Virtual memory (MB)
         - Column 4: Number of active threads (threads with changed CPU time)
         - Column 5: Total number of threads
+    thread_usage : tuple of numpy.ndarray, optional
+        Only if ``threads`` is True, the row labels and utilization matrix of ``thread_utilization``.
 
     Notes
     -----
-    The log file format is expected to have:
+    Logs in the binary format of ``binary_log`` are mapped into memory and returned
+    without parsing. Otherwise the log file format is expected to have:
     - Comment lines starting with '#'
     - A line starting with 'START_TIME:' containing the epoch timestamp
     - Data lines with format: elapsed_time cpu% real_mem virtual_mem [thread_info...]
@@ -186,9 +276,33 @@ def parse_log(filename: Path, cleanup: bool = True):
     >>> cpu_percent = data[:, 1]
     >>> ram_mb = data[:, 2]
     """
+    if is_binary_log(filename):
+        header, data, changes = read_binary_log(filename)
+        if threads:
+            # the side file holds the totals of new threads and then the changes since the previous sample
+            if changes is None:
+                changes = np.empty(0, dtype=THREAD_DTYPE)
+            sample = changes["sample"].astype(np.int64)
+            order = np.lexsort((sample, changes["tid"]))
+            new = np.ones(len(order), dtype=bool)
+            new[1:] = changes["tid"][order][1:] != changes["tid"][order][:-1]
+            previous = sample - 1
+            previous[order[new]] = -1
+            thread_usage = thread_utilization(
+                sample, changes["tid"], changes["user_time"] + changes["system_time"], previous, data[:, 0], min_peak
+            )
+        if cleanup:
+            # copy the samples out and close the mappings first, mapped files cannot be removed on Windows
+            data = np.array(data)
+            del changes
+            remove_binary_log(filename)
+        if threads:
+            return header["start_time"], data, thread_usage
+        return header["start_time"], data
+
     rows: list = []
-    dct1: dict = {}  # starts out uninitialized
-    dct2: dict = {}
+    thread_times: list = []  # (id, user_time, system_time) of every thread in every sample
+    counts: list = []  # number of threads in each sample
     start_time = 0.0
     with open(filename, "r") as handle:
         for line in handle:
@@ -199,39 +313,26 @@ def parse_log(filename: Path, cleanup: bool = True):
                 start_time = float(line.split()[-1])
                 continue
 
-            # remove unwanted characters/strings
-            for item in ("[", "]", "(", ")", ",", "pthread", "id=", "user_time=", "system_time="):
-                line = line.replace(item, "")
-            row = []
-            lst = line.split()
-            for i in range(4):
-                row.append(float(lst[i]))
-            i = 4
-            dct1 = copy.deepcopy(dct2)
-            dct2.clear()
-            while i < len(lst):
-                idx = int(lst[i])
-                i += 1
-                ut = float(lst[i])
-                i += 1
-                st = float(lst[i])
-                i += 1
-                dct2.update({idx: [ut, st]})
-            count = 0
-            for key, val in dct2.items():
-                if key not in dct1.keys():
-                    count += 1
-                    continue
-                elem = dct1[key]
-                if val[0] != elem[0] or val[1] != elem[1]:
-                    count += 1
-            row.append(count)
-            row.append(len(dct2))
-            rows.append(row)
+            lst = line.split(maxsplit=4)
+            rows.append(lst[:4])
+            found = _THREAD_PATTERN.findall(lst[4]) if len(lst) > 4 else []
+            thread_times.extend(found)
+            counts.append(len(found))
+
+    # convert all the numbers in one go
+    data = np.array(rows, dtype=float).reshape(-1, 4)
+    thread_info = np.array(thread_times, dtype=float).reshape(-1, 3)
+    sample = np.repeat(np.arange(len(counts)), counts)
+    active, total = thread_activity(sample, thread_info[:, 0], thread_info[:, 1], thread_info[:, 2], len(counts))
+    if threads:
+        changes = _cumulative_to_changes(sample, thread_info[:, 0], thread_info[:, 1], thread_info[:, 2])
+        thread_usage = thread_utilization(*changes, data[:, 0], min_peak)
 
     # remove the file
     if cleanup and filename.exists():
         filename.unlink()
 
     # return results
-    return start_time, np.array(rows)
+    if threads:
+        return start_time, np.column_stack((data, active, total)), thread_usage
+    return start_time, np.column_stack((data, active, total))
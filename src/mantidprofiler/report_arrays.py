@@ -0,0 +1,92 @@
+# report_arrays.py - compact encoding of the arrays of the html report
+#
+# Instead of decimal text, the arrays of a self-contained report are packed into
+# one buffer of little-endian typed arrays, optionally compressed with zlib, and
+# written as base64. The page decodes the buffer once into Float64Array,
+# Float32Array and Int32Array views, which plotly.js plots without conversion.
+#
+# The plotly.js bundle embedded in such a report is the copy shipped next to
+# this module (``plotly.min.js``, plotly.js 2.35.2 under the MIT license, see
+# ``plotly.min.js.LICENSE.txt``), unless another one is given. It is the full
+# bundle and adds 4.5 MB to the report.
+#
+######################################################################
+
+import base64
+import json
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+_TYPED_ARRAYS = {
+    np.dtype("<f8"): "Float64Array",
+    np.dtype("<f4"): "Float32Array",
+    np.dtype("<i4"): "Int32Array",
+}
+
+VENDORED_PLOTLY = Path(__file__).with_name("plotly.min.js")
+
+# decodeArrays(encoded) resolves to the list of typed arrays packed by EncodedArrays
+DECODE_ARRAYS_JS = """
+async function decodeArrays(encoded) {
+  var text = atob(encoded.data);
+  var bytes = new Uint8Array(text.length);
+  for (var i = 0; i < text.length; i++) bytes[i] = text.charCodeAt(i);
+  if (encoded.compressed) {
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    bytes = new Uint8Array(await new Response(stream).arrayBuffer());
+  }
+  var types = {Float64Array: Float64Array, Float32Array: Float32Array, Int32Array: Int32Array};
+  return encoded.arrays.map(function(array) {
+    return new types[array.type](bytes.buffer, array.offset, array.length);
+  });
+}
+"""
+
+
+class EncodedArrays:
+    """Collects the arrays of a report, to be written together as one base64 buffer"""
+
+    def __init__(self, compress: bool = False):
+        self.compress = compress
+        self._arrays: list = []
+        self._size = 0
+
+    def add(self, array, dtype=np.float64) -> str:
+        """Keep a copy of ``array`` as ``dtype`` and return the javascript expression that refers to it"""
+        array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder("<"))
+        # typed arrays have to start at a multiple of their element size
+        self._size += -self._size % 8
+        self._arrays.append((self._size, array))
+        self._size += array.nbytes
+        return "arrays[{}]".format(len(self._arrays) - 1)
+
+    def encode(self) -> dict:
+        buffer = bytearray(self._size)
+        arrays = []
+        for offset, array in self._arrays:
+            buffer[offset : offset + array.nbytes] = array.tobytes()
+            arrays.append({"type": _TYPED_ARRAYS[array.dtype], "offset": offset, "length": len(array)})
+        data = zlib.compress(bytes(buffer), 6) if self.compress else bytes(buffer)
+        return {"compressed": self.compress, "data": base64.b64encode(data).decode("ascii"), "arrays": arrays}
+
+    def write(self, stream, name: str = "encodedArrays") -> None:
+        stream.write("var {} = {};\n".format(name, json.dumps(self.encode())))
+
+
+def plotly_bundle(filename: Optional[Path] = None) -> str:
+    """The plotly.js bundle to embed in a report: ``filename``, the vendored copy or that of the plotly package"""
+    if filename is None and VENDORED_PLOTLY.exists():
+        filename = VENDORED_PLOTLY
+    if filename is not None:
+        return Path(filename).read_text(encoding="utf-8")
+    try:
+        # optional, only used to find a copy of plotly.js
+        from plotly.offline import get_plotlyjs
+    except ImportError:
+        raise FileNotFoundError(
+            "no plotly.js bundle to embed, install the plotly package or supply the path to plotly.min.js"
+        )
+    return get_plotlyjs()
@@ -0,0 +1,340 @@
+# sampler.py - single loop that samples CPU, memory, threads and disk I/O together
+#
+# Each tick updates the tree of children of the monitored process once, reads every
+# process inside ``psutil.Process.oneshot()`` (or with the /proc reader of
+# ``procfs``) and writes the same timestamp to the
+# CPU/memory log of ``psrecord`` and the disk log of ``diskrecord``, so that both
+# series share one timeline.
+#
+######################################################################
+
+import os
+from contextlib import nullcontext
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import psutil
+
+from mantidprofiler.children_util import ProcessTree
+from mantidprofiler.diskrecord import DiskLog
+from mantidprofiler.processrecord import ProcessLog
+from mantidprofiler.psrecord import CpuLog, get_memory, get_percent, get_threads
+from mantidprofiler.scheduler import DEFAULT_MAX_INTERVAL, make_scheduler
+from mantidprofiler.time_util import get_current_time, get_start_time
+
+
+class ProcessSample(NamedTuple):
+    pid: int
+    cpu: float
+    memory: object
+    threads: list
+    io: Optional[object]
+
+
+class OptionalLogs(NamedTuple):
+    """Logs that ``monitor`` writes besides the CPU/memory and disk logs, each only if its file is given"""
+
+    # CPU, real memory and I/O of every process separately
+    processfile: Optional[Path] = None
+    # PSS, USS, swap and page faults of the processes
+    memoryfile: Optional[Path] = None
+    # bytes read from and written to every open file
+    filesfile: Optional[Path] = None
+    # use of the whole node, every ``host_interval`` seconds
+    hostfile: Optional[Path] = None
+    host_interval: Optional[float] = None
+
+
+# changes of CPU (%), real memory (MB) and disk rate (Gbps) that make the adaptive sampling dense
+ACTIVITY_TOLERANCES = (10.0, 16.0, 0.01)
+# growth of the real memory in MB/s that triggers a burst of samples
+BURST_GROWTH = 50.0
+
+# ways of reading the processes, "procfs" is the faster Linux-only reader of ``procfs``
+COLLECTORS = ("psutil", "procfs")
+
+
+class PsutilReader:
+    """Takes all readings of one process through psutil"""
+
+    def __init__(self, process: psutil.Process):
+        self.process = process
+        self.pid = process.pid
+
+    def finished(self) -> bool:
+        return self.process.status() in [psutil.STATUS_ZOMBIE, psutil.STATUS_DEAD]
+
+    def sample(self) -> ProcessSample:
+        process = self.process
+        # share the reads of /proc between all readings
+        with process.oneshot():
+            try:
+                io = process.io_counters()
+            except (psutil.AccessDenied, AttributeError):  # not permitted or not supported on this platform
+                io = None
+            return ProcessSample(process.pid, get_percent(process), get_memory(process), get_threads(process), io)
+
+    def close(self) -> None:
+        pass
+
+
+def get_reader_type(collector: str):
+    if collector == "procfs":
+        # imported here as it is an optional, Linux-only alternative
+        from mantidprofiler import procfs
+
+        if procfs.available():
+            return procfs.ProcfsReader
+        print("/proc is not available, falling back to psutil")
+    return PsutilReader
+
+
+def update_readers(readers: dict, children: dict, make_reader) -> None:
+    """Keep one reader for every child process, so readers keep their state between ticks"""
+    for pid in [pid for pid in readers if pid not in children]:
+        readers.pop(pid).close()
+    for pid, child in children.items():
+        if pid not in readers:
+            try:
+                readers[pid] = make_reader(child)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+
+def _file_size(filename: Optional[Path]) -> int:
+    if filename is None:
+        return 0
+    try:
+        return os.stat(filename).st_size
+    except OSError:
+        return 0
+
+
+def io_difference(after, before) -> tuple:
+    """Read and written chars and bytes, and read and write calls, since ``before``, or in total if ``before``
+    is None"""
+    if after is None:
+        return (0, 0, 0, 0, 0, 0)
+    if before is None:
+        return (
+            after.read_chars,
+            after.write_chars,
+            after.read_bytes,
+            after.write_bytes,
+            after.read_count,
+            after.write_count,
+        )
+    return (
+        after.read_chars - before.read_chars,
+        after.write_chars - before.write_chars,
+        after.read_bytes - before.read_bytes,
+        after.write_bytes - before.write_bytes,
+        after.read_count - before.read_count,
+        after.write_count - before.write_count,
+    )
+
+
+def name_process(process_log: ProcessLog, process: Optional[psutil.Process]) -> None:
+    """Record the parent and name of a process in the process log the first time it is sampled"""
+    if process is None or process_log.is_named(process.pid):
+        return
+    try:
+        process_log.name(process.pid, process.ppid(), process.name())
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        process_log.name(process.pid, 0, "")
+
+
+def monitor(
+    pid: int,
+    logfile: Path,
+    diskfile: Path,
+    interval: Optional[float],
+    show_bytes: bool = False,
+    log_format: str = "text",
+    collector: str = "psutil",
+    adaptive: bool = False,
+    max_interval: float = DEFAULT_MAX_INTERVAL,
+    infile: Optional[Path] = None,
+    live=None,
+    burst: Optional[float] = None,
+    logs: OptionalLogs = OptionalLogs(),
+    verbose: bool = False,
+) -> None:
+    """Monitor CPU, memory, threads and disk usage of the process and its children
+
+    Samples are taken every ``interval`` seconds. Without an interval, or with ``adaptive``,
+    the period adapts up to ``max_interval`` and is shortest while the readings change or
+    the algorithm timing file ``infile`` grows. Every sample is also passed on to the ``live.LiveReport``
+    ``live``, if supplied. With a ``burst`` interval, samples are taken at least that often while the real
+    memory climbs faster than ``BURST_GROWTH``, so that its peaks are not missed between samples. The
+    ``logs`` that are given are written on the same timeline. With ``verbose``, the time spent on the
+    readings is printed at the end."""
+    infile_size = _file_size(infile)
+
+    pr = psutil.Process(pid)
+
+    # Record start time
+    starting_point = get_start_time()
+    start_time = get_current_time()
+    last_time = start_time
+    if live is not None:
+        live.start(starting_point)
+
+    # conversion factor of bytes per sec to Giga-bits per second - 8 bits in a byte
+    conversion_to_size = 1e-9
+    if not show_bytes:
+        conversion_to_size = 8.0 * conversion_to_size
+
+    make_reader = get_reader_type(collector)
+    reader = make_reader(pr)
+    tree = ProcessTree(pr)
+    children = tree.update()
+    child_readers: dict = {}
+    update_readers(child_readers, children, make_reader)
+    # I/O counters of every process at the previous tick
+    io_before = {}
+    for process_reader in [reader] + list(child_readers.values()):
+        try:
+            io_before[process_reader.pid] = process_reader.sample().io
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    memory_sampler = None
+    if logs.memoryfile is not None:
+        # imported here as it is optional
+        from mantidprofiler.memoryrecord import MemoryLog, MemorySampler
+
+        memory_sampler = MemorySampler()
+        memory_sampler.update({pr.pid: pr, **children})
+        # page faults count from here
+        memory_sampler.sample(None)
+    file_sampler = None
+    if logs.filesfile is not None:
+        # imported here as it is optional
+        from mantidprofiler.filerecord import FileLog, FileSampler
+
+        file_sampler = FileSampler()
+        file_sampler.update([pr.pid] + list(children))
+        # offsets count from here
+        file_sampler.sample()
+    host_sampler = None
+    if logs.hostfile is not None:
+        # imported here as it is optional
+        from mantidprofiler.hostrecord import HOST_INTERVAL, HostLog, HostSampler
+
+        host_sampler = HostSampler(logs.host_interval or HOST_INTERVAL)
+    last_mem_real = None
+
+    with (
+        CpuLog(logfile, starting_point, log_format) as cpu_log,
+        DiskLog(diskfile, starting_point, log_format) as disk_log,
+        ProcessLog(logs.processfile, starting_point) if logs.processfile is not None else nullcontext() as process_log,
+        MemoryLog(logs.memoryfile, starting_point) if logs.memoryfile is not None else nullcontext() as memory_log,
+        FileLog(logs.filesfile, starting_point) if logs.filesfile is not None else nullcontext() as file_log,
+        HostLog(logs.hostfile, starting_point, host_sampler.num_cores) if host_sampler else nullcontext() as host_log,
+    ):
+        # the first deadline counts from here, after the scans of /proc above
+        scheduler = make_scheduler(interval, adaptive, max_interval, ACTIVITY_TOLERANCES)
+        try:
+            # Start main event loop
+            while True:
+                # Find current time
+                current_time = get_current_time()
+
+                # Check if process status indicates we should exit
+                try:
+                    if reader.finished():
+                        print("Process finished ({0:.2f} seconds)".format(current_time - start_time))
+                        break
+                    samples = [reader.sample()]
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    break
+
+                # Get information for children, enumerated once per tick
+                children = tree.update()
+                update_readers(child_readers, children, make_reader)
+                for child_reader in child_readers.values():
+                    try:
+                        samples.append(child_reader.sample())
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        continue
+
+                cpu = sum(sample.cpu for sample in samples)
+                mem_real = sum(sample.memory.rss for sample in samples) / 1024.0**2
+                mem_virtual = sum(sample.memory.vms for sample in samples) / 1024.0**2
+                threads = [thread for sample in samples for thread in sample.threads]
+
+                # processes that are new since the last tick count with their full I/O
+                io_totals = [0, 0, 0, 0, 0, 0]
+                io_changes = []
+                for sample in samples:
+                    io_changes.append(io_difference(sample.io, io_before.get(sample.pid)))
+                    for i, diff in enumerate(io_changes[-1]):
+                        io_totals[i] += diff
+                delta_time = current_time - last_time
+                to_rate = conversion_to_size / delta_time if delta_time > 0.0 else 0.0
+                rates = [to_rate * total for total in io_totals[:4]]
+                # read and write calls per second
+                operations = [total / delta_time if delta_time > 0.0 else 0.0 for total in io_totals[4:]]
+
+                sample_time = current_time - start_time + starting_point
+                if process_log is not None:
+                    for sample, (read_chars, write_chars, *_) in zip(samples, io_changes):
+                        name_process(process_log, pr if sample.pid == pr.pid else children.get(sample.pid))
+                        process_log.write(
+                            sample_time,
+                            sample.pid,
+                            sample.cpu,
+                            sample.memory.rss / 1024.0**2,
+                            to_rate * read_chars,
+                            to_rate * write_chars,
+                        )
+                if memory_log is not None:
+                    memory_sampler.update({pr.pid: pr, **children})
+                    memory_log.write(sample_time, *memory_sampler.sample(delta_time))
+                if file_log is not None:
+                    file_sampler.update([pr.pid] + list(children))
+                    chars = {
+                        sample.pid: change[:2] for sample, change in zip(samples, io_changes) if sample.io is not None
+                    }
+                    for path, (read, written) in file_sampler.sample(chars).items():
+                        file_log.write(sample_time, path, to_rate * read, to_rate * written)
+                if host_log is not None and host_sampler.due(current_time):
+                    host_log.write(sample_time, *host_sampler.sample(current_time, [pr.pid] + list(children)))
+                cpu_log.write(sample_time, cpu, mem_real, mem_virtual, threads)
+                disk_log.write(sample_time, *rates, *operations)
+
+                io_before = {sample.pid: sample.io for sample in samples}
+                last_time = current_time
+
+                # a growing timing file means an algorithm just finished
+                size = _file_size(infile)
+                if live is not None:
+                    live.add_sample(sample_time, cpu, mem_real, threads, rates)
+                    if size != infile_size:
+                        live.read_algorithms()
+                scheduler.observe((cpu, mem_real, sum(rates)), boundary=size != infile_size)
+                infile_size = size
+                # follow a climbing memory to its peak
+                if burst is not None and last_mem_real is not None and delta_time > 0.0:
+                    if (mem_real - last_mem_real) / delta_time > BURST_GROWTH:
+                        scheduler.burst(burst)
+                last_mem_real = mem_real
+                scheduler.wait()
+
+        except KeyboardInterrupt:  # pragma: no cover
+            print(f"killing process being monitored [PID={pr.pid}]:", " ".join(pr.cmdline()))
+            pr.kill()
+
+    for process_reader in [reader] + list(child_readers.values()):
+        process_reader.close()
+    if memory_sampler is not None:
+        memory_sampler.close()
+    if file_sampler is not None and verbose:
+        print(file_sampler.summary())
+    if host_sampler is not None and verbose:
+        print(host_sampler.summary())
+    if live is not None:
+        live.read_algorithms()
+    if verbose:
+        print(scheduler.summary())
+        print(tree.summary())
@@ -0,0 +1,105 @@
+# scheduler.py - timing of the samples taken by the monitors
+#
+# Samples are taken on absolute deadlines, so the time spent collecting a sample
+# does not add up into drift of the sampling period. In adaptive mode the period
+# drops to its minimum as soon as the readings change quickly or an algorithm
+# finishes, and grows again while they stay steady. A burst shortens the wait for
+# the next sample only, whatever the mode, to follow a climbing memory to its peak.
+#
+######################################################################
+
+from time import sleep
+from typing import Optional, Sequence
+
+from mantidprofiler.time_util import get_current_time
+
+# used when no interval is supplied
+DEFAULT_MIN_INTERVAL = 0.005
+DEFAULT_MAX_INTERVAL = 0.25
+# growth of the period for every steady sample in adaptive mode
+BACKOFF = 1.5
+# change relative to the previous reading that counts as significant, on top of the absolute tolerance
+RELATIVE_TOLERANCE = 0.02
+
+
+class DeadlineScheduler:
+    """Waits for the deadline of the next sample.
+
+    The period is fixed at ``interval``, or adapts between ``interval`` and ``max_interval``
+    from the readings passed to ``observe``. Deadlines that have already passed once a
+    sample is taken are counted in ``missed`` and the schedule restarts from the current time
+    rather than taking a burst of samples to catch up.
+    """
+
+    def __init__(self, interval: float, max_interval: Optional[float] = None, tolerances: Sequence[float] = ()):
+        self.min_interval = interval
+        self.max_interval = max(max_interval or interval, interval)
+        self.interval = interval
+        self.tolerances = tuple(tolerances)
+        self.deadline = get_current_time()
+        self.num_samples = 0
+        self.missed = 0
+        self.num_bursts = 0
+        self._last_values: Optional[tuple] = None
+        self._burst: Optional[float] = None
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_interval > self.min_interval
+
+    def observe(self, values: Sequence[float], boundary: bool = False) -> None:
+        """Adapt the period to the latest readings, each compared with the matching entry of ``tolerances``.
+        ``boundary`` signals an event that needs dense sampling, such as an algorithm that just finished."""
+        if not self.adaptive:
+            return
+        values = tuple(values)
+        changed = boundary or self._last_values is None
+        if not changed:
+            for value, last, tolerance in zip(values, self._last_values, self.tolerances):
+                if abs(value - last) > tolerance + RELATIVE_TOLERANCE * abs(last):
+                    changed = True
+                    break
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * BACKOFF, self.max_interval)
+        self._last_values = values
+
+    def burst(self, interval: float) -> None:
+        """Take the next sample after at most ``interval``"""
+        if interval < self.interval:
+            self._burst = interval
+
+    def wait(self) -> None:
+        self.num_samples += 1
+        interval = self.interval
+        if self._burst is not None:
+            interval = self._burst
+            self.num_bursts += 1
+            self._burst = None
+        self.deadline += interval
+        now = get_current_time()
+        if now > self.deadline:
+            if interval > 0.0:
+                self.missed += 1
+            self.deadline = now
+            return
+        sleep(self.deadline - now)
+
+    def summary(self) -> str:
+        text = "Missed {} of {} sampling deadlines".format(self.missed, self.num_samples)
+        if self.num_bursts:
+            text += ", {} samples taken in bursts".format(self.num_bursts)
+        return text
+
+
+def make_scheduler(
+    interval: Optional[float],
+    adaptive: bool = False,
+    max_interval: float = DEFAULT_MAX_INTERVAL,
+    tolerances: Sequence[float] = (),
+) -> DeadlineScheduler:
+    """Fixed period of ``interval``, adaptive if requested or if no interval is given"""
+    if interval is None:
+        return DeadlineScheduler(DEFAULT_MIN_INTERVAL, max_interval, tolerances)
+    return DeadlineScheduler(interval, max_interval if adaptive else None, tolerances)
@@ -0,0 +1,205 @@
+# trace.py - export a profile as Chrome trace events, for Perfetto and chrome://tracing
+#
+# Every algorithm call becomes a complete ("X") event on the track of the thread
+# that ran it, and every column of the CPU/memory and disk series becomes a
+# counter ("C") track. The events are written as they are read, one chunk of the
+# timing file at a time, so the memory used does not grow with the length of the
+# run. A file name ending in ``.gz`` is compressed, which Perfetto opens directly.
+#
+######################################################################
+
+import argparse
+import gzip
+import json
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.diskrecord import parse_log as parse_disk_log
+from mantidprofiler.memoryrecord import parse_log as parse_memory_log
+from mantidprofiler.psrecord import parse_log as parse_cpu_log
+
+# process all tracks belong to
+TRACE_PID = 1
+# counter tracks of the columns of the CPU/memory series, by column
+CPU_COUNTERS = (
+    (1, "CPU (%)", "cpu"),
+    (2, "Memory (MB)", "real"),
+    (3, "Memory (MB)", "virtual"),
+    (4, "Threads", "active"),
+)
+# counter tracks of the columns of the disk series, by column
+DISK_COUNTERS = ((1, "Disk", "read"), (2, "Disk", "write"))
+# counter tracks of the read and write calls per second of the disk series
+DISK_CALL_COUNTERS = ((5, "Disk calls (/s)", "read"), (6, "Disk calls (/s)", "write"))
+# counter tracks of the columns of the memory series, by column
+MEMORY_COUNTERS = (
+    (1, "PSS, USS and swap (MB)", "pss"),
+    (2, "PSS, USS and swap (MB)", "uss"),
+    (3, "PSS, USS and swap (MB)", "swap"),
+    (4, "Page faults (/s)", "minor"),
+    (5, "Page faults (/s)", "major"),
+)
+
+
+class TraceWriter:
+    """Writes trace events to a JSON file one at a time"""
+
+    def __init__(self, filename: Path):
+        filename = Path(filename)
+        if filename.suffix == ".gz":
+            self._handle = gzip.open(filename, "wt", compresslevel=6)
+        else:
+            self._handle = open(filename, "w")
+        self._handle.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        self._first = True
+        self._threads: dict = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self._handle.write("\n]}\n")
+        self._handle.close()
+
+    def write(self, lines: Iterable[str]) -> None:
+        """Write already formatted events"""
+        for line in lines:
+            if not self._first:
+                self._handle.write(",\n")
+            self._handle.write(line)
+            self._first = False
+
+    def metadata(self, name: str, tid: int, value: str) -> None:
+        self.write([json.dumps({"name": name, "ph": "M", "pid": TRACE_PID, "tid": tid, "args": {"name": value}})])
+
+    def track(self, thread_id: int) -> int:
+        """Track of a Mantid thread id, named the first time it is seen
+
+        Thread ids are too large for the viewers, so the tracks are numbered in order of appearance."""
+        tid = self._threads.get(thread_id)
+        if tid is None:
+            tid = self._threads[thread_id] = len(self._threads) + 1
+            self.metadata("thread_name", tid, "Thread {}".format(thread_id))
+        return tid
+
+    def calls(self, records: np.ndarray, names: list, offset: float) -> None:
+        """Complete events of the records of ``algorithm_tree.parseFile``, moved by ``offset`` microseconds"""
+        # the names only need escaping once per chunk
+        names = [json.dumps(name) for name in names]
+        tids = [self.track(thread_id) for thread_id in records["thread_id"].tolist()]
+        start = records["start"] / 1.0e3 + offset
+        duration = (records["finish"] - records["start"]) / 1.0e3
+        self.write(
+            '{{"name": {}, "cat": "algorithm", "ph": "X", "ts": {:.3f}, "dur": {:.3f}, "pid": {}, "tid": {}}}'.format(
+                names[name_id], ts, dur, TRACE_PID, tid
+            )
+            for name_id, ts, dur, tid in zip(records["name_id"].tolist(), start.tolist(), duration.tolist(), tids)
+        )
+
+    def counters(self, x: np.ndarray, data: np.ndarray, counters: tuple) -> None:
+        """Counter events of the columns of ``data`` at the times ``x`` in microseconds"""
+        for name, columns in _group(counters).items():
+            values = [data[:, column].tolist() for column, _ in columns]
+            keys = [json.dumps(key) for _, key in columns]
+            title = json.dumps(name)
+            self.write(
+                '{{"name": {}, "ph": "C", "ts": {:.3f}, "pid": {}, "args": {{{}}}}}'.format(
+                    title, ts, TRACE_PID, ", ".join("{}: {}".format(key, value) for key, value in zip(keys, row))
+                )
+                for ts, row in zip(x.tolist(), zip(*values))
+            )
+
+
+def _group(counters: tuple) -> dict:
+    # columns shown together on one counter track
+    groups: dict = {}
+    for column, name, key in counters:
+        groups.setdefault(name, []).append((column, key))
+    return groups
+
+
+def write_trace(
+    filename: Path,
+    chunks: Iterable,
+    sync_time: Optional[float] = None,
+    cpu_data: Optional[np.ndarray] = None,
+    disk_data: Optional[np.ndarray] = None,
+    disk_in_bytes: bool = False,
+    memory_data: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Write the algorithm calls and the resource series as a trace.
+
+    Parameters
+    ----------
+    chunks : iterable
+        ``(start_point, records, names)`` of the algorithm calls, the ``records`` and ``names`` being
+        those of ``algorithm_tree.parseFile`` or of every step of ``algorithm_tree.iterFile``, and
+        ``start_point`` the time in nanoseconds of the ``START_POINT`` header.
+    sync_time : float, optional
+        Start of the process monitor in seconds since the epoch, the origin of the time axis.
+        The ``START_POINT`` of the timing file is used if there is none.
+    cpu_data, disk_data, memory_data : numpy.ndarray, optional
+        Series returned by the ``parse_log`` functions, with the times since the epoch.
+    """
+    disk_unit = "GBps" if disk_in_bytes else "Gbps"
+    with TraceWriter(filename) as writer:
+        writer.metadata("process_name", 0, "Mantid")
+        origin = sync_time
+        for start_point, records, names in chunks:
+            if origin is None:
+                origin = start_point / 1.0e9
+            writer.calls(records, names, (start_point / 1.0e9 - origin) * 1.0e6)
+        if origin is None:
+            origin = 0.0
+        if cpu_data is not None and len(cpu_data):
+            writer.counters((cpu_data[:, 0] - origin) * 1.0e6, cpu_data, CPU_COUNTERS)
+        if disk_data is not None and len(disk_data):
+            counters = tuple((column, "{} ({})".format(name, disk_unit), key) for column, name, key in DISK_COUNTERS)
+            writer.counters((disk_data[:, 0] - origin) * 1.0e6, disk_data, counters + DISK_CALL_COUNTERS)
+        if memory_data is not None and len(memory_data):
+            writer.counters((memory_data[:, 0] - origin) * 1.0e6, memory_data, MEMORY_COUNTERS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert the algorithm timings and process monitor logs of a profile to a Chrome trace "
+        "that opens in https://ui.perfetto.dev",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--infile", type=Path, default="algotimeregister.out", help="name of input file containing algorithm timings"
+    )
+    parser.add_argument("--logfile", type=Path, help="CPU/memory log of the run, for counter tracks")
+    parser.add_argument("--diskfile", type=Path, help="disk log of the run, for counter tracks")
+    parser.add_argument("--memoryfile", type=Path, help="memory log of the run, for counter tracks")
+    parser.add_argument("--bytes", action="store_true", help="the disk log is in GBps rather than Gbps")
+    parser.add_argument(
+        "--outfile", type=Path, default="trace.json.gz", help="name of output trace, compressed if it ends in .gz"
+    )
+    args = parser.parse_args(argv)
+
+    sync_time, cpu_data, disk_data, memory_data = None, None, None, None
+    if args.logfile:
+        sync_time, cpu_data = parse_cpu_log(args.logfile, cleanup=False)
+    if args.diskfile:
+        _, disk_data = parse_disk_log(args.diskfile, cleanup=False)
+    if args.memoryfile:
+        _, memory_data = parse_memory_log(args.memoryfile, cleanup=False)
+    chunks = []
+    if args.infile.exists():
+        chunks = (
+            (int(header.split()[1]) if header else 0, records, names)
+            for header, records, names in at.iterFile(args.infile)
+        )
+    write_trace(args.outfile, chunks, sync_time, cpu_data, disk_data, args.bytes, memory_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import numpy as np
+
+import mantidprofiler.algorithm_tree as at
+
+START_POINT = 1_700_000_000_000_000_000
+
+
+def write_timing(path, lines, newline="\n"):
+    header = "START_POINT: {} MAX_THREAD: 4".format(START_POINT)
+    path.write_bytes(newline.join([header] + lines + [""]).encode())
+
+
+def record(thread, name, start, finish):
+    return "ThreadID={}, AlgorithmName={}, StartTime={}, EndTime={}".format(thread, name, start, finish)
+
+
+def test_calls_nest_only_on_their_thread():
+    # Load contains Rebin on thread 1, Sum on thread 2 runs at the same time but is not its child
+    forest = at.Forest.from_arrays(
+        names=["Load", "Rebin", "Sum"],
+        name_id=[0, 1, 2, 1],
+        start=[0, 10, 20, 100],
+        finish=[50, 30, 40, 120],
+        thread_id=[1, 1, 2, 1],
+    )
+
+    calls = [(forest.names[name], int(start)) for name, start in zip(forest.name_id, forest.start)]
+    load = calls.index(("Load", 0))
+    rebin = calls.index(("Rebin", 10))
+    total = calls.index(("Sum", 20))
+    assert forest.parent[rebin] == load
+    assert forest.parent[load] == -1
+    assert forest.parent[total] == -1
+    assert forest.depth[rebin] == 1
+    assert forest.max_depth == 1
+    assert forest.size[load] == 2
+    assert forest.size[total] == 1
+    assert forest.child_sum(forest.duration)[load] == 20
+
+
+def test_size_counts_the_whole_subtree():
+    # A(B(C, D), E) and F
+    forest = at.Forest.from_arrays(
+        names=["A", "B", "C", "D", "E", "F"],
+        name_id=[0, 1, 2, 3, 4, 5],
+        start=[0, 1, 2, 4, 7, 20],
+        finish=[10, 6, 3, 5, 9, 30],
+        thread_id=[1] * 6,
+    )
+
+    size = dict(zip((forest.names[name] for name in forest.name_id), forest.size.tolist()))
+    assert size == {"A": 5, "B": 3, "C": 1, "D": 1, "E": 1, "F": 1}
+
+
+def test_parse_file(tmp_path):
+    timing = tmp_path / "algotimeregister.out"
+    write_timing(timing, [record(1, "Load", 100, 300), "not a record", record(2, "Rebin", 150, 200)], newline="\r\n")
+
+    header, records, names = at.parseFile(timing, cleanup=True)
+
+    assert header == "START_POINT: {} MAX_THREAD: 4".format(START_POINT)
+    assert [names[name_id] for name_id in records["name_id"]] == ["Load", "Rebin"]
+    assert records["thread_id"].tolist() == [1, 2]
+    assert records["start"].tolist() == [100, 150]
+    assert records["finish"].tolist() == [300, 200]
+    assert not timing.exists()
+
+
+def test_parse_file_across_chunks(tmp_path, monkeypatch):
+    timing = tmp_path / "algotimeregister.out"
+    lines = [record(i % 3, "Alg{}".format(i % 5), 10 * i, 10 * i + 5) for i in range(200)]
+    write_timing(timing, lines)
+    # records cut in the middle by the end of a chunk
+    monkeypatch.setattr(at, "_CHUNK_SIZE", 97)
+
+    _, records, names = at.parseFile(timing, cleanup=False)
+
+    assert len(records) == 200
+    assert records["start"].tolist() == [10 * i for i in range(200)]
+    assert [names[name_id] for name_id in records["name_id"][:6]] == ["Alg0", "Alg1", "Alg2", "Alg3", "Alg4", "Alg0"]
+    assert np.array_equal(records["thread_id"], np.arange(200) % 3)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from mantidprofiler.attribution import resource_statistics
+
+
+def test_resources_of_a_call():
+    times = np.arange(11.0)
+    cpu_data = np.zeros((11, 6))
+    cpu_data[:, 0] = times
+    cpu_data[:, 1] = np.where(times >= 5.0, 200.0, 0.0)
+    cpu_data[:, 2] = 100.0 + 10.0 * times  # real memory climbs by 10 MB/s
+    cpu_data[:, 4] = 3.0
+    disk_data = np.zeros((11, 7))
+    disk_data[:, 0] = times
+    disk_data[1:, 1] = 8.0e-3  # 1 MB/s read, in Gbps
+    disk_data[1:, 5] = 100.0  # read calls per second
+
+    stats = resource_statistics([5.0, 0.0], [9.0, 10.0], times, cpu_data, times, disk_data)
+
+    # the CPU is interpolated between the samples, it climbs from 0 to 200% between 4 and 5 s
+    assert stats["mean_cpu"] == pytest.approx([200.0, 110.0])
+    assert stats["max_cpu"].tolist() == [200.0, 200.0]
+    assert stats["peak_rss"].tolist() == [190.0, 200.0]
+    assert stats["delta_rss"] == pytest.approx([40.0, 100.0])
+    assert stats["read_bytes"] == pytest.approx([4.0e6, 1.0e7])
+    assert stats["write_bytes"] == pytest.approx([0.0, 0.0])
+    assert stats["read_ops"] == pytest.approx([400.0, 1000.0])
+    assert stats["mean_threads"] == pytest.approx([3.0, 3.0])
+
+
+def test_without_samples():
+    stats = resource_statistics([0.0], [1.0], np.zeros(0), np.zeros((0, 6)), np.zeros(0), np.zeros((0, 7)))
+
+    assert stats["peak_rss"].tolist() == [0.0]
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from mantidprofiler.bench import median_confidence_ranks, statistics
+
+
+@pytest.mark.parametrize(
+    ("num", "expected"),
+    [
+        (0, (0, 0, 0.0)),
+        # too few runs for 95%, the widest interval covers the median with 1 - 2 / 2**5
+        (5, (0, 4, 0.9375)),
+        (10, (1, 8, 1.0 - 2.0 * 11 / 1024)),
+    ],
+)
+def test_median_confidence_ranks(num, expected):
+    lo, hi, coverage = median_confidence_ranks(num)
+
+    assert (lo, hi) == expected[:2]
+    assert coverage == pytest.approx(expected[2])
+
+
+def test_statistics_of_every_column():
+    values = np.array([[float(run), 10.0 * run] for run in [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]])
+
+    result = statistics(values)
+
+    assert np.asarray(result["median"]) == pytest.approx([3.5, 35.0])
+    # second smallest and second largest of the 10 runs
+    assert np.asarray(result["ci_low"]) == pytest.approx([1.0, 10.0])
+    assert np.asarray(result["ci_high"]) == pytest.approx([6.0, 60.0])
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import time
+
+import psutil
+
+from mantidprofiler.children_util import ProcessTree
+
+# starts a grandchild and waits for it
+CHILD = "import subprocess, sys; subprocess.run([sys.executable, '-c', 'import time; time.sleep(30)'])"
+
+
+def wait_for_children(process, num):
+    deadline = time.monotonic() + 10.0
+    while len(process.children(recursive=True)) < num and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return process.children(recursive=True)
+
+
+def test_new_processes_are_added_between_scans():
+    # no full scan after the first update
+    tree = ProcessTree(psutil.Process(), rescan_interval=3600.0)
+    assert tree.update() == {}
+
+    child = subprocess.Popen([sys.executable, "-c", CHILD])
+    try:
+        descendants = wait_for_children(psutil.Process(), 2)
+        assert len(descendants) == 2
+        assert set(tree.update()) == {process.pid for process in descendants}
+
+        # the child reaps the grandchild and exits
+        for process in descendants:
+            if process.pid != child.pid:
+                process.kill()
+        child.wait(timeout=10.0)
+        assert tree.update() == {}
+    finally:
+        child.kill()
+        child.wait()
+
+    assert tree.num_scans == 1
@@ -0,0 +1,33 @@
+import numpy as np
+
+from mantidprofiler.decimate import bucket_means, minmax_indices
+
+
+def test_peaks_are_kept():
+    x = np.arange(10000) * 0.01
+    y = np.sin(x)
+    y[1234] = 50.0
+    y[8765] = -50.0
+
+    indices = minmax_indices(x, y, 100)
+
+    assert len(indices) <= 100
+    assert indices[0] == 0
+    assert indices[-1] == len(x) - 1
+    assert 1234 in indices
+    assert 8765 in indices
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_short_series_are_not_reduced():
+    assert minmax_indices([0.0, 1.0, 2.0], [3.0, 1.0, 2.0], 100).tolist() == [0, 1, 2]
+
+
+def test_bucket_means():
+    x = np.arange(8.0)
+    values = np.array([np.arange(8.0), np.ones(8)])
+
+    means_x, means = bucket_means(x, values, 4)
+
+    assert means_x.tolist() == [0.5, 2.5, 4.5, 6.5]
+    assert means.tolist() == [[0.5, 2.5, 4.5, 6.5], [1.0, 1.0, 1.0, 1.0]]
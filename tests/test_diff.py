@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+from mantidprofiler.diff import main
+from mantidprofiler.psrecord import CpuLog
+
+START = 1_700_000_000.0
+
+
+def write_run(directory, name, calls, rss):
+    """Timing file and CPU/memory log of a run with the ``(name, start, finish)`` calls, in seconds"""
+    timing = directory / "{}.out".format(name)
+    lines = ["START_POINT: {} MAX_THREAD: 4".format(int(START * 1.0e9))]
+    for algorithm, start, finish in calls:
+        lines.append(
+            "ThreadID=1, AlgorithmName={}, StartTime={}, EndTime={}".format(
+                algorithm, int(start * 1.0e9), int(finish * 1.0e9)
+            )
+        )
+    timing.write_text("\n".join(lines) + "\n")
+
+    log = directory / "{}.txt".format(name)
+    cpu_log = CpuLog(log, START)
+    for sample_time, real in zip(np.arange(len(rss)) * 0.5, rss):
+        cpu_log.write(START + sample_time, 100.0, real, 2.0 * real, [])
+    cpu_log.close()
+    return timing, log
+
+
+def test_diff_with_memory(tmp_path):
+    calls = [("Load", 0.0, 2.0), ("Rebin", 2.0, 3.0)]
+    base_timing, base_log = write_run(tmp_path, "base", calls, [100.0, 200.0, 300.0, 300.0, 300.0, 300.0, 300.0])
+    new_timing, new_log = write_run(tmp_path, "new", calls, [100.0, 400.0, 700.0, 700.0, 700.0, 700.0, 700.0])
+    changes = tmp_path / "changes.json"
+
+    main(
+        [
+            str(base_timing),
+            str(new_timing),
+            "--baselog",
+            str(base_log),
+            "--newlog",
+            str(new_log),
+            "--outfile",
+            str(tmp_path / "diff.html"),
+            "--json",
+            str(changes),
+        ]
+    )
+
+    result = json.loads(changes.read_text())
+    row = result["calls"]["call"].index("Load 1")
+    assert result["calls"]["base_peak_rss"][row] == pytest.approx(300.0)
+    assert result["calls"]["new_peak_rss"][row] == pytest.approx(700.0)
+    assert result["calls"]["rss_change"][row] == pytest.approx(400.0)
+    assert "new_peak_rss" in result["names"]
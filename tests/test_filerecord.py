@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from mantidprofiler.filerecord import MAX_READS, UNATTRIBUTED, FileSampler, available
+
+pytestmark = pytest.mark.skipif(not available(), reason="needs /proc/<pid>/fdinfo")
+
+
+def test_files_read_in_turns_keep_their_bytes(tmp_path):
+    # more files than offsets read per tick, so that every file is read every other tick
+    handles = [open(tmp_path / "file{}".format(i), "wb", buffering=0) for i in range(MAX_READS + 50)]
+    try:
+        sampler = FileSampler()
+        sampler.update([os.getpid()])
+        # the first reading of every offset is not counted
+        sampler.sample()
+        sampler.sample()
+
+        for handle in handles:
+            handle.write(b"x" * 1000)
+        written = 1000 * len(handles)
+        samples = [sampler.sample({os.getpid(): (0, written)}), sampler.sample({os.getpid(): (0, 0)})]
+    finally:
+        for handle in handles:
+            handle.close()
+
+    files = sum(change[1] for sample in samples for path, change in sample.items() if path.startswith(str(tmp_path)))
+    unattributed = sum(sample.get(UNATTRIBUTED, (0.0, 0.0))[1] for sample in samples)
+    assert files == pytest.approx(written)
+    assert unattributed == pytest.approx(0.0)
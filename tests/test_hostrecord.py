@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from mantidprofiler.hostrecord import contention_fill_factor
+
+
+def test_fill_factor_of_the_cores_left():
+    cpu_x = np.arange(5.0)
+    cpu = np.full(5, 200.0)
+    # other processes take 6 of the 8 cores, leaving 2 of the 4 threads of the workflow
+    host_x = np.array([0.0, 2.0, 4.0])
+    other_cpu = np.full(3, 600.0)
+
+    fill_factor, taken = contention_fill_factor(cpu_x, cpu, host_x, other_cpu, nthreads=4, num_cores=8)
+
+    assert fill_factor == pytest.approx(100.0)
+    assert taken == pytest.approx(6.0)
+
+
+def test_fill_factor_on_an_idle_node():
+    cpu_x = np.arange(5.0)
+    cpu = np.full(5, 200.0)
+
+    fill_factor, taken = contention_fill_factor(cpu_x, cpu, [0.0, 4.0], [0.0, 0.0], nthreads=4, num_cores=8)
+
+    assert fill_factor == pytest.approx(50.0)
+    assert taken == pytest.approx(0.0)
@@ -0,0 +1,43 @@
+import pytest
+
+import mantidprofiler.algorithm_tree as at
+from mantidprofiler.hotspots import hotspots
+
+
+def test_recursive_calls_count_once():
+    # Load calls itself, and then Rebin
+    forest = at.Forest.from_arrays(
+        names=["Load", "Rebin"],
+        name_id=[0, 0, 1],
+        start=[0, 1_000_000_000, 6_000_000_000],
+        finish=[10_000_000_000, 5_000_000_000, 8_000_000_000],
+        thread_id=[1, 1, 1],
+    )
+
+    table = hotspots(forest, 10.0)
+
+    row = list(table["name"]).index("Load")
+    assert table["count"][row] == 2
+    assert table["total"][row] == pytest.approx(10.0)
+    assert table["self"][row] == pytest.approx(8.0)
+    assert table["max"][row] == pytest.approx(10.0)
+    assert table["wall_share"][row] == pytest.approx(100.0)
+
+
+def test_calls_are_clipped_to_the_window():
+    # Load started 6 s before the monitoring
+    forest = at.Forest.from_arrays(
+        names=["Load", "Rebin"],
+        name_id=[0, 1],
+        start=[0, 5_000_000_000],
+        finish=[10_000_000_000, 9_000_000_000],
+        thread_id=[1, 1],
+    )
+
+    table = hotspots(forest, 4.0, (6_000_000_000, 10_000_000_000))
+
+    load = list(table["name"]).index("Load")
+    assert table["total"][load] == pytest.approx(4.0)
+    assert table["self"][load] == pytest.approx(1.0)
+    assert table["max"][load] == pytest.approx(10.0)
+    assert table["wall_share"][load] == pytest.approx(100.0)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from mantidprofiler.procfs import pthread
+from mantidprofiler.psrecord import CpuLog, parse_log, thread_activity, thread_utilization
+
+START = 1_700_000_000.0
+
+
+def test_thread_activity():
+    # thread 1 runs in every sample, thread 2 is idle after its first sample, thread 3 starts in the last one
+    sample = [0, 0, 1, 1, 2, 2, 2]
+    tid = [1, 2, 1, 2, 1, 2, 3]
+    user_time = [1.0, 0.5, 2.0, 0.5, 3.0, 0.5, 0.0]
+    system_time = [0.0] * 7
+
+    active, total = thread_activity(sample, tid, user_time, system_time, 4)
+
+    assert active.tolist() == [2, 1, 2, 0]
+    assert total.tolist() == [2, 2, 3, 0]
+
+
+def test_idle_threads_share_a_row():
+    times = np.arange(4.0)
+    # thread 7 uses half a core in sample 2, threads 8 and 9 a few percent
+    sample = [1, 2, 1, 3]
+    tid = [7, 7, 8, 9]
+    cpu_time = [0.1, 0.5, 0.02, 0.03]
+    previous = [0, 1, 0, 2]
+
+    labels, utilization = thread_utilization(sample, tid, cpu_time, previous, times, min_peak=10.0)
+
+    assert labels == ["7", "idle (2)"]
+    assert utilization[0] == pytest.approx([0.0, 10.0, 50.0, 0.0])
+    assert utilization[1] == pytest.approx([0.0, 2.0, 0.0, 3.0])
+
+
+@pytest.mark.parametrize("log_format", ["text", "binary"])
+def test_parse_log_threads(tmp_path, log_format):
+    log = tmp_path / "cpu.txt"
+    with CpuLog(log, START, log_format) as cpu_log:
+        for sample_time, user_time in zip([0.0, 1.0, 2.0], [0.0, 0.5, 0.5]):
+            threads = [pthread(11, user_time, 0.0), pthread(12, 0.01 * sample_time, 0.0)]
+            cpu_log.write(START + sample_time, 50.0, 100.0, 200.0, threads)
+
+    start_time, data, (labels, utilization) = parse_log(log, cleanup=True, threads=True)
+
+    assert start_time == START
+    assert data[:, 2].tolist() == [100.0, 100.0, 100.0]
+    # active and total threads
+    assert data[:, 4].tolist() == [2, 2, 1]
+    assert data[:, 5].tolist() == [2, 2, 2]
+    assert labels == ["11", "idle (1)"]
+    assert utilization[0] == pytest.approx([0.0, 50.0, 0.0])
+    assert not log.exists()